@@ -61,6 +61,8 @@ You can use a config file in the following format::
     size=1MB
     pattern=*.m4v
     delete=True
+    exclude-dir=.git
+        .snapshot
 
 
 You can call the config file anything and place it anywhere.
@@ -69,15 +71,245 @@ Here is an example usage::
 
     ./liten.py --config=myconfig.ini
 
+Filters:
+~~~~~~~~~~~~~~~~~~~~~~
+Files can be selected with --include and --exclude, and directories left
+out of the walk with --exclude-dir, each may be given many times. Globs
+without '/' match names, others whole paths, and patterns starting with
+'re:' are regular expressions searched for in paths. All patterns are
+compiled once, excluded directories are never read::
+
+    ./liten.py --include='*.iso' --include='re:\.m4[av]$' \
+               --exclude-dir=.git --exclude-dir=node_modules /mnt/raid
+
+The same include, exclude and exclude-dir options, one pattern per line,
+can be used in config file.
+
+Partial Checksum:
+~~~~~~~~~~~~~~~~~~~~~~
+Before computing full checksum of files with equal size, first and last
+blocks of them are compared. Block size is set with --partial-size, value
+0 disables this stage::
+
+    ./liten.py --partial-size=64KB /mnt/media
+
+The report shows how many bytes were never read because files were told
+apart by their partial checksums.
+
+Parallel Hashing:
+~~~~~~~~~~~~~~~~~~~~~~
+Checksums can be computed by a pool of threads with --jobs, while the
+directory walk goes on. Found duplicates are the same as with one job::
+
+    ./liten.py --jobs=8 /mnt/raid
+
+Directories can be read by a pool of threads too with --walk-jobs. This
+helps on trees with millions of small directories, but files are visited
+level by level, not in os.walk() order::
+
+    ./liten.py --walk-jobs=16 /mnt/raid
+
+Network Filesystems:
+~~~~~~~~~~~~~~~~~~~~~~
+On NFS or SMB every stat and open is a round trip to the server. With
+--concurrency N directories are read, files stat'ed and checksums made by
+pools of N threads, up to 4 * N directories ahead of the search, while
+files are still considered in the order of a plain walk, so the same
+duplicates are found::
+
+    ./liten.py --concurrency=256 /mnt/nfs
+
+Hard Links:
+~~~~~~~~~~~~~~~~~~~~~~
+Paths that are hard links to the same file are read once and never
+reported as duplicates of each other. They are listed at the end of the
+report after "Hardlinks:" line. Wasted space counts a file with several
+links only when all of them were found in search paths, since removing
+some of its links frees nothing.
+
+Checksum Algorithm:
+~~~~~~~~~~~~~~~~~~~~~~
+md5 is used by default. Other algorithm can be chosen with --hash, among
+md5, sha1, blake2b and fast non-cryptographic hashes from xxhash or blake3
+modules when they are installed. Algorithm is written to report together
+with every checksum and to checksum cache. To see how fast they are on the
+local machine, run::
+
+    ./liten.py --bench-hash
+    ./liten.py --hash=xxh64 /mnt/raid
+
+Reading Files:
+~~~~~~~~~~~~~~~~~~~~~~
+Files are read through one reusable buffer of --block-size bytes (1MB by
+default, 1MB-16MB works best for large files). With --read-mode=mmap files
+are mapped to memory instead. Speed of modes and block sizes for a given
+file, with cold and warm page cache, is shown by --bench-io::
+
+    ./liten.py --bench-io=/mnt/raid/disk.img
+    ./liten.py --block-size=8MB --read-mode=mmap /mnt/raid
+
+Memory:
+~~~~~~~~~~~~~~~~~~~~~~
+Every tracked file is kept as compact FileRecord. Memory used per file,
+compared to dict records of earlier versions, is shown by::
+
+    ./liten.py --bench-memory
+
+Byte Comparison:
+~~~~~~~~~~~~~~~~~~~~~~
+With --compare=bytes files of the same size are read side by side and
+compared directly, without checksums, which stops reading as soon as
+they differ. Only groups of up to --compare-limit files (8 by default) are
+compared, to bound open files, larger groups are still hashed. This
+implies --engine=grouped::
+
+    ./liten.py --compare=bytes --compare-limit=4 /mnt/raid
+
+Search Engine:
+~~~~~~~~~~~~~~~~~~~~~~
+By default files are compared with earlier files of the same size while
+the tree is walked. With --engine=grouped the whole tree is indexed by size
+first, and then only files sharing their size with others are read, in
+inode order. Report then lists every group of duplicates once::
+
+    ./liten.py --engine=grouped /mnt/raid
+
+Checksum Cache:
+~~~~~~~~~~~~~~~~~~~~~~
+Checksums can be kept between runs in a SQLite database using --cache.
+Files whose device, inode, size and modification time did not change since
+the previous run are not read again::
+
+    ./liten.py --cache=/var/cache/liten.db /mnt/raid
+
+Entries for files that have disappeared or changed are evicted with
+--cache-vacuum, either after a search or on its own::
+
+    ./liten.py --cache=/var/cache/liten.db --cache-vacuum
+
+Sharding:
+~~~~~~~~~~~~~~~~~~~~~~
+A search can be split between processes or machines with --shard i/N, for
+i from 0 to N-1. Each shard walks the whole tree but hashes only files
+whose size modulo N is i, so duplicates never span shards. Shards write an
+index of size, partial and full checksum and path of files and of the hard
+links they found (--index), and "liten merge" makes the report from indexes
+of all shards without reading any file::
+
+    ./liten.py --shard 0/2 --index /shared/liten-0.idx /mnt/raid
+    ./liten.py --shard 1/2 --index /shared/liten-1.idx /mnt/raid
+    ./liten.py merge --report=/tmp/dups.csv /shared/liten-*.idx
+
+Catalog:
+~~~~~~~~~~~~~~~~~~~~~~
+--catalog keeps path, size, inode, mtime and checksums of every searched
+file in a SQLite database, replacing rows of earlier searches of the same
+paths. "liten query" answers duplicate questions from it without walking
+the tree again, i.e. the ten biggest duplicate groups under one directory.
+The catalog needs checksums, so it can't be used with --compare=bytes::
+
+    ./liten.py --size=1KB --catalog=/var/lib/liten.db /data
+    ./liten.py query --under=/data/x --top=10 /var/lib/liten.db
+
+Read Order:
+~~~~~~~~~~~~~~~~~~~~~~
+The grouped engine (and --estimate) collects files to hash before reading
+any of them, and reads them in --read-order: by inode number by default,
+which follows placement on disk on most filesystems, or by physical offset
+of their first extent with --read-order=physical, from FIEMAP ioctl where
+Linux filesystems support it. Files written too recently to have a place
+on disk yet are read after the others. On spinning disks this turns random
+seeks into sweeps across the disk::
+
+    ./liten.py --engine=grouped --read-order=physical /mnt/archive
+
+Production Disks:
+~~~~~~~~~~~~~~~~~~~~~~
+On busy hosts a search can be kept from hurting other programs.
+--max-read-rate caps bytes read from files per second, --max-iops caps
+directory listings and stat calls per second. --page-cache=drop reads files
+with POSIX_FADV_SEQUENTIAL advice and drops their pages from page cache
+with POSIX_FADV_DONTNEED once digested, so cold data doesn't evict hot
+pages. The limits hold for --estimate and --block-dedup as well, whose
+worker processes share the read rate. Seconds spent waiting for the
+limits are shown in summary and --stats-json::
+
+    ./liten.py --max-read-rate=20MB --max-iops=500 --page-cache=drop /srv
+
+Checkpoint:
+~~~~~~~~~~~~~~~~~~~~~~
+--checkpoint PATH journals progress of a search: every directory listed
+and every checksum made is appended to PATH, which is synced to disk every
+--checkpoint-interval seconds and removed when the search completes. A
+search killed before can be continued with --resume and the same options.
+Directories and files in the journal are not read again::
+
+    ./liten.py --checkpoint=/var/tmp/raid.journal /mnt/raid
+    ./liten.py --checkpoint=/var/tmp/raid.journal --resume /mnt/raid
+
+Estimate:
+~~~~~~~~~~~~~~~~~~~~~~
+--estimate tells roughly how much space duplicates waste in a fraction of
+the time of a search. The whole tree is walked, but only --sample-size
+groups of equally sized files drawn at random, and the few groups big
+enough to sway the total, are read, partial checksums first as in a search.
+Estimated wasted bytes are printed with a --confidence interval::
+
+    ./liten.py --estimate --size=1KB --sample-size=500 /mnt/raid
+
+Block Dedup:
+~~~~~~~~~~~~~~~~~~~~~~
+Files that share most of their content, like VM images, database dumps or
+log archives, are never duplicates by checksum. --block-dedup estimates
+what block level deduplication would save instead: files are cut into
+content defined chunks of about --chunk-size bytes, chunks are counted in
+a temporary SQLite index and bytes of repeated chunks are reported for
+every directory. Files are chunked by --processes worker processes, which
+find chunk boundaries several times faster where numpy is installed::
+
+    ./liten.py --block-dedup --size=1MB --report=/tmp/savings.csv /vm
+
+Statistics:
+~~~~~~~~~~~~~~~~~~~~~~
+Counters of files scanned, hashed and compared, bytes read, cache hits and
+errors, and seconds spent walking directories, in stat, filtering, hashing
+and writing report are kept in Liten.stats. --stats-json writes them to a
+file after the search::
+
+    ./liten.py --stats-json=/var/log/liten-stats.json /mnt/raid
+
 Verbosity:
 ~~~~~~~~~~~~~~~~~~~~~~
 Screen output can be suppressed by using --quiet or -q.
 
+Duplicates are listed in the report only. While searching, a progress line
+with files scanned, bytes read, throughput and estimated time left is
+written to stderr every second, or every --progress-interval seconds, 0
+turns it off::
+
+    ./liten.py --progress-interval=10 /mnt/raid 2> progress.log
+
+Watch:
+~~~~~~~~~~~~~~~~~~~~~~
+"liten watch" scans directories once and then keeps its index up to date
+from inotify events, or by polling every --interval seconds where inotify
+isn't available. Only files created or modified are read, and every new
+duplicate is printed as soon as it is written::
+
+    ./liten.py watch --size=1KB /srv/uploads
+
 Delete:
 ~~~~~~~~~~~~~~~~~~~~~~
 By using --delete the duplicate files will be automatically deleted. The API
-has support for an interactive mode and a dry-run mode, they have not been
-implemented in the CLI as of yet.
+has support for an interactive mode, it has not been implemented in the CLI
+as of yet.
+
+Deletions are queued by ActionsQueued and done after the search, by
+--action-jobs threads, and only for files unchanged since they were read
+whose kept original is unchanged as well.
+--dry-run shows how many files and bytes would be deleted::
+
+    ./liten.py --delete --dry-run /mnt/raid
 
 Example Library/API Usage:
 ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -98,6 +330,16 @@ There is also the concept of an Action, which can be implemented later, that
 will allow customizable actions to occur upon an a condition that gets
 defined as you walk down a tree of files.
 
+Streaming API:
+~~~~~~~~~~~~~~~~~~~~~~
+Liten.iterDuplicates() yields every duplicate as soon as it is found, so
+callers can act on them while search goes on::
+
+    >>> liten = Liten(spath='tests', fileSize='45bytes', verbose=False)
+    >>> for match in liten.iterDuplicates():
+    ...     print(match.size)
+    45
+
 Tests:
 ~~~~~~~~~~~~~~~~~~~~~~
  * Run doctests:  ./liten -t or --test
@@ -110,20 +352,35 @@ Display Options:
 
 Stdout:
 ~~~~~~~~~~~~~~~~~~~~~~
-stdout will show you duplicate file paths and sizes such as::
+stdout shows what is searched for and, once search is done, a summary of
+it; duplicate paths are written to the report only::
 
-    Printing dups over 1 MB using md5 checksum: [SIZE] [ORIG] [DUP]
-    7 MB  Orig:  /Users/ngift/Downloads/bzr-0-2.17.tar
-    Dupe:  /Users/ngift/Downloads/bzr-0-4.17.tar
+    Searching for dups over 1 MB using md5 checksum
+
+    LITEN REPORT:
+    ('Search Path:                 ', ['/Users/ngift/Downloads'])
+    ('Total Files Searched:        ', 4)
+    ('Wasted Space in Duplicates:  ', 3, ' MB')
+    ('Bytes Read:                  ', 6024576)
+    ('Report Generated at:         ', 'LitenDuplicateReport.csv')
+    ('Search Time:                 ', '0.01 seconds')
+
+The summary also has pattern, checksum algorithm, hard links, bytes never
+read and seconds of every stage. Progress line is written to stderr while
+searching, with a last one when search ends::
+
+    4 files scanned, 3 hashed, 5.7 MB read, 506.6 MB/s
+
+--quiet turns off both.
 
 Report:
 ~~~~~~~~~~~~~~~~~~~~~~
 By default report LitenDuplicateReport.csv is created in your current
 working directory. It is tab separated CSV file::
 
-  Path  Size    ModDate
-  /Users/ngift/Downloads/bzr-0-2.17.tar 7 MB    07/10/2007 01:43:12 AM
-  /Users/ngift/Downloads/bzr-0-3.17.tar 7 MB    07/10/2007 01:43:27 AM
+  Path  Size    ModDate Checksum
+  /Users/ngift/Downloads/bzr-0-2.17.tar 7 MB    07/10/2007 01:43:12 AM  md5:9e10...
+  /Users/ngift/Downloads/bzr-0-3.17.tar 7 MB    07/10/2007 01:43:27 AM  md5:9e10...
 
 
 Debug Mode Environmental Variables:
@@ -140,16 +397,73 @@ QUESTIONS:  noah dot gift at gmail.com
 
 import os
 import datetime
+import errno
 import re
 import sys
 import csv
+import io
+import json
+import math
+import mmap
 import time
 import optparse
+import select
+import struct
 import hashlib
+import binascii
 import pdb
+import random
+import stat
+import sqlite3
+import tempfile
+import threading
 import ConfigParser
-from itertools import chain
-from fnmatch import fnmatch
+import Queue
+import multiprocessing
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+from fnmatch import translate
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#: checksum algorithm name -> hashlib compatible constructor, optional fast
+#: hashes are registered when their modules are installed
+HASH_ALGORITHMS = {'md5': hashlib.md5,
+                   'sha1': hashlib.sha1}
+if hasattr(hashlib, 'blake2b'):
+    HASH_ALGORITHMS['blake2b'] = hashlib.blake2b
+else:
+    try:
+        import pyblake2
+        HASH_ALGORITHMS['blake2b'] = pyblake2.blake2b
+    except ImportError:
+        pass
+try:
+    import xxhash
+    HASH_ALGORITHMS['xxh64'] = xxhash.xxh64
+    if hasattr(xxhash, 'xxh3_128'):
+        HASH_ALGORITHMS['xxh128'] = xxhash.xxh3_128
+except ImportError:
+    pass
+try:
+    import blake3
+    HASH_ALGORITHMS['blake3'] = blake3.blake3
+except ImportError:
+    pass
 
 #Liten Debug Mode
 #Environmental Variable Options:
@@ -165,17 +479,244 @@ if __debug__:
         print(("%s pdb Mode" % MESSAGE))
 
 
+#: clock of stage timers, the most precise one available
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class ScanStats(object):
+    """
+    Counters and stage timers of one search, kept by Liten as stats.
+    Timers sum seconds spent in each of STAGES: reading directories (walk),
+    stat of files (stat), size and pattern checks (filter), reading files
+    for checksums and comparison (hash), writing report and calling
+    actions (report). Time of worker threads is summed too, so stages may
+    add up to more than elapsed time. Seconds reads and metadata calls
+    were held back by rate limits are counted too.
+
+    >>> stats = ScanStats()
+    >>> stats.add('bytesRead', 4096)
+    >>> with stats.timer('hash'):
+    ...     pass
+    >>> stats.asDict()['bytesRead']
+    4096
+    """
+    STAGES = ('walk', 'stat', 'filter', 'hash', 'report')
+    COUNTERS = ('dirsScanned', 'filesScanned', 'filesMatched', 'filesHashed',
+                'partialsHashed', 'filesCompared', 'bytesRead', 'bytesExpected',
+                'cacheHits', 'cacheMisses', 'errors', 'duplicates', 'wastedBytes',
+                'readThrottleSeconds', 'metadataThrottleSeconds')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.finished = None
+        #: stage -> seconds
+        self.seconds = dict.fromkeys(self.STAGES, 0.0)
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+
+    def add(self, name, value=1):
+        """adds value to counter, safe to call from worker threads"""
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def addTime(self, stage, seconds):
+        """adds seconds to stage timer, safe to call from worker threads"""
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    @contextmanager
+    def timer(self, stage):
+        """times block of code as part of stage"""
+        started = _clock()
+        try:
+            yield
+        finally:
+            self.addTime(stage, _clock() - started)
+
+    def finish(self):
+        """marks end of search"""
+        self.finished = time.time()
+
+    @property
+    def elapsed(self):
+        """seconds from start to end of search, or until now while it runs"""
+        return (self.finished or time.time()) - self.started
+
+    def asDict(self):
+        """returns counters, stage seconds and elapsed time as plain dict"""
+        data = dict((name, getattr(self, name)) for name in self.COUNTERS)
+        data['stages'] = dict(self.seconds)
+        data['elapsed'] = self.elapsed
+        data['started'] = datetime.datetime.fromtimestamp(self.started).isoformat()
+        return data
+
+    def write(self, path):
+        """writes asDict() to path as JSON"""
+        f = open(path, 'w')
+        try:
+            json.dump(self.asDict(), f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+
+def _formatBytes(count):
+    """
+    Formats byte count for humans.
+
+    >>> _formatBytes(512), _formatBytes(3 * 1048576 / 2)
+    ('512 B', '1.5 MB')
+    """
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024:
+            break
+        count /= 1024.0
+    else:
+        unit = 'TB'
+    if unit == 'B':
+        return "%d B" % count
+    return "%.1f %s" % (count, unit)
+
+
+class TokenBucket(object):
+    """
+    Limits rate of reads or metadata calls to rate units per second, for
+    all threads sharing the bucket. Bucket holds up to burst units, one
+    second's worth by default. consume() takes units out and sleeps until
+    the bucket would have refilled, so the rate holds over any period
+    longer than burst. Seconds slept are summed in throttled and added to
+    counter of ScanStats stats, when set.
+
+    >>> bucket = TokenBucket(1000)
+    >>> bucket.consume(1000)
+    0
+    >>> 0.4 < bucket.consume(500) <= 0.5
+    True
+    """
+
+    def __init__(self, rate, burst=None, stats=None, counter=None):
+        if rate <= 0:
+            raise ValueError("rate limit must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = _clock()
+        self.throttled = 0.0
+        self.stats = stats
+        self.counter = counter
+        self._lock = threading.Lock()
+
+    def consume(self, amount=1):
+        """takes amount units, returns seconds slept to keep the rate"""
+        with self._lock:
+            now = _clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = 0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+                self.throttled += wait
+        if wait:
+            if self.stats is not None:
+                self.stats.add(self.counter, wait)
+            time.sleep(wait)
+        return wait
+
+
+class ProgressReporter(object):
+    """
+    Shows progress of a search of liten on stream, stderr by default, every
+    interval seconds: files scanned, bytes hashed, throughput and estimated
+    time left. It runs in a thread of its own and only reads counters of
+    Liten.stats, so the search does no extra work for it. Time left is
+    known once bytes to read are, which is after the walk of grouped engine.
+    """
+
+    def __init__(self, liten, interval=1.0, stream=None):
+        self.liten = liten
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self._stop = threading.Event()
+        self._thread = None
+        self._width = 0
+
+    def line(self):
+        """returns progress line for current state of liten.stats"""
+        stats = self.liten.stats
+        elapsed = max(stats.elapsed, 1e-9)
+        rate = stats.bytesRead / elapsed
+        text = "%d files scanned, %d hashed, %s read, %s/s" % (
+            self.liten.recordCount, stats.filesHashed + stats.filesCompared,
+            _formatBytes(stats.bytesRead), _formatBytes(rate))
+        if stats.bytesExpected and rate:
+            left = max(stats.bytesExpected - stats.bytesRead, 0) / rate
+            text += ", ETA %d:%02d" % divmod(int(left), 60)
+        throttled = stats.readThrottleSeconds + stats.metadataThrottleSeconds
+        if throttled:
+            text += ", throttled %ds" % throttled
+        return text
+
+    def _write(self, end=''):
+        text = self.line()
+        if self.stream.isatty():
+            self.stream.write('\r' + text.ljust(self._width) + end)
+            self._width = len(text)
+        else:
+            self.stream.write(text + '\n')
+        self.stream.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def start(self):
+        """starts showing progress"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='liten-progress')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """stops showing progress, after a final line"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._write('\n')
+
+
 class ActionsMixin(object):
     """Subclassable API. Callbacks that Liten calls for actions, i.e. remove()
 
        Default class does nothing.
     """
 
+    #: keeps lines printed by actions of several threads whole
+    outputLock = threading.Lock()
+
     def remove(self, filep, interactive=False, dryrun=False):
         """action to take when file is requested to be removed
         """
         pass
 
+    def schedule(self, filep, st=None, original=None, originalSt=None):
+        """called by Liten for every duplicate to remove, with its stat
+        result or FileRecord st from the search, and path and stat of the
+        original that is kept; default calls remove() now
+        """
+        return self.remove(filep)
+
+    def output(self, message):
+        """prints message of an action under outputLock"""
+        with self.outputLock:
+            print(message)
+
+    def flush(self):
+        """called by Liten at the end of search, after last schedule()"""
+        pass
+
 class ActionsAutomatic(ActionsMixin):
     """Process automatically, i.e. remove files"""
 
@@ -185,14 +726,14 @@ class ActionsAutomatic(ActionsMixin):
 
         #simulation mode for deletion
         if dryrun:
-            print(("Dry Run:  %s [NOT DELETED]" % filep))
+            self.output("Dry Run:  %s [NOT DELETED]" % filep)
             return None
         else:
-            print(("DELETING:  %s" % filep))
+            self.output("DELETING:  %s" % filep)
             try:
                 status = os.remove(filep)
             except IOError as err:
-                print(err)
+                self.output(err)
                 return status
 
 class ActionsInteractive(ActionsMixin):
@@ -217,25 +758,448 @@ class ActionsInteractive(ActionsMixin):
                 print(("Skipping:  %s" % filep))
                 return None
 
+class ActionsQueued(ActionsMixin):
+    """Collects duplicates Liten schedules for removal during search and
+       passes them to remove() of handler, ActionsAutomatic by default,
+       later on flush(): in batches of batchSize paths, by jobs threads.
+       With background=True a worker thread executes full batches while
+       the search goes on.
+
+       Stat of each file, and of the original kept in its place, is kept
+       when it's scheduled, and right before acting both are stat'ed
+       again: files that changed or are gone, or whose original changed or
+       is gone, are skipped. With dryrun=True nothing is done, flush()
+       prints what would be.
+    """
+
+    def __init__(self, handler=None, batchSize=100, jobs=1, dryrun=False,
+                 background=False, verbose=True):
+        if handler is None:
+            handler = ActionsAutomatic()
+        self.handler = handler
+        self.batchSize = batchSize
+        self.jobs = jobs
+        self.dryrun = dryrun
+        self.verbose = verbose
+        #: counts of queued, done, changed, missing and failed actions, of
+        #: actions skipped because original changed, and bytes of files done
+        self.summary = dict.fromkeys(('queued', 'done', 'changed', 'missing',
+                                      'original', 'failed', 'bytes'), 0)
+        self._batch = []
+        self._lock = threading.Lock()
+        self._queue = None
+        self._worker = None
+        if background:
+            self._queue = Queue.Queue()
+            self._worker = threading.Thread(target=self._work, name='liten-actions')
+            self._worker.daemon = True
+            self._worker.start()
+
+    @staticmethod
+    def _snapshot(st):
+        return (st.st_dev, st.st_ino, st.st_size, _mtimeNs(st))
+
+    def remove(self, filep, interactive=False, dryrun=False):
+        """queues removal of filep, stat'ed now"""
+        try:
+            st = os.stat(filep)
+        except OSError:
+            self._count('missing')
+            return None
+        return self.schedule(filep, st)
+
+    def schedule(self, filep, st=None, original=None, originalSt=None):
+        """
+        queues removal of filep, unless it differs from st when done, or
+        original differs from originalSt
+        """
+        if st is None:
+            return self.remove(filep)
+        self._count('queued')
+        if original is not None and originalSt is None:
+            try:
+                originalSt = os.stat(original)
+            except OSError:
+                self._count('original')
+                return None
+        if original is not None:
+            originalSt = self._snapshot(originalSt)
+        self._batch.append((filep, self._snapshot(st), original, originalSt))
+        if len(self._batch) >= self.batchSize and self._queue is not None:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.summary[key] += value
+
+    def _act(self, item):
+        """re-checks file and its original, removes file unless one changed"""
+        filep, snapshot, original, originalSnapshot = item
+        try:
+            st = os.stat(filep)
+        except OSError:
+            self._count('missing')
+            return
+        if self._snapshot(st) != snapshot:
+            self._count('changed')
+            return
+        if original is not None:
+            try:
+                originalSt = os.stat(original)
+            except OSError:
+                originalSt = None
+            if originalSt is None or self._snapshot(originalSt) != originalSnapshot:
+                self._count('original')
+                if self.verbose:
+                    self.output("Skipping:  %s, original %s changed or is gone" %
+                                (filep, original))
+                return
+        if not self.dryrun:
+            try:
+                self.handler.remove(filep)
+            except EnvironmentError as err:
+                self.output(err)
+                self._count('failed')
+                return
+        self._count('done')
+        self._count('bytes', st.st_size)
+
+    def _execute(self, batch):
+        if self.jobs > 1:
+            pool = ThreadPool(self.jobs)
+            try:
+                pool.map(self._act, batch)
+            finally:
+                pool.terminate()
+        else:
+            for item in batch:
+                self._act(item)
+
+    def _work(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            self._execute(batch)
+
+    def flush(self):
+        """executes all queued actions, returns summary"""
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+        batch, self._batch = self._batch, []
+        for start in range(0, len(batch), self.batchSize):
+            self._execute(batch[start:start + self.batchSize])
+        if self.verbose or self.dryrun:
+            self.printSummary()
+        return self.summary
+
+    def printSummary(self):
+        """prints counts of actions"""
+        if self.dryrun:
+            print(("Dry Run: %(done)s files, %(bytes)s bytes would be removed" %
+                   self.summary))
+        else:
+            print(("Removed %(done)s files, %(bytes)s bytes" % self.summary))
+        print(("Skipped %(changed)s changed and %(missing)s missing files, "
+               "%(original)s with changed originals, %(failed)s failed" %
+               self.summary))
+
+
+def _loadFadvise():
+    """returns posix_fadvise(fd, offset, length, advice) function or None"""
+    if hasattr(os, 'posix_fadvise'):
+        return os.posix_fadvise
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        func = libc.posix_fadvise
+    except (OSError, AttributeError, TypeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_int]
+
+    def fadvise(fd, offset, length, advice):
+        error = func(fd, offset, length, advice)
+        if error:
+            raise OSError(error, os.strerror(error))
+    return fadvise
+
+posix_fadvise = _loadFadvise()
+POSIX_FADV_SEQUENTIAL = getattr(os, 'POSIX_FADV_SEQUENTIAL', 2)
+POSIX_FADV_DONTNEED = getattr(os, 'POSIX_FADV_DONTNEED', 4)
+
+try:
+    _mmapSlice = buffer
+except NameError:
+    def _mmapSlice(mm, offset, size):
+        return memoryview(mm)[offset:offset + size]
+
+
+class ChecksumReader(object):
+    """
+    Feeds file contents to checksum objects without allocating memory for
+    every block read. In 'read' mode a preallocated buffer is filled with
+    readinto(), in 'mmap' mode file is mapped to memory and digested in
+    blockSize slices. Buffers are kept per thread, so one reader may be
+    shared by worker pool.
+
+    Reads are held to rate of TokenBucket limiter, if any. With pageCache
+    set to 'drop' files are read with POSIX_FADV_SEQUENTIAL advice and
+    their pages are dropped from page cache with POSIX_FADV_DONTNEED as
+    soon as they are digested, so a search doesn't evict pages other
+    programs need. Pages of files other programs have cached are dropped
+    too.
+
+    >>> import hashlib
+    >>> checksum = hashlib.md5()
+    >>> ChecksumReader(4096, 'mmap').update(checksum, 'tests/data/testDocOne.txt')
+    45
+    """
+    MODES = ('read', 'mmap')
+    PAGE_CACHE_MODES = ('keep', 'drop')
+
+    def __init__(self, blockSize=1048576, mode='read', limiter=None, pageCache='keep'):
+        if mode not in self.MODES:
+            raise ValueError("unknown read mode: %s" % mode)
+        if pageCache not in self.PAGE_CACHE_MODES:
+            raise ValueError("unknown page cache mode: %s" % pageCache)
+        self.blockSize = blockSize
+        self.mode = mode
+        self.limiter = limiter
+        self.pageCache = pageCache
+        self._local = threading.local()
+
+    def throttle(self, count):
+        """waits until count bytes read fit in rate of limiter, if any"""
+        if self.limiter is not None:
+            self.limiter.consume(count)
+
+    def _advise(self, fd, offset, length, advice):
+        if self.pageCache == 'drop' and posix_fadvise is not None:
+            try:
+                posix_fadvise(fd, offset, length, advice)
+            except OSError:
+                pass
+
+    def release(self, fp):
+        """drops pages of open file fp from page cache in 'drop' mode"""
+        if not fp.closed:
+            self._advise(fp.fileno(), 0, 0, POSIX_FADV_DONTNEED)
+
+    def _view(self):
+        """returns memoryview of this thread's buffer"""
+        view = getattr(self._local, 'view', None)
+        if view is None:
+            view = self._local.view = memoryview(bytearray(self.blockSize))
+        return view
+
+    def update(self, checksum, path):
+        """feeds contents of file at path to checksum, returns bytes read"""
+        fp = io.open(path, 'rb', buffering=0)
+        try:
+            fd = fp.fileno()
+            self._advise(fd, 0, 0, POSIX_FADV_SEQUENTIAL)
+            if self.mode == 'mmap':
+                size = os.fstat(fd).st_size
+                if size:
+                    return self._updateMmap(checksum, fd, size)
+            view = self._view()
+            total = 0
+            while True:
+                count = fp.readinto(view)
+                if not count:
+                    break
+                self.throttle(count)
+                checksum.update(view[:count])
+                self._advise(fd, total, count, POSIX_FADV_DONTNEED)
+                total += count
+            return total
+        finally:
+            self.release(fp)
+            fp.close()
+
+    def read(self, path, offset=0, length=None):
+        """
+        returns bytearray of up to length bytes of file at path from offset
+        on, to end of file if length is None, read in blockSize blocks like
+        update() does in 'read' mode
+        """
+        fp = io.open(path, 'rb', buffering=0)
+        try:
+            fd = fp.fileno()
+            self._advise(fd, 0, 0, POSIX_FADV_SEQUENTIAL)
+            if length is None:
+                length = max(os.fstat(fd).st_size - offset, 0)
+            data = bytearray(length)
+            view = memoryview(data)
+            fp.seek(offset)
+            total = 0
+            while total < length:
+                count = fp.readinto(view[total:total + self.blockSize])
+                if not count:
+                    break
+                self.throttle(count)
+                self._advise(fd, offset + total, count, POSIX_FADV_DONTNEED)
+                total += count
+            del view
+            del data[total:]
+            return data
+        finally:
+            self.release(fp)
+            fp.close()
+
+    def _updateMmap(self, checksum, fd, size):
+        mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        try:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            for offset in range(0, size, self.blockSize):
+                self.throttle(min(self.blockSize, size - offset))
+                checksum.update(_mmapSlice(mm, offset, self.blockSize))
+        finally:
+            mm.close()
+        return size
+
+
+def benchReads(path, blockSizes=(8192, 1048576, 4194304, 16777216),
+               modes=ChecksumReader.MODES, hashName='md5'):
+    """
+    Measures checksum speed of file at path for every read mode and block
+    size, with cold page cache first and then warm. Cold runs are skipped
+    where posix_fadvise() isn't available to drop cached pages.
+    Returns list of (cache, mode, blockSize, MB per second).
+    """
+    size = os.path.getsize(path)
+    results = []
+    for cache in ('cold', 'warm'):
+        if cache == 'cold' and posix_fadvise is None:
+            continue
+        for mode in modes:
+            for blockSize in blockSizes:
+                if cache == 'cold':
+                    fd = os.open(path, os.O_RDONLY)
+                    try:
+                        posix_fadvise(fd, 0, 0, POSIX_FADV_DONTNEED)
+                    finally:
+                        os.close(fd)
+                reader = ChecksumReader(blockSize, mode)
+                start = time.time()
+                reader.update(HASH_ALGORITHMS[hashName](), path)
+                elapsed = max(time.time() - start, 1e-9)
+                results.append((cache, mode, blockSize, size / 1048576.0 / elapsed))
+    return results
+
+
+#: ioctl returning extents of a file on Linux, _IOWR('f', 11, struct fiemap)
+FS_IOC_FIEMAP = 0xC020660B
+#: struct fiemap header asking for the first extent of the whole file,
+#: followed by room for one struct fiemap_extent
+_FIEMAP_REQUEST = struct.pack('=QQIIII', 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + '\0' * 56
+#: fiemap_extent flags of extents not allocated on disk yet, their
+#: physical offset is 0
+FIEMAP_EXTENT_UNKNOWN = 0x2
+FIEMAP_EXTENT_DELALLOC = 0x4
+
+
+class ReadScheduler(object):
+    """
+    Orders files to be read so that disks sweep across them instead of
+    seeking back and forth. 'walk' keeps order files were found in,
+    'inode' sorts them by device and inode number, which follows their
+    placement on disk on most filesystems, and 'physical' sorts them by
+    physical offset of their first extent, from FIEMAP ioctl on Linux.
+    Files on filesystems without FIEMAP, or not allocated on disk yet,
+    come after the others of their device, in inode order. FIEMAP costs
+    an open() per file, so it pays off on spinning disks only.
+
+    >>> records = [FileRecord('tests/data', name, os.stat('tests/data/' + name))
+    ...            for name in ('testDocOne.txt', 'testDocTwo.txt')]
+    >>> sorted(ReadScheduler('physical').schedule(records))
+    [0, 1]
+    """
+    ORDERS = ('walk', 'inode', 'physical')
+
+    def __init__(self, order='inode'):
+        if order not in self.ORDERS:
+            raise ValueError("unknown read order: %s" % order)
+        self.order = order
+        #: devices whose filesystem doesn't support FIEMAP
+        self._unsupported = set()
+
+    def physicalOffset(self, path, dev=None):
+        """returns physical byte offset of start of file, None if unknown"""
+        if fcntl is None or dev in self._unsupported:
+            return None
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            result = fcntl.ioctl(fd, FS_IOC_FIEMAP, _FIEMAP_REQUEST)
+        except (IOError, OSError) as err:
+            if err.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL):
+                self._unsupported.add(dev)
+            return None
+        finally:
+            os.close(fd)
+        if not struct.unpack_from('=I', result, 20)[0]:
+            return None
+        if struct.unpack_from('=I', result, 72)[0] & (FIEMAP_EXTENT_UNKNOWN |
+                                                     FIEMAP_EXTENT_DELALLOC):
+            #written recently, placed on disk when it is flushed
+            return None
+        return struct.unpack_from('=Q', result, 40)[0]
+
+    def schedule(self, records):
+        """returns indexes of FileRecords records in order to read them"""
+        positions = range(len(records))
+        if self.order == 'walk':
+            return sorted(positions, key=lambda i: (records[i].index, i))
+        if self.order == 'inode':
+            return sorted(positions, key=lambda i: (records[i].st_dev, records[i].st_ino))
+        keys = []
+        for record in records:
+            offset = self.physicalOffset(record.path, record.st_dev)
+            if offset is None:
+                keys.append((record.st_dev, 1, record.st_ino))
+            else:
+                keys.append((record.st_dev, 0, offset))
+        return sorted(positions, key=keys.__getitem__)
+
+
 class FileUtils(object):
 
-    def makeModDate(self, path):
+    #: name of checksum algorithm from HASH_ALGORITHMS
+    hashName = 'md5'
+    #: reads files for createChecksum()
+    reader = ChecksumReader()
+    #: ScanStats updated by checksum and compare methods, if any
+    stats = None
+
+    def makeModDate(self, path, st=None):
         """
-        Makes a modification date object
+        Makes a modification date object, from stat result st if given
         """
-        mod = time.strftime("%m/%d/%Y %I:%M:%S %p",time.localtime(os.path.getmtime(path)))
+        if st is None:
+            st = os.stat(path)
+        mod = time.strftime("%m/%d/%Y %I:%M:%S %p",time.localtime(st.st_mtime))
         return mod
 
-    def makeCreateDate(self, path):
+    def makeCreateDate(self, path, st=None):
         """
-        Makes a creation date object
+        Makes a creation date object, from stat result st if given
         """
-        create = time.strftime("%m/%d/%Y %I:%M:%S %p",time.localtime(os.path.getctime(path)))
+        if st is None:
+            st = os.stat(path)
+        create = time.strftime("%m/%d/%Y %I:%M:%S %p",time.localtime(st.st_ctime))
         return create
 
     def createChecksum(self, path):
         """
-        Reads in file.  Creates checksum of file line by line.
+        Reads in file in binary mode through ChecksumReader.
         Returns complete checksum total for file.
 
         """
@@ -243,25 +1207,138 @@ class FileUtils(object):
         if LITEN_DEBUG_MODE == 2:
             pdb.set_trace()
 
+        started = _clock()
         try:
-            fp = open(path)
-            checksum = hashlib.md5()
-            while True:
-                dbuffer = fp.read(8192)
-                if not dbuffer:break
-                checksum.update(dbuffer)
-            fp.close()
+            checksum = HASH_ALGORITHMS[self.hashName]()
+            count = self.reader.update(checksum, path)
             checksum = checksum.digest()
-        except IOError:
+            if self.stats is not None:
+                self.stats.add('filesHashed')
+                self.stats.add('bytesRead', count)
+        except EnvironmentError:
             print(("IO error for %s" % path))
             checksum = None
+            if self.stats is not None:
+                self.stats.add('errors')
             if LITEN_DEBUG_MODE == 1:
                 print(('IO error for %s' % path))
         finally:
             if LITEN_DEBUG_MODE:
                 print(("Performing checksum on: %s" % path))
+            if self.stats is not None:
+                self.stats.addTime('hash', _clock() - started)
+        return checksum
+
+    def createPartialChecksum(self, path, blockSize, byteSize=None):
+        """
+        Creates checksum of first and last blockSize bytes of file. Files
+        that have same size but different partial checksums can't be equal.
+        Returns None if file can't be read.
+
+        >>> fu = FileUtils()
+        >>> one = fu.createPartialChecksum('tests/data/testDocOne.txt', 8)
+        >>> two = fu.createPartialChecksum('tests/data/testDocTwo.txt', 8)
+        >>> one == two
+        True
+        """
+        started = _clock()
+        try:
+            if byteSize is None:
+                byteSize = os.path.getsize(path)
+            fp = open(path, 'rb')
+            try:
+                head = fp.read(blockSize)
+                checksum = HASH_ALGORITHMS[self.hashName](head)
+                count = len(head)
+                if byteSize > blockSize:
+                    fp.seek(max(blockSize, byteSize - blockSize))
+                    tail = fp.read(blockSize)
+                    checksum.update(tail)
+                    count += len(tail)
+                self.reader.throttle(count)
+            finally:
+                self.reader.release(fp)
+                fp.close()
+            checksum = checksum.digest()
+            if self.stats is not None:
+                self.stats.add('partialsHashed')
+                self.stats.add('bytesRead', count)
+        except (IOError, OSError):
+            print(("IO error for %s" % path))
+            checksum = None
+            if self.stats is not None:
+                self.stats.add('errors')
+        if self.stats is not None:
+            self.stats.addTime('hash', _clock() - started)
         return checksum
 
+    def compareFiles(self, paths, blockSize=1048576):
+        """
+        Compares contents of files by reading them in lockstep, blockSize
+        bytes at a time, without computing any checksum. Files are split
+        into groups as soon as their contents differ, and files left alone
+        are closed. Returns lists of indexes of paths with equal contents,
+        at least two in each list.
+
+        >>> FileUtils().compareFiles(['tests/data/testDocOne.txt',
+        ...                           'tests/data/testDocThree_wrong_match.txt',
+        ...                           'tests/data/testDocTwo.txt'])
+        [[0, 2]]
+        """
+        started = _clock()
+        files = []
+        count = errors = 0
+        try:
+            for path in paths:
+                try:
+                    files.append(io.open(path, 'rb'))
+                except EnvironmentError:
+                    print(("IO error for %s" % path))
+                    errors += 1
+                    files.append(None)
+            groups = [[i for i, fp in enumerate(files) if fp is not None]]
+            equal = []
+            while groups:
+                chunks = {}
+                for i in groups.pop():
+                    try:
+                        chunk = files[i].read(blockSize)
+                    except EnvironmentError:
+                        print(("IO error for %s" % paths[i]))
+                        errors += 1
+                        continue
+                    count += len(chunk)
+                    self.reader.throttle(len(chunk))
+                    chunks.setdefault(chunk, []).append(i)
+                for chunk, members in chunks.items():
+                    if len(members) < 2:
+                        self.reader.release(files[members[0]])
+                        files[members[0]].close()
+                    elif not chunk:
+                        equal.append(members)
+                    else:
+                        groups.append(members)
+            return sorted(equal)
+        finally:
+            for fp in files:
+                if fp is not None:
+                    self.reader.release(fp)
+                    fp.close()
+            if self.stats is not None:
+                self.stats.add('filesCompared', len(paths))
+                self.stats.add('bytesRead', count)
+                self.stats.add('errors', errors)
+                self.stats.addTime('hash', _clock() - started)
+
+    def formatChecksum(self, checksum):
+        """
+        Returns checksum as hex string prefixed with algorithm name
+
+        >>> FileUtils().formatChecksum(hashlib.md5('liten').digest())
+        'md5:a37edb45caa9bba5761761f54c547ed7'
+        """
+        return "%s:%s" % (self.hashName, str(binascii.hexlify(checksum).decode('ascii')))
+
     def createSearchDate(self):
         now = datetime.datetime.now()
         date = now.strftime("%Y%m%d")
@@ -275,26 +1352,1123 @@ class FileUtils(object):
         return ext
 
 
-class Liten(FileUtils):
+class PathFilter(object):
     """
-    A base class for searching a file tree.
+    Include and exclude patterns of files and exclude patterns of
+    directories, compiled once into one regular expression per kind.
+    Patterns are globs, which match file or directory name when they
+    contain no '/' and whole path otherwise, or regular expressions
+    prefixed with 're:', which are searched for in whole path.
 
-    Contains several methods for analyzing file objects.
-    Main method is diskWalker, which walks filesystem and determines
-    duplicates.
+    A file is matched when it matches an include pattern, or there are
+    none, and no exclude pattern. Directories matching an exclude pattern
+    are not walked into at all.
 
-    You may modify the action that occurs when a duplicate is
-    found my subclassing ActionsMixin and specify it as a handler.
+    >>> pathFilter = PathFilter(include=['*.txt', 're:/data/'],
+    ...                         exclude=['*Three*'], excludeDirs=['.git'])
+    >>> pathFilter.matchFile('tests/data/testDocOne.txt')
+    True
+    >>> pathFilter.matchFile('tests/data/testDocThree_wrong_match.txt')
+    False
+    >>> pathFilter.matchDir('src/.git'), pathFilter.matchDir('src/git')
+    (False, True)
+    """
+    REGEX_PREFIX = 're:'
 
-    >>> Liten = Liten(spath='testData')
-    >>> fakePath = 'tests/data/testDocOne.txt'
-    >>> modDate = Liten.makeModDate(fakePath)
-    >>> createDate = Liten.makeCreateDate(fakePath)
-    >>> dupeFileOne = 'tests/data/testDocOne.txt'
-    >>> checksumOne = Liten.createChecksum(dupeFileOne)
-    >>> badChecksumAttempt = Liten.createChecksum('fileNotFound.txt')
-    IO error for fileNotFound.txt
-    >>> dupeFileTwo = 'tests/data/testDocTwo.txt'
+    def __init__(self, include=None, exclude=None, excludeDirs=None):
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.excludeDirs = list(excludeDirs or [])
+        self._include = self._compile(self.include)
+        self._exclude = self._compile(self.exclude)
+        self._excludeDirs = self._compile(self.excludeDirs)
+
+    @classmethod
+    def _compile(cls, patterns):
+        """
+        Returns (name regex, path regex) matching any of patterns, None
+        for kinds without patterns.
+        """
+        names = []
+        paths = []
+        for pattern in patterns:
+            if pattern.startswith(cls.REGEX_PREFIX):
+                paths.append('.*?(?:%s)' % pattern[len(cls.REGEX_PREFIX):])
+                continue
+            regex = translate(os.path.normcase(pattern))
+            if regex.endswith('\\Z(?ms)'):
+                #Python 2 puts flags at the end, which can't be joined
+                regex = regex[:-len('(?ms)')]
+            elif not regex.endswith('\\Z'):
+                regex += '\\Z'
+            if '/' in pattern:
+                paths.append(regex)
+            else:
+                names.append(regex)
+        return tuple(re.compile('|'.join('(?:%s)' % regex for regex in kind), re.S)
+                     if kind else None for kind in (names, paths))
+
+    @staticmethod
+    def _matches(compiled, path, name):
+        nameRegex, pathRegex = compiled
+        if nameRegex is not None and nameRegex.match(name):
+            return True
+        return pathRegex is not None and pathRegex.match(path) is not None
+
+    def matchFile(self, path, name=None):
+        """tells if file at path is included"""
+        path = os.path.normcase(path)
+        if name is None:
+            name = os.path.basename(path)
+        else:
+            name = os.path.normcase(name)
+        if self.include and not self._matches(self._include, path, name):
+            return False
+        return not (self.exclude and self._matches(self._exclude, path, name))
+
+    def matchDir(self, path, name=None):
+        """tells if directory at path is walked into"""
+        if not self.excludeDirs:
+            return True
+        path = os.path.normcase(path)
+        if name is None:
+            name = os.path.basename(path)
+        else:
+            name = os.path.normcase(name)
+        return not self._matches(self._excludeDirs, path, name)
+
+
+def _scanDir(dirpath, stats=None, pathFilter=None, limiter=None):
+    """
+    Lists directory with one stat per file. Returns (files, dirs) where
+    files is a list of (path, filename, stat) for regular files, symbolic
+    links to them included, and dirs is a list of subdirectories to descend
+    into, unless pathFilter excludes them. Errors are ignored like
+    os.walk() does, but counted in stats. Listing and every stat take a
+    unit of TokenBucket limiter, if any.
+    """
+    files = []
+    dirs = []
+    started = _clock()
+    statTime = 0.0
+    throttled = 0.0
+    errors = 0
+    consume = limiter.consume if limiter is not None else lambda: 0
+    try:
+        if scandir is not None:
+            throttled += consume()
+            try:
+                entries = list(scandir(dirpath))
+            except OSError:
+                errors += 1
+                return files, dirs
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink() and \
+                                (pathFilter is None or pathFilter.matchDir(entry.path, entry.name)):
+                            dirs.append(entry.path)
+                        continue
+                    throttled += consume()
+                    before = _clock()
+                    st = entry.stat()
+                    statTime += _clock() - before
+                except OSError:
+                    errors += 1
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    files.append((entry.path, entry.name, st))
+            return files, dirs
+        throttled += consume()
+        try:
+            names = os.listdir(dirpath)
+        except OSError:
+            errors += 1
+            return files, dirs
+        for name in names:
+            path = os.path.join(dirpath, name)
+            try:
+                throttled += consume()
+                before = _clock()
+                st = os.stat(path)
+                statTime += _clock() - before
+            except OSError:
+                errors += 1
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                if not os.path.islink(path) and \
+                        (pathFilter is None or pathFilter.matchDir(path, name)):
+                    dirs.append(path)
+            elif stat.S_ISREG(st.st_mode):
+                files.append((path, name, st))
+        return files, dirs
+    finally:
+        if stats is not None:
+            stats.add('dirsScanned')
+            stats.add('errors', errors)
+            stats.addTime('stat', statTime)
+            stats.addTime('walk', _clock() - started - statTime - throttled)
+
+
+def walkFiles(top, jobs=1, stats=None, pathFilter=None, journal=None, limiter=None):
+    """
+    Walks tree below top and yields (path, filename, stat) for every file.
+    Each file is stat'ed once, and the stat result is meant to be used for
+    everything else. Order is the same as with os.walk(), unless jobs > 1:
+    then directories are read by a pool of threads level by level.
+    Directories, errors and time spent are counted in ScanStats stats.
+    Directories excluded by PathFilter pathFilter are not walked into.
+    Listings are written to and replayed from ScanJournal journal.
+    Metadata calls are held to rate of TokenBucket limiter, if any.
+
+    >>> sorted(name for _, name, _ in walkFiles('tests/data'))
+    ['testDocOne.txt', 'testDocThree_wrong_match.txt', 'testDocTwo.txt']
+    """
+    scan = _scanDir if journal is None else journal.scanDir
+    if jobs <= 1:
+        stack = [top]
+        while stack:
+            files, dirs = scan(stack.pop(), stats, pathFilter, limiter)
+            for item in files:
+                yield item
+            stack.extend(reversed(dirs))
+        return
+    pool = ThreadPool(jobs)
+    try:
+        level = deque([top])
+        while level:
+            batch = [level.popleft() for _ in range(min(len(level), jobs * 16))]
+            for files, dirs in pool.imap(lambda path: scan(path, stats, pathFilter,
+                                                           limiter),
+                                         batch):
+                for item in files:
+                    yield item
+                level.extend(dirs)
+    finally:
+        pool.terminate()
+
+
+class FileSystemOps(object):
+    """
+    Metadata calls made by pipelinedWalk(). Subclasses can wrap them, for
+    example to add latency of a network filesystem in tests.
+    """
+    listdir = staticmethod(os.listdir)
+    lstat = staticmethod(os.lstat)
+    stat = staticmethod(os.stat)
+
+
+class ThrottledOps(FileSystemOps):
+    """FileSystemOps ops with calls held to rate of TokenBucket limiter"""
+
+    def __init__(self, limiter, ops=None):
+        self.limiter = limiter
+        self.ops = ops or FileSystemOps()
+
+    def listdir(self, path):
+        self.limiter.consume()
+        return self.ops.listdir(path)
+
+    def lstat(self, path):
+        self.limiter.consume()
+        return self.ops.lstat(path)
+
+    def stat(self, path):
+        self.limiter.consume()
+        return self.ops.stat(path)
+
+
+def _pipelinedScan(dirpath, ops, statPool, stats, pathFilter=None):
+    """
+    Lists dirpath and stats its entries in statPool. Returns (files, dirs)
+    where dirs are paths of subdirectories to walk, in listing order.
+    """
+    started = _clock()
+    errors = 0
+    files = []
+    dirs = []
+    try:
+        try:
+            names = ops.listdir(dirpath)
+        except OSError:
+            errors += 1
+            return files, dirs
+
+        def statEntry(name):
+            path = os.path.join(dirpath, name)
+            try:
+                st = ops.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    #links to files are followed, links to directories not
+                    st = ops.stat(path)
+                    if stat.S_ISDIR(st.st_mode):
+                        return None
+                return path, name, st
+            except OSError:
+                return False
+
+        for name, entry in zip(names, statPool.map(statEntry, names)):
+            if entry is False:
+                errors += 1
+            elif entry is None:
+                continue
+            elif stat.S_ISDIR(entry[2].st_mode):
+                if pathFilter is None or pathFilter.matchDir(entry[0], name):
+                    dirs.append(entry[0])
+            elif stat.S_ISREG(entry[2].st_mode):
+                files.append(entry)
+        return files, dirs
+    finally:
+        if stats is not None:
+            stats.add('dirsScanned')
+            stats.add('errors', errors)
+            stats.addTime('walk', _clock() - started)
+
+
+def pipelinedWalk(top, concurrency=64, stats=None, ops=None, pathFilter=None,
+                  ahead=None):
+    """
+    Walks tree below top like walkFiles() and yields the same
+    (path, filename, stat) in the same order, but keeps up to concurrency
+    directory listings and as many stat calls in flight. Subdirectories are
+    read ahead of the consumer, which hides round trips of network
+    filesystems. At most ahead (default 4 * concurrency) directories are
+    scanned but not yet consumed, so memory stays bounded however far the
+    workers could run. ops are FileSystemOps to use.
+
+    >>> serial = [name for _, name, _ in walkFiles('tests/data')]
+    >>> [name for _, name, _ in pipelinedWalk('tests/data', 4)] == serial
+    True
+    """
+    if ops is None:
+        ops = FileSystemOps
+    if ahead is None:
+        ahead = 4 * concurrency
+    dirPool = ThreadPool(concurrency)
+    statPool = ThreadPool(concurrency)
+
+    def start(entry):
+        entry[1] = dirPool.apply_async(_pipelinedScan,
+                                       (entry[0], ops, statPool, stats, pathFilter))
+
+    try:
+        #[dirpath, AsyncResult or None if not started], next to walk last
+        stack = [[top, _Done(_pipelinedScan(top, ops, statPool, stats, pathFilter))]]
+        started = 1
+        while stack:
+            #start scans of directories walked soonest, up to ahead of them
+            index = len(stack) - 1
+            while started < ahead and index >= 0:
+                if stack[index][1] is None:
+                    start(stack[index])
+                    started += 1
+                index -= 1
+            entry = stack.pop()
+            if entry[1] is None:
+                start(entry)
+            else:
+                started -= 1
+            files, dirs = entry[1].get()
+            for item in files:
+                yield item
+            stack.extend([path, None] for path in reversed(dirs))
+    finally:
+        dirPool.terminate()
+        statPool.terminate()
+
+
+#: file equal to an earlier found original, yielded by Liten.iterDuplicates()
+DuplicateMatch = namedtuple('DuplicateMatch',
+                            'checksum size original originalStat path stat')
+
+#: group of files with equal contents found by Liten.findDuplicateGroups(),
+#: stats are FileRecords of paths in the same order
+DuplicateGroup = namedtuple('DuplicateGroup', 'checksum size paths stats')
+
+#: bytes wasted in duplicates estimated by Liten.estimateWaste(), with
+#: bounds of confidence interval, number of size groups and of groups read
+WasteEstimate = namedtuple('WasteEstimate',
+                           'wasted low high confidence groups measured potential')
+
+
+def _tScore(confidence, df=None):
+    """
+    Returns t such that share confidence of Student's t distribution with
+    df degrees of freedom, or of normal distribution if df is None, is
+    within t standard deviations of the mean. Cornish-Fisher expansion is
+    used for t.
+
+    >>> round(_tScore(0.95), 2), round(_tScore(0.99), 2), round(_tScore(0.95, 10), 2)
+    (1.96, 2.58, 2.23)
+    """
+    low, high = 0.0, 10.0
+    for _ in range(60):
+        middle = (low + high) / 2
+        if math.erf(middle / math.sqrt(2)) < confidence:
+            low = middle
+        else:
+            high = middle
+    z = (low + high) / 2
+    if df is None:
+        return z
+    return z + (z ** 3 + z) / (4.0 * df) + \
+        (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96.0 * df ** 2)
+
+
+def benchHashes(megabytes=256, algorithms=None, blockSize=1048576):
+    """
+    Measures how fast each checksum algorithm digests data in memory.
+    Returns list of (name, MB per second) sorted by speed, fastest first.
+    Algorithms faster than disk bandwidth don't slow search down.
+
+    >>> [name for name, _ in benchHashes(1, ['md5'])]
+    ['md5']
+    """
+    block = os.urandom(blockSize)
+    results = []
+    for name in algorithms or sorted(HASH_ALGORITHMS):
+        checksum = HASH_ALGORITHMS[name]()
+        start = time.time()
+        for _ in range(megabytes * 1048576 // blockSize):
+            checksum.update(block)
+        checksum.digest()
+        elapsed = max(time.time() - start, 1e-9)
+        results.append((name, megabytes / elapsed))
+    results.sort(key=lambda result: -result[1])
+    return results
+
+
+class _Done(object):
+    """stands in for AsyncResult of a value that is known already"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def ready(self):
+        return True
+
+    def get(self):
+        return self.value
+
+
+def _mtimeNs(st):
+    """modification time of stat result in integer nanoseconds"""
+    mtime = getattr(st, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1000000000)
+    return mtime
+
+
+class FileRecord(object):
+    """
+    Compact record of a file tracked during search. It carries the fields
+    of stat result that Liten needs under the same names, so it is used in
+    place of one. Path is kept as directory, shared by all files of that
+    directory, and file name. Checksums are raw digest bytes.
+
+    Records can also be read like dicts of earlier Liten versions, i.e.
+    record['fullPath'], record['modDate'] or record['bytes'].
+
+    >>> st = os.stat('tests/data/testDocOne.txt')
+    >>> record = FileRecord('tests/data', 'testDocOne.txt', st)
+    >>> record.path, record.st_size, record['bytes'], record['fileExt']
+    ('tests/data/testDocOne.txt', 45, 45, '.txt')
+    """
+    __slots__ = ('dirname', 'name', 'st_size', 'st_dev', 'st_ino', 'st_nlink',
+                 'st_mtime_ns', 'st_ctime', 'checksum', 'partial', 'index',
+                 'dupNumber')
+
+    _LEGACY_KEYS = ('fullPath', 'checksum', 'modDate', 'dupNumber',
+                    'searchDate', 'bytes', 'fileType', 'fileExt')
+
+    def __init__(self, dirname, name, st):
+        self.dirname = dirname
+        self.name = name
+        self.st_size = st.st_size
+        self.st_dev = st.st_dev
+        self.st_ino = st.st_ino
+        self.st_nlink = st.st_nlink
+        self.st_mtime_ns = _mtimeNs(st)
+        self.st_ctime = st.st_ctime
+        self.checksum = None
+        self.partial = None
+        self.index = None
+        self.dupNumber = None
+
+    @property
+    def path(self):
+        return os.path.join(self.dirname, self.name)
+
+    @property
+    def st_mtime(self):
+        return self.st_mtime_ns / 1000000000.0
+
+    def __repr__(self):
+        return "<FileRecord %s %s bytes>" % (self.path, self.st_size)
+
+    def keys(self):
+        return list(self._LEGACY_KEYS)
+
+    def __getitem__(self, key):
+        if key == 'fullPath':
+            return self.path
+        if key == 'checksum':
+            return self.checksum
+        if key == 'modDate':
+            return FileUtils().makeCreateDate(self.path, self)
+        if key == 'dupNumber':
+            return self.dupNumber
+        if key == 'searchDate':
+            return FileUtils().createSearchDate()
+        if key == 'bytes':
+            return self.st_size
+        if key == 'fileType':
+            return None
+        if key == 'fileExt':
+            return FileUtils().createExt(self.name)
+        raise KeyError(key)
+
+
+def _deepSize(objects):
+    """sums sys.getsizeof() of objects and everything they refer to once"""
+    seen = set()
+    stack = list(objects)
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)) and not isinstance(obj, os.stat_result):
+            stack.extend(obj)
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, slot) for slot in obj.__slots__
+                         if hasattr(obj, slot))
+    return total
+
+
+def benchMemory(count=10000, perDirectory=100):
+    """
+    Measures bytes of memory per file tracked in checksum index, with
+    the dict records of earlier versions and with FileRecord.
+    Returns (bytes per dict record, bytes per FileRecord).
+
+    >>> before, after = benchMemory(100)
+    >>> after < before
+    True
+    """
+    st = os.stat(__file__)
+    fu = FileUtils()
+    searchDate = fu.createSearchDate()
+    legacy = []
+    compact = []
+    dirnames = {}
+    for n in range(count):
+        dirname = os.path.join('/data', 'dir%06d' % (n // perDirectory))
+        name = 'file%06d.bin' % n
+        digest = hashlib.md5(name.encode('ascii')).digest()
+        path = os.path.join(dirname, name)
+        legacy.append({'fullPath': path,
+                       'checksum': digest,
+                       'modDate': fu.makeCreateDate(path, st),
+                       'dupNumber': 0,
+                       'searchDate': searchDate,
+                       'bytes': st.st_size + n,
+                       'fileType': None,
+                       'fileExt': fu.createExt(name)})
+        record = FileRecord(dirnames.setdefault(dirname, dirname), name, st)
+        record.st_size += n
+        record.checksum = digest
+        compact.append(record)
+    return (_deepSize(legacy) - sys.getsizeof(legacy)) / float(count), \
+           (_deepSize(compact) - sys.getsizeof(compact)) / float(count)
+
+
+class ChecksumCache(object):
+    """
+    Persistent checksum storage backed by a SQLite database.
+
+    Checksums are keyed by device, inode, size and modification time of
+    the file, so a record is only returned while the file is unchanged.
+    Checksum algorithm is stored along, records of other algorithms are
+    never returned.
+
+    >>> cache = ChecksumCache(':memory:')
+    >>> st = os.stat('tests/data/testDocOne.txt')
+    >>> cache.lookup(st) is None
+    True
+    >>> cache.store('tests/data/testDocOne.txt', st, 'digest')
+    >>> cache.lookup(st)
+    'digest'
+    >>> cache.vacuum()
+    0
+    >>> cache.close()
+    """
+
+    def __init__(self, filep, algorithm='md5'):
+        self.filep = filep
+        self.algorithm = algorithm
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(filep)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS checksums (
+                                dev INTEGER,
+                                ino INTEGER,
+                                size INTEGER,
+                                mtime INTEGER,
+                                path TEXT,
+                                algorithm TEXT,
+                                checksum BLOB,
+                                PRIMARY KEY (dev, ino, algorithm))""")
+        self.conn.commit()
+
+    def lookup(self, st):
+        """returns cached checksum for stat result or None if file changed"""
+        row = self.conn.execute("""SELECT checksum FROM checksums
+                                   WHERE dev=? AND ino=? AND size=? AND mtime=?
+                                   AND algorithm=?""",
+                                (st.st_dev, st.st_ino, st.st_size,
+                                 _mtimeNs(st), self.algorithm)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bytes(row[0])
+
+    def store(self, path, st, checksum):
+        """saves checksum of path, replacing older record for the same inode"""
+        self.conn.execute("INSERT OR REPLACE INTO checksums VALUES (?,?,?,?,?,?,?)",
+                          (st.st_dev, st.st_ino, st.st_size, _mtimeNs(st),
+                           path, self.algorithm, sqlite3.Binary(checksum)))
+
+    def vacuum(self):
+        """
+        Evicts records of files that disappeared or changed since they were
+        hashed and compacts the database. Returns number of evicted records.
+        """
+        stale = []
+        rows = self.conn.execute("SELECT dev, ino, size, mtime, path FROM checksums")
+        for dev, ino, size, mtime, path in rows.fetchall():
+            try:
+                st = os.stat(path)
+            except OSError:
+                stale.append((dev, ino))
+                continue
+            if (st.st_dev, st.st_ino, st.st_size, _mtimeNs(st)) != \
+                    (dev, ino, size, mtime):
+                stale.append((dev, ino))
+        self.conn.executemany("DELETE FROM checksums WHERE dev=? AND ino=?", stale)
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        return len(stale)
+
+    def commit(self):
+        """flushes stored checksums to disk"""
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class ReportWriter(object):
+    """
+    Writes duplicates found by Liten to tab separated CSV report, either
+    DuplicateMatch records one by one or whole DuplicateGroup records.
+    Groups are separated by blank line.
+    """
+
+    def __init__(self, liten, reportPath):
+        self.liten = liten
+        self.reportFile = open(reportPath, 'wb')
+        self.report = csv.writer(self.reportFile, dialect='excel-tab')
+        #  write header
+        self.report.writerow("Path Size ModDate Checksum".split())
+
+    def _writeFile(self, path, st, checksum=None):
+        row = [path, "%d MB" % (st.st_size/1048576),
+               self.liten.makeCreateDate(path, st)]
+        if checksum is not None:
+            row.append(self.liten.formatChecksum(checksum))
+        self.report.writerow(row)
+
+    def writeMatch(self, match):
+        """writes separator, original line and duplicate line"""
+        self.report.writerow("")
+        self._writeFile(match.original, match.originalStat, match.checksum)
+        self._writeFile(match.path, match.stat, match.checksum)
+
+    def writeGroup(self, group):
+        """writes separator and line for every file of group"""
+        self.report.writerow("")
+        for path, st in zip(group.paths, group.stats):
+            self._writeFile(path, st, group.checksum)
+
+    def writeHardlinks(self):
+        """writes groups of hard linked paths found in search"""
+        groups = [(key, paths) for key, paths in self.liten._links.items()
+                  if len(paths) > 1]
+        if not groups:
+            return
+        self.report.writerow("")
+        self.report.writerow(["Hardlinks:"])
+        for key, paths in groups:
+            st = self.liten._linkStats[key]
+            self.report.writerow("")
+            for path in paths:
+                self._writeFile(path, st)
+
+    def close(self):
+        self.reportFile.close()
+
+
+#: stat fields of a file kept in ShardIndex, enough to make a FileRecord
+_IndexStat = namedtuple('_IndexStat',
+                        'st_size st_dev st_ino st_nlink st_mtime_ns st_ctime')
+
+
+class ShardIndex(object):
+    """
+    Intermediate index written by one shard of a search split with
+    --shard i/N. Shards take files whose size modulo N is i, so all files
+    of a size, and all duplicates of a file, are in the same shard.
+
+    Index is a tab separated file. First row names the shard and checksum
+    algorithm, then every file of a size shared by two or more files has a
+    row of size, partial checksum, full checksum, path and stat fields.
+    Checksums are hex, empty if not computed. Every path of a file found
+    through several hard links follows in an 'L' row of path and stat
+    fields, so merge knows which links were found.
+    """
+    MAGIC = '#liten-index'
+    VERSION = '1'
+
+    def __init__(self, shard, hashName='md5'):
+        self.shard = shard
+        self.hashName = hashName
+        #: (st_dev, st_ino) -> (FileRecord, paths) of files with several links
+        self.links = {}
+
+    @staticmethod
+    def parseShard(spec):
+        """
+        Parses 'i/N' shard specification to (i, N).
+
+        >>> ShardIndex.parseShard('2/4')
+        (2, 4)
+        >>> ShardIndex.parseShard('4/4')
+        Traceback (most recent call last):
+            ...
+        ValueError: invalid shard 4/4, expected i/N with 0 <= i < N
+        """
+        try:
+            index, count = [int(part) for part in spec.split('/')]
+        except ValueError:
+            index = count = 0
+        if not 0 <= index < count:
+            raise ValueError("invalid shard %s, expected i/N with 0 <= i < N" % spec)
+        return index, count
+
+    def write(self, path, records, links=()):
+        """
+        writes FileRecords to index file at path, and (stat, paths) of hard
+        linked files in links
+        """
+        f = open(path, 'wb')
+        try:
+            writer = csv.writer(f, dialect='excel-tab')
+            writer.writerow([self.MAGIC, self.VERSION,
+                             '%d/%d' % self.shard, self.hashName])
+            for record in records:
+                writer.writerow([record.st_size,
+                                 _hexOrEmpty(record.partial),
+                                 _hexOrEmpty(record.checksum),
+                                 record.path, record.st_dev, record.st_ino,
+                                 record.st_nlink, record.st_mtime_ns,
+                                 repr(record.st_ctime)])
+            for st, paths in links:
+                for linkPath in paths:
+                    writer.writerow(['L', linkPath, st.st_size, st.st_dev, st.st_ino,
+                                     st.st_nlink, st.st_mtime_ns, repr(st.st_ctime)])
+        finally:
+            f.close()
+
+    @classmethod
+    def read(cls, path):
+        """
+        Reads index file at path. Returns (ShardIndex, list of FileRecord).
+
+        :raises: ValueError if path is not an index file
+        """
+        f = open(path, 'rb')
+        try:
+            reader = csv.reader(f, dialect='excel-tab')
+            header = next(reader, None)
+            if not header or header[:2] != [cls.MAGIC, cls.VERSION]:
+                raise ValueError("%s is not a liten shard index" % path)
+            index = cls(cls.parseShard(header[2]), header[3])
+            records = []
+            for row in reader:
+                if row[0] == 'L':
+                    st = _IndexStat(int(row[2]), int(row[3]), int(row[4]), int(row[5]),
+                                    int(row[6]), float(row[7]))
+                    key = (st.st_dev, st.st_ino)
+                    if key not in index.links:
+                        index.links[key] = (FileRecord(os.path.dirname(row[1]),
+                                                       os.path.basename(row[1]), st), [])
+                    index.links[key][1].append(row[1])
+                    continue
+                size, partial, checksum, filePath = row[:4]
+                st = _IndexStat(int(size), int(row[4]), int(row[5]), int(row[6]),
+                                int(row[7]), float(row[8]))
+                record = FileRecord(os.path.dirname(filePath),
+                                    os.path.basename(filePath), st)
+                record.partial = binascii.unhexlify(partial) or None
+                record.checksum = binascii.unhexlify(checksum) or None
+                records.append(record)
+            return index, records
+        finally:
+            f.close()
+
+
+def _hexOrEmpty(digest):
+    if digest is None:
+        return ''
+    return binascii.hexlify(digest)
+
+
+def mergeShardIndexes(paths, links=None):
+    """
+    Combines index files of all shards of a search, without reading any of
+    the files indexed. Returns (checksum algorithm name, list of
+    DuplicateGroup), groups are ordered by path of their first file. Hard
+    links found by shards are added to dict links if it is given, as
+    ShardIndex.links are.
+
+    :raises: ValueError if shards are missing or repeated, or used
+             different checksum algorithms
+    """
+    seen = {}
+    hashNames = set()
+    counts = set()
+    groups = {}
+    for path in paths:
+        index, records = ShardIndex.read(path)
+        if index.shard in seen:
+            raise ValueError("shard %d/%d is in both %s and %s" %
+                             (index.shard + (seen[index.shard], path)))
+        seen[index.shard] = path
+        hashNames.add(index.hashName)
+        counts.add(index.shard[1])
+        if links is not None:
+            links.update(index.links)
+        for record in records:
+            if record.checksum is not None:
+                groups.setdefault((record.st_size, record.checksum), []).append(record)
+    if len(hashNames) > 1:
+        raise ValueError("shards use different checksum algorithms: %s" %
+                         ", ".join(sorted(hashNames)))
+    if len(counts) > 1:
+        raise ValueError("shards of different searches: %s" %
+                         ", ".join("%d/%d" % shard for shard in sorted(seen)))
+    if counts:
+        count = counts.pop()
+        missing = [i for i in range(count) if (i, count) not in seen]
+        if missing:
+            raise ValueError("missing shards: %s" %
+                             ", ".join("%d/%d" % (i, count) for i in missing))
+    merged = [DuplicateGroup(checksum, size, [record.path for record in members],
+                             members)
+              for (size, checksum), members in groups.items() if len(members) > 1]
+    merged.sort(key=lambda group: group.paths[0])
+    return (hashNames.pop() if hashNames else 'md5'), merged
+
+
+class ScanJournal(object):
+    """
+    Checkpoint of a search, so it can be resumed after it was killed. The
+    journal is appended a record for every directory listed, with its files
+    and their stat fields and its subdirectories, and for every partial or
+    full checksum made. Writes are buffered and synced to disk every
+    interval seconds, so checkpoints cost only the records added since the
+    last one.
+
+    A resumed search replays listings of directories from journal instead
+    of reading them and takes checksums from it instead of reading files,
+    so size index and pending candidates are rebuilt as they were, and
+    only what was not done yet reaches the disk. First row holds search
+    parameters, journal of another search is refused. Records cut short by
+    a crash are ignored.
+    """
+    MAGIC = '#liten-journal'
+    VERSION = '1'
+
+    def __init__(self, filep, params, resume=False, interval=5.0):
+        self.filep = filep
+        self.params = repr(sorted(params.items()))
+        self.interval = interval
+        #: directory path -> (files, dirs) as _scanDir() returns them
+        self.dirs = {}
+        self.partials = {}
+        self.checksums = {}
+        self._lock = threading.Lock()
+        if resume and os.path.exists(filep):
+            end = self._load()
+            self.file = open(filep, 'r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+            self.writer = csv.writer(self.file, dialect='excel-tab')
+        else:
+            self.file = open(filep, 'wb')
+            self.writer = csv.writer(self.file, dialect='excel-tab')
+            self.writer.writerow([self.MAGIC, self.VERSION, self.params])
+        self.sync()
+
+    def _load(self):
+        """
+        Reads journal, returns offset after its last whole record.
+
+        :raises: ValueError if journal is of another search
+        """
+        f = open(self.filep, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        lines = io.BytesIO(data[:data.rfind('\n') + 1])
+        rows = csv.reader(lines, dialect='excel-tab')
+        header = next(rows, None)
+        if not header or header[:2] != [self.MAGIC, self.VERSION]:
+            raise ValueError("%s is not a liten checkpoint" % self.filep)
+        if header[2:] != [self.params]:
+            raise ValueError("checkpoint %s is of another search" % self.filep)
+        #rows of a listing cut short are left pending, journal is cut back
+        #to the last whole record so they are not taken for the next listing
+        end = lines.tell()
+        files = []
+        dirs = []
+        try:
+            for row in rows:
+                kind = row[0]
+                if kind == 'f':
+                    st = _IndexStat(int(row[3]), int(row[4]), int(row[5]),
+                                    int(row[6]), int(row[7]), float(row[8]))
+                    files.append((row[1], row[2], st))
+                elif kind == 'd':
+                    dirs.append(row[1])
+                elif kind == 'D':
+                    dirpath = row[1]
+                    inside = lambda path: os.path.join(
+                        dirpath, os.path.basename(path)) == path
+                    self.dirs[dirpath] = ([entry for entry in files if inside(entry[0])],
+                                          [path for path in dirs if inside(path)])
+                    files = []
+                    dirs = []
+                    end = lines.tell()
+                elif kind == 'P':
+                    self.partials[row[1]] = binascii.unhexlify(row[2])
+                    end = lines.tell()
+                elif kind == 'C':
+                    self.checksums[row[1]] = binascii.unhexlify(row[2])
+                    end = lines.tell()
+        except (csv.Error, IndexError, ValueError, TypeError):
+            #torn record at the end, listing of its directory is made again
+            pass
+        return end
+
+    def _write(self, rows):
+        with self._lock:
+            self.writer.writerows(rows)
+            if _clock() - self._synced >= self.interval:
+                self.sync()
+
+    def scanDir(self, dirpath, stats=None, pathFilter=None, limiter=None):
+        """_scanDir() which replays directories listed before from journal"""
+        listing = self.dirs.pop(dirpath, None)
+        if listing is not None:
+            return listing
+        files, dirs = _scanDir(dirpath, stats, pathFilter, limiter)
+        rows = [['f', path, name, st.st_size, st.st_dev, st.st_ino, st.st_nlink,
+                 _mtimeNs(st), repr(st.st_ctime)] for path, name, st in files]
+        rows.extend(['d', path] for path in dirs)
+        #directory record comes last, it makes the listing complete
+        rows.append(['D', dirpath])
+        self._write(rows)
+        return files, dirs
+
+    def writeDigest(self, kind, path, digest):
+        """records 'partial' or 'full' checksum of path"""
+        self._write([['P' if kind == 'partial' else 'C', path,
+                      binascii.hexlify(digest)]])
+
+    def sync(self):
+        """writes buffered records to disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self._synced = _clock()
+
+    def close(self, complete=False):
+        """closes journal, removes it if search is complete"""
+        self.file.close()
+        if complete:
+            os.remove(self.filep)
+
+
+class LitenCatalog(object):
+    """
+    Catalog of searched files in a SQLite database, answers duplicate
+    queries without rescanning the tree.
+
+    Every file matched by a search has a row with path, size, inode, mtime
+    and partial and full checksum where they were computed, i.e. files of a
+    size shared by another file. Rows are inserted in transactions of
+    batchSize rows with executemany(), database is in WAL mode, and size
+    and checksum are indexed, so duplicates are a GROUP BY query.
+
+    >>> catalog = LitenCatalog(':memory:')
+    >>> records = []
+    >>> for name in ('testDocOne.txt', 'testDocTwo.txt'):
+    ...     record = FileRecord('tests/data', name, os.stat('tests/data/' + name))
+    ...     record.checksum = FileUtils().createChecksum(record.path)
+    ...     records.append(record)
+    >>> catalog.ingest(records, ['tests'])
+    2
+    >>> [group.paths for group in catalog.duplicateGroups(under='tests/data')]
+    [['tests/data/testDocOne.txt', 'tests/data/testDocTwo.txt']]
+    >>> catalog.duplicateGroups(under='tests/data/testDocOne.txt')
+    []
+    >>> catalog.close()
+    """
+
+    def __init__(self, filep, hashName='md5', batchSize=10000):
+        self.filep = filep
+        self.hashName = hashName
+        self.batchSize = batchSize
+        self.conn = sqlite3.connect(filep)
+        #paths are byte strings, as os.walk gives them
+        self.conn.text_factory = str
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                                path TEXT PRIMARY KEY,
+                                size INTEGER,
+                                dev INTEGER,
+                                ino INTEGER,
+                                nlink INTEGER,
+                                mtime INTEGER,
+                                ctime REAL,
+                                algorithm TEXT,
+                                partial BLOB,
+                                checksum BLOB)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+        self.conn.execute("""CREATE INDEX IF NOT EXISTS files_checksum
+                             ON files (checksum, size)""")
+        self.conn.commit()
+
+    @staticmethod
+    def _under(top):
+        """returns SQL condition and parameters for paths in tree top"""
+        if top is None:
+            return "", ()
+        top = top.rstrip('/')
+        #'0' sorts right after '/', so the path index bounds the subtree
+        return " AND path >= ? AND path < ?", (top + '/', top + '0')
+
+    def remove(self, top):
+        """deletes rows of files in tree top"""
+        condition, params = self._under(top)
+        self.conn.execute("DELETE FROM files WHERE 1" + condition, params)
+        self.conn.commit()
+
+    def ingest(self, records, tops=()):
+        """
+        Replaces rows of trees tops, the search paths, with FileRecords of
+        a new search. Returns number of rows inserted.
+        """
+        for top in tops:
+            self.remove(top)
+        count = 0
+        batch = []
+        for record in records:
+            batch.append((record.path, record.st_size, record.st_dev,
+                          record.st_ino, record.st_nlink, record.st_mtime_ns,
+                          record.st_ctime, self.hashName,
+                          _blobOrNone(record.partial), _blobOrNone(record.checksum)))
+            if len(batch) >= self.batchSize:
+                count += self._insert(batch)
+                batch = []
+        count += self._insert(batch)
+        return count
+
+    def _insert(self, batch):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES "
+                                  "(?,?,?,?,?,?,?,?,?,?)", batch)
+        return len(batch)
+
+    def duplicateGroups(self, under=None, limit=None):
+        """
+        Returns list of DuplicateGroup of files in tree under, or of all
+        files, with most bytes wasted first. Paths of a group are in walk
+        order and stats are _IndexStat. limit is largest number of groups.
+        """
+        condition, bounds = self._under(under)
+        query = ("SELECT size, checksum, COUNT(*) AS copies FROM files "
+                 "WHERE checksum IS NOT NULL AND algorithm = ?" + condition +
+                 " GROUP BY checksum, size HAVING copies > 1"
+                 " ORDER BY size * (copies - 1) DESC, size DESC")
+        params = (self.hashName,) + bounds
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        groups = []
+        for size, checksum, _ in self.conn.execute(query, params).fetchall():
+            rows = self.conn.execute(
+                "SELECT path, size, dev, ino, nlink, mtime, ctime FROM files "
+                "WHERE checksum = ? AND size = ?" + condition + " ORDER BY rowid",
+                (checksum, size) + bounds)
+            paths = []
+            stats = []
+            for row in rows:
+                paths.append(row[0])
+                stats.append(_IndexStat(*row[1:]))
+            groups.append(DuplicateGroup(bytes(checksum), size, paths, stats))
+        return groups
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def _blobOrNone(digest):
+    if digest is None:
+        return None
+    return sqlite3.Binary(digest)
+
+
+class Liten(FileUtils):
+    """
+    A base class for searching a file tree.
+
+    Contains several methods for analyzing file objects.
+    Main method is diskWalker, which walks filesystem and determines
+    duplicates.
+
+    You may modify the action that occurs when a duplicate is
+    found my subclassing ActionsMixin and specify it as a handler.
+
+    >>> Liten = Liten(spath='testData')
+    >>> fakePath = 'tests/data/testDocOne.txt'
+    >>> modDate = Liten.makeModDate(fakePath)
+    >>> createDate = Liten.makeCreateDate(fakePath)
+    >>> dupeFileOne = 'tests/data/testDocOne.txt'
+    >>> checksumOne = Liten.createChecksum(dupeFileOne)
+    >>> badChecksumAttempt = Liten.createChecksum('fileNotFound.txt')
+    IO error for fileNotFound.txt
+    >>> dupeFileTwo = 'tests/data/testDocTwo.txt'
     >>> checksumTwo = Liten.createChecksum(dupeFileTwo)
     >>> nonDupeFile = 'tests/data/testDocThree_wrong_match.txt'
     >>> checksumThree = Liten.createChecksum(nonDupeFile)
@@ -308,266 +2482,1753 @@ class Liten(FileUtils):
     '.txt'
 
     """
-    def __init__(self, spath=None,
-                    fileSize='1MB',
-                    pattern='*',
-                    reportPath="LitenDuplicateReport.csv",
-                    config = None,
-                    verbose = True,
-                    handler = False):
+    def __init__(self, spath=None,
+                    fileSize='1MB',
+                    pattern='*',
+                    reportPath="LitenDuplicateReport.csv",
+                    config = None,
+                    verbose = True,
+                    handler = False,
+                    cachePath = None,
+                    partialSize = '4KB',
+                    jobs = 1,
+                    walkJobs = 1,
+                    engine = 'classic',
+                    hashName = 'md5',
+                    blockSize = '1MB',
+                    readMode = 'read',
+                    compare = 'hash',
+                    compareLimit = 8,
+                    progressInterval = 1.0,
+                    shard = None,
+                    indexPath = None,
+                    concurrency = 0,
+                    fsOps = None,
+                    include = None,
+                    exclude = None,
+                    excludeDirs = None,
+                    catalogPath = None,
+                    checkpointPath = None,
+                    checkpointInterval = 5.0,
+                    resume = False,
+                    maxReadRate = None,
+                    maxMetadataRate = None,
+                    pageCache = 'keep',
+                    readOrder = 'inode'):
+
+        self.spath = spath
+        self.reportPath = reportPath
+        self.config = config
+        self.fileSize = fileSize
+        self.pattern = pattern
+        #: more include and exclude patterns of files and directories
+        #: to exclude, see PathFilter
+        self.include = include
+        self.exclude = exclude
+        self.excludeDirs = excludeDirs
+        self.pathFilter = None
+        self.verbose = verbose
+        #: size of head and tail blocks hashed before full checksum, 0 disables
+        self.partialSize = partialSize
+        self.partialBlock = 0
+        #: bytes of collided files never read thanks to partial checksums
+        self.bytesSkipped = 0
+        #: bytes freed by removal of duplicates found in last search
+        self.wastedBytes = 0
+        #: metadata calls and reads kept in flight by pipelinedWalk() and
+        #: checksum threads, for network filesystems, 0 is off
+        self.concurrency = concurrency
+        #: FileSystemOps used by pipelinedWalk()
+        self.fsOps = fsOps
+        #: number of threads computing checksums ahead of the walk
+        if concurrency and jobs <= 1:
+            jobs = concurrency
+        self.jobs = jobs
+        #: number of threads reading directories, see walkFiles()
+        self.walkJobs = walkJobs
+        #: 'classic' for diskWalker(), 'grouped' for groupWalker()
+        self.engine = engine
+        #: 'bytes' compares groups of up to compareLimit files in lockstep
+        #: instead of hashing them, implies grouped engine
+        self.compare = compare
+        self.compareLimit = compareLimit
+        #: seconds between progress lines in verbose mode, 0 disables them
+        self.progressInterval = progressInterval
+        #: (i, N) to search only files whose size modulo N is i
+        self.shard = shard
+        #: ShardIndex written by findDuplicateGroups(), implies grouped engine
+        self.indexPath = indexPath
+        #: LitenCatalog updated by findDuplicateGroups(), implies grouped engine
+        self.catalogPath = catalogPath
+        #: ScanJournal written every checkpointInterval seconds and read
+        #: back with resume, see ScanJournal
+        self.checkpointPath = checkpointPath
+        self.checkpointInterval = checkpointInterval
+        self.resume = resume
+        self.journal = None
+        #: (st_dev, st_ino) -> paths of files with more than one link
+        self._links = {}
+        self._linkStats = {}
+        #: directory path -> the same string, shared by FileRecords
+        self._dirnames = {}
+        self._pool = None
+        #: (kind, path) -> (async result, stat to store in cache or None)
+        self._pending = {}
+        self._submitted = set()
+        self._partials = []
+        self._partialFirst = {}
+        self.recordCount = 0
+        #: first checksum only dict
+        self.checksum_cache_key = {}
+        self.checksum_cache_value = {}
+        self.confirmed_dup_key = {}
+        self.confirmed_dup_value = {}
+        self.byte_cache = {}
+        #: (size, partial checksum) -> record of first file with this pair
+        self.partial_cache = {}
+        self.matches = []
+        if hashName not in HASH_ALGORITHMS:
+            raise ValueError("unknown checksum algorithm: %s" % hashName)
+        self.hashName = hashName
+        #: read buffer size and ChecksumReader mode, applied on search
+        self.blockSize = blockSize
+        self.readMode = readMode
+        #: bytes per second read from files, i.e. '50MB', and metadata calls
+        #: per second, None for no limit; TokenBuckets made on search
+        self.maxReadRate = maxReadRate
+        self.maxMetadataRate = maxMetadataRate
+        self.readLimiter = None
+        self.metadataLimiter = None
+        #: 'drop' evicts pages of files read from page cache, see ChecksumReader
+        self.pageCache = pageCache
+        #: order files are read in by grouped engine, see ReadScheduler
+        self.scheduler = ReadScheduler(readOrder)
+        #: persistent checksum cache, see ChecksumCache
+        if cachePath:
+            self.cache = ChecksumCache(cachePath, hashName)
+        else:
+            self.cache = None
+        if not handler:
+            self.handler = ActionsMixin()
+        else:
+            if not isinstance(handler, ActionsMixin):
+                raise TypeError("specified parameter is not ActionsMixin subclass")
+            self.handler = handler
+
+        self.dupNumber = 0
+        #: counters and timers of last search, see ScanStats
+        self.stats = ScanStats()
+        self._cacheCounts = (0, 0)
+
+    def createChecksum(self, path):
+        """
+        FileUtils.createChecksum() which takes checksums from journal of
+        resumed search and writes new ones to it.
+        """
+        journal = self.journal
+        if journal is not None and path in journal.checksums:
+            return journal.checksums[path]
+        checksum = FileUtils.createChecksum(self, path)
+        if journal is not None and checksum is not None:
+            journal.writeDigest('full', path, checksum)
+        return checksum
+
+    def createPartialChecksum(self, path, blockSize, byteSize=None):
+        """FileUtils.createPartialChecksum() going through journal as well"""
+        journal = self.journal
+        if journal is not None and path in journal.partials:
+            return journal.partials[path]
+        checksum = FileUtils.createPartialChecksum(self, path, blockSize, byteSize)
+        if journal is not None and checksum is not None:
+            journal.writeDigest('partial', path, checksum)
+        return checksum
+
+    def _cacheChecksum(self, record, checksum):
+        """saves FileRecord in checksum index"""
+        record.checksum = checksum
+        self.checksum_cache_key[checksum] = record
+
+    def _checksum(self, path, st=None):
+        """createChecksum() which consults persistent cache first"""
+        pending = self._pending.pop(('full', path), None)
+        if pending is not None:
+            result, st = pending
+            checksum = result.get()
+            if st is not None and checksum is not None and self.cache is not None:
+                self.cache.store(path, st, checksum)
+            return checksum
+        if self._pool is not None:
+            #computed here, so pool must not compute it again
+            self._submitted.add(('full', path))
+        if self.cache is None:
+            return self.createChecksum(path)
+        if st is None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return self.createChecksum(path)
+        checksum = self.cache.lookup(st)
+        if checksum is None:
+            checksum = self.createChecksum(path)
+            if checksum is not None:
+                self.cache.store(path, st, checksum)
+        return checksum
+
+    def _usesPartial(self, byteSize):
+        """tells if files of byteSize go through partial checksum stage"""
+        return bool(self.partialBlock) and byteSize > 2 * self.partialBlock
+
+    def _partialChecksum(self, path, byteSize):
+        """createPartialChecksum() which takes result from worker pool if any"""
+        pending = self._pending.pop(('partial', path), None)
+        if pending is not None:
+            return pending[0].get()
+        if self._pool is not None:
+            self._submitted.add(('partial', path))
+        return self.createPartialChecksum(path, self.partialBlock, byteSize)
+
+    def walkFiles(self):
+        """yields (path, filename, stat) for every file in search paths"""
+        if isinstance(self.spath, str):
+            spaths = [self.spath]
+        else:
+            spaths = self.spath
+        for spath in spaths:
+            if self.concurrency:
+                ops = self.fsOps
+                if self.metadataLimiter is not None:
+                    ops = ThrottledOps(self.metadataLimiter, ops)
+                walk = pipelinedWalk(spath, self.concurrency, self.stats, ops,
+                                     self.pathFilter)
+            else:
+                walk = walkFiles(spath, self.walkJobs, self.stats, self.pathFilter,
+                                 self.journal, self.metadataLimiter)
+            for item in walk:
+                yield item
+
+    def _candidates(self, byteSizeThreshold):
+        """
+        Yields (path, filename, FileRecord) for every file over size
+        threshold that matches pattern, in walk order. Counts examined files.
+        """
+        stats = self.stats
+        if self.pathFilter is None:
+            self.pathFilter = self._makePathFilter()
+        pathFilter = self.pathFilter
+        for path, filep, st in self.walkFiles():
+            #gets number of file examined
+            self.recordCount += 1
+            started = _clock()
+            record = None
+            #File Size, Shard, Pattern Filter Section
+            if st.st_size >= byteSizeThreshold and \
+                    (self.shard is None or st.st_size % self.shard[1] == self.shard[0]):
+                if pathFilter.matchFile(path, filep):   #default matches all
+                    if LITEN_DEBUG_MODE == 1:
+                        print(("Matches: %s" % path))
+                    record = self._record(path, filep, st)
+                    #every inode is considered only once
+                    if st.st_nlink > 1 and self._isHardlink(path, record):
+                        record = None
+            stats.addTime('filter', _clock() - started)
+            if record is not None:
+                stats.filesMatched += 1
+                yield path, filep, record
+
+    def _record(self, path, filep, st):
+        """makes FileRecord sharing directory string with its neighbours"""
+        dirname = os.path.dirname(path)
+        return FileRecord(self._dirnames.setdefault(dirname, dirname), filep, st)
+
+    def _isHardlink(self, path, st):
+        """records path of file with several links, tells if inode was seen"""
+        key = (st.st_dev, st.st_ino)
+        if key in self._links:
+            self._links[key].append(path)
+            return True
+        self._links[key] = [path]
+        self._linkStats[key] = st
+        return False
+
+    def hardlinkGroups(self):
+        """
+        Returns lists of paths found during last search that are hard links
+        to the same file. Only the first path of each list was compared
+        with other files.
+        """
+        return [paths for paths in self._links.values() if len(paths) > 1]
+
+    def _reclaimable(self, st):
+        """
+        Returns bytes freed by removal of file with stat st. File with
+        several links is freed only if all of them were found in search.
+        """
+        if st.st_nlink > 1 and \
+                len(self._links.get((st.st_dev, st.st_ino), ())) < st.st_nlink:
+            return 0
+        return st.st_size
+
+    def _submit(self, kind, path, st):
+        """starts computing 'partial' or 'full' checksum of path in pool"""
+        key = (kind, path)
+        if key in self._submitted:
+            return
+        self._submitted.add(key)
+        if kind == 'partial':
+            result = self._pool.apply_async(self.createPartialChecksum,
+                                            (path, self.partialBlock, st.st_size))
+            self._pending[key] = (result, None)
+            self._partials.append((path, st, result))
+            return
+        if self.cache is not None:
+            checksum = self.cache.lookup(st)
+            if checksum is not None:
+                self._pending[key] = (_Done(checksum), None)
+                return
+        self._pending[key] = (self._pool.apply_async(self.createChecksum, (path,)), st)
+
+    def _promote(self):
+        """
+        Starts full checksums of files whose finished partial checksums
+        match partial checksum of another file of the same size.
+        """
+        waiting = []
+        for path, st, result in self._partials:
+            if not result.ready():
+                waiting.append((path, st, result))
+                continue
+            key = (st.st_size, result.get())
+            if key[1] is None:
+                continue
+            if key not in self._partialFirst:
+                self._partialFirst[key] = (path, st)
+            else:
+                firstPath, firstSt = self._partialFirst[key]
+                self._submit('full', firstPath, firstSt)
+                self._submit('full', path, st)
+        self._partials = waiting
+
+    def _prefetched(self, candidates):
+        """
+        Yields candidates unchanged, while checksums diskWalker is going to
+        need for them are computed ahead by worker pool, if there is one.
+        Decisions are still made in walk order, so results are the same.
+        """
+        if self._pool is None:
+            for item in candidates:
+                yield item
+            return
+        self._submitted = set()
+        self._partials = []
+        #: (size, partial checksum) -> (path, stat) of first file with it
+        self._partialFirst = {}
+        first = {}
+        window = deque()
+        for item in candidates:
+            path, _, st = item
+            if st.st_size in first:
+                if self._usesPartial(st.st_size):
+                    kind = 'partial'
+                else:
+                    kind = 'full'
+                firstPath, firstSt = first[st.st_size]
+                self._submit(kind, firstPath, firstSt)
+                self._submit(kind, path, st)
+            else:
+                first[st.st_size] = (path, st)
+            window.append(item)
+            self._promote()
+            if len(window) > self.jobs * 8:
+                yield window.popleft()
+        while window:
+            self._promote()
+            yield window.popleft()
+
+    def _candidateFor(self, path, st):
+        """
+        Returns FileRecord of earlier file path needs to be fully compared
+        with, or None if partial checksum proves it unique so far.
+        """
+        byteSize = st.st_size
+        first = self.byte_cache[byteSize]
+        if not self._usesPartial(byteSize):
+            return first
+        if first.partial is None:
+            #first size collision, partial checksum of original is needed too
+            first.partial = self._partialChecksum(first.path, byteSize)
+            self.partial_cache[(byteSize, first.partial)] = first
+        partial = self._partialChecksum(path, byteSize)
+        if partial is None:
+            return None
+        if (byteSize, partial) not in self.partial_cache:
+            st.partial = partial
+            self.partial_cache[(byteSize, partial)] = st
+            return None
+        return self.partial_cache[(byteSize, partial)]
+
+    @staticmethod
+    def convertSize(sizestr, default='MB'):
+        """
+        Convert file size from suffixed string to bytes.
+
+        Uses regex search to determine size multiplier.
+
+        :param sizestr: string like '1Mb', '32kb', '2' etc.
+        :returns: integer
+        :raises: ValueError
+
+        >>> cs = Liten.convertSize
+        >>> cs('1kb')
+        1024
+        >>> cs('233GB')
+        250181844992L
+        >>> cs('9')
+        9437184
+        >>> cs('345.5')
+        Traceback (most recent call last):
+            ...
+        ValueError: invalid literal for int() with base 10: '345.5'
+        """
+        patterns = {'BYTES': 1,
+                    'B':  1,
+                    'KB': 1024,
+                    'MB': 1048576,       # default
+                    'GB': 1073741824,
+                    'TB': 1099511627776}
+
+        #Detects File Size Type, Strip off Characters
+        filesize = sizestr.upper()
+        try:
+            for key in patterns:
+                mult = patterns[key]
+
+                if re.match(r"\d+%s$" % key, filesize):
+                    if LITEN_DEBUG_MODE:
+                        print(("Sizestr: %s Key: %s Size: %s Multiplier: %s" % \
+                               (sizestr, key, filesize, mult)))
+                    byteValue = int(filesize.rstrip(key)) * mult
+                    break
+            else:
+                byteValue = int(filesize.strip()) * patterns[default]
+        except ValueError as err:
+            if LITEN_DEBUG_MODE:
+                print(("Problem evaluating:", sizestr, Exception, err))
+            raise
+        return byteValue
+
+    def _prepare(self):
+        """
+        Converts size options to bytes and returns file size threshold.
+
+        :raises: UnboundLocalError
+        """
+        try:
+            byteSizeThreshold = self.convertSize(self.fileSize)
+        except ValueError as err:
+            print(err)
+            #Note this gets caught using optparse which is cleaner
+            raise UnboundLocalError
+        self.partialBlock = self.convertSize(str(self.partialSize or 0))
+        if LITEN_DEBUG_MODE == 1:
+            print(("File size threshold (in bytes) %s" % byteSizeThreshold))
+        self._links = {}
+        self._linkStats = {}
+        self._dirnames = {}
+        self.pathFilter = self._makePathFilter()
+        self.stats = ScanStats()
+        self.readLimiter = self.metadataLimiter = None
+        if self.maxReadRate:
+            self.readLimiter = TokenBucket(self.convertSize(str(self.maxReadRate)),
+                                           stats=self.stats,
+                                           counter='readThrottleSeconds')
+        if self.maxMetadataRate:
+            self.metadataLimiter = TokenBucket(self.maxMetadataRate, stats=self.stats,
+                                               counter='metadataThrottleSeconds')
+        self.reader = ChecksumReader(self.convertSize(str(self.blockSize)),
+                                     self.readMode, self.readLimiter, self.pageCache)
+        if self.cache is not None:
+            self._cacheCounts = (self.cache.hits, self.cache.misses)
+        if self.checkpointPath:
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = ScanJournal(self.checkpointPath, self._searchParams(),
+                                       self.resume, self.checkpointInterval)
+        return byteSizeThreshold
+
+    def _searchParams(self):
+        """options which decide what a search finds, kept in its journal"""
+        return {'spath': self.spath, 'fileSize': self.fileSize,
+                'pattern': self.pattern, 'include': self.include,
+                'exclude': self.exclude, 'excludeDirs': self.excludeDirs,
+                'hashName': self.hashName, 'partialSize': str(self.partialSize),
+                'shard': self.shard}
+
+    def _makePathFilter(self):
+        """compiles pattern, include, exclude and excludeDirs to PathFilter"""
+        include = list(self.include or [])
+        if self.pattern and self.pattern != '*':
+            include.insert(0, self.pattern)
+        return PathFilter(include, self.exclude, self.excludeDirs)
+
+    def _finishStats(self, duplicates=None):
+        """
+        Copies totals of search to stats and stops its clock. Journal of
+        the search is removed, it is complete.
+        """
+        if self.journal is not None:
+            self.journal.close(complete=True)
+            self.journal = None
+        stats = self.stats
+        stats.filesScanned = self.recordCount
+        if duplicates is not None:
+            stats.duplicates = duplicates
+        else:
+            stats.duplicates = self.dupNumber
+        stats.wastedBytes = self.wastedBytes
+        if self.cache is not None:
+            hits, misses = self._cacheCounts
+            stats.cacheHits = self.cache.hits - hits
+            stats.cacheMisses = self.cache.misses - misses
+        stats.finish()
+
+    def _printSummary(self, wasted, start):
+        """prints end of search report, wasted is size of duplicates in bytes"""
+        self.wastedBytes = wasted
+        print ("\n")
+        print ("LITEN REPORT: \n")
+        print(("Search Path:                 ", self.spath))
+        print(("Filtered For Pattern Match:  ", self.pattern))
+        if self.config:
+            print(("Used config file:            ",self.config))
+        print(("Checksum Algorithm:          ", self.hashName))
+        print(("Total Files Searched:        ", self.recordCount))
+        if self.cache is not None:
+            print(("Checksum Cache Hits:         ", self.cache.hits))
+        print(("Wasted Space in Duplicates:  ", wasted/1048576, " MB"))
+        print(("Hard Links Not Compared:     ",
+               sum(len(paths) - 1 for paths in self.hardlinkGroups())))
+        if self.partialBlock:
+            print(("Bytes Never Read:            ", self.bytesSkipped))
+        print(("Bytes Read:                  ", int(self.stats.bytesRead)))
+        if self.stats.errors:
+            print(("Errors:                      ", self.stats.errors))
+        if self.readLimiter or self.metadataLimiter:
+            print(("Throttled Seconds:           ", "read %.2f, metadata %.2f" % (
+                self.stats.readThrottleSeconds, self.stats.metadataThrottleSeconds)))
+        print(("Report Generated at:         ", self.reportPath))
+        print(("Stage Seconds:               ", ", ".join(
+            "%s %.2f" % (stage, self.stats.seconds[stage])
+            for stage in ScanStats.STAGES)))
+        print(("Search Time:                 ", "%.2f seconds\n" % (time.time() - start)))
+
+    def _progress(self):
+        """returns started ProgressReporter, None if it is disabled"""
+        if not (self.verbose and self.progressInterval):
+            return None
+        progress = ProgressReporter(self, self.progressInterval)
+        progress.start()
+        return progress
+
+    def run(self):
+        """searches for duplicates with engine selected by self.engine"""
+        if self.engine == 'grouped' or self.compare == 'bytes' or \
+                self.indexPath or self.catalogPath:
+            return self.groupWalker()
+        return self.diskWalker()
+
+    def iterDuplicates(self):
+        """
+        Walks Directory Tree Looking at Every File, while performing a
+        duplicate match algorithm, and yields DuplicateMatch for every file
+        equal to an earlier one as soon as it is found.
+
+        Algorithm:
+        This divides directory walk into doing either a more informed search
+        if byte in key repository, or appending byte_size to list and moving
+        to next file.  For a file that has a byte size that has been found
+        before, checksum of its first and last partialSize bytes is compared
+        with those of earlier files of that size.  A checksum is made
+        only when partial checksums match.  The checksum is then used as the
+        basis to determine duplicates.
+
+        Matches are not collected, only size and checksum indexes are kept.
+        When stream ends, dupNumber, recordCount, wastedBytes and
+        bytesSkipped hold totals of the search.
+
+        :raises: UnboundLocalError
+
+        >>> liten = Liten(spath='tests', fileSize='45bytes', verbose=False)
+        >>> sorted(os.path.basename(path) for match in liten.iterDuplicates()
+        ...        for path in (match.original, match.path))
+        ['testDocOne.txt', 'testDocTwo.txt']
+        """
+        #optional pdb Debug Mode
+        if __debug__:
+            if LITEN_DEBUG_MODE == 2:
+                pdb.set_trace()
+
+        byteSizeThreshold = self._prepare()
+        if self.verbose:
+            print(("Searching for dups over %s MB using %s checksum" %
+                   (int(byteSizeThreshold/1048576), self.hashName)))
+        self.dupNumber=0
+        self.recordCount=0
+        byte_count=0
+        #duplicates with several links, reclaimable only if all links are found
+        linked = []
+
+        candidates = self._candidates(byteSizeThreshold)
+        if self.jobs > 1:
+            self._pool = ThreadPool(self.jobs)
+        try:
+            for path, filep, st in self._prefetched(candidates):
+                byte_size = st.st_size
+                if byte_size not in self.byte_cache:
+                    self.byte_cache[byte_size] = st
+
+                else:
+                    #size matched, compare head and tail blocks first
+                    candidate = self._candidateFor(path, st)
+                    if candidate is None:
+                        continue
+
+                    if LITEN_DEBUG_MODE == 1:
+                        print(('Doing checksum on %s' % path))
+
+                    checksum = self._checksum(path, st)
+
+                    if checksum not in self.checksum_cache_key:
+                        if candidate.checksum is None:
+                            # save original file record in a checksum cache
+                            self._cacheChecksum(candidate,
+                                                self._checksum(candidate.path, candidate))
+
+                    #now original file checksum is 100% in checksum cache
+                    #recheck the condition
+                    if checksum not in self.checksum_cache_key:
+                        self._cacheChecksum(st, checksum)
+
+                    else: # yield a dupe record
+                        #accumulates bytes of duplicates found
+                        if st.st_nlink > 1:
+                            linked.append(st)
+                        else:
+                            byte_count += byte_size
+                        #accumulates a dupNumber record
+                        self.dupNumber += 1
+
+                        #grab original file from checksum_cache dict
+                        orig = self.checksum_cache_key[checksum]
+                        st.checksum = checksum
+                        st.dupNumber = self.dupNumber
+                        yield DuplicateMatch(checksum, byte_size,
+                                             orig.path, orig, path, st)
+        finally:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+            self._pending.clear()
+            self._submitted.clear()
+
+        if self.cache is not None:
+            self.cache.commit()
+
+        byte_count += sum(self._reclaimable(st) for st in linked)
+        self.wastedBytes = byte_count
+
+        #files rejected by partial checksum were read only partially
+        self.bytesSkipped = sum(size - 2 * self.partialBlock
+                                for (size, _), record in self.partial_cache.items()
+                                if record.checksum is None)
+        self._finishStats()
+
+    def diskWalker(self):
+        """
+        Finds duplicates with iterDuplicates(), writes them to report,
+        calls remove() action for each of them and prints summary.
+
+        :raises: UnboundLocalError
+
+        >> from liten import Liten
+        >>> Liten = Liten(spath='tests', verbose=False)
+        >>> Liten.diskWalker()
+        {}
+        >>> Liten.fileSize="45bytes"
+        >>> dupes = Liten.diskWalker()
+        >>> print(len(dupes))
+        2
+
+        """
+        #times directory walk
+        start = time.time()
+
+        report = None
+        if self.reportPath:
+            report = ReportWriter(self, self.reportPath)
+
+        #duplicates go to report, progress is shown by its own thread
+        progress = self._progress()
+        try:
+            for match in self.iterDuplicates():
+                started = _clock()
+                if report is not None:
+                    report.writeMatch(match)
+
+                #Execute remove() action from ActionMixin
+                self.handler.schedule(match.path, match.stat,
+                                      match.original, match.originalStat)
+
+                #records of original and duplicate, FileRecord can be read as dict
+                self.confirmed_dup_key[match.original] = match.originalStat
+                self.confirmed_dup_key[match.path] = match.stat
+                self.stats.addTime('report', _clock() - started)
+
+            with self.stats.timer('report'):
+                if report is not None:
+                    report.writeHardlinks()
+                    report.close()
+                self.handler.flush()
+            self.stats.finish()
+        finally:
+            if progress is not None:
+                progress.stop()
+
+        if self.verbose:
+            self._printSummary(self.wastedBytes, start)
+
+        return  self.confirmed_dup_key   #Note returns a dictionary of all duplicate records
+
+    def _digests(self, kind, members):
+        """
+        Returns 'partial' or 'full' checksums of FileRecord members in the
+        same order. Files are read in order of ReadScheduler scheduler,
+        inode order by default, by the worker pool if there is one.
+        """
+        digests = [None] * len(members)
+        todo = []
+        for i in self.scheduler.schedule(members):
+            st = members[i]
+            if kind == 'full' and self.cache is not None:
+                digests[i] = self.cache.lookup(st)
+                if digests[i] is not None:
+                    continue
+            todo.append(i)
+        if kind == 'partial':
+            job = lambda i: self.createPartialChecksum(members[i].path, self.partialBlock,
+                                                       members[i].st_size)
+        else:
+            job = lambda i: self.createChecksum(members[i].path)
+        if self._pool is not None:
+            results = self._pool.imap(job, todo)
+        else:
+            results = (job(i) for i in todo)
+        for i, digest in zip(todo, results):
+            digests[i] = digest
+            if kind == 'full' and self.cache is not None and digest is not None:
+                self.cache.store(members[i].path, members[i], digest)
+        return digests
+
+    def _splitGroups(self, kind, groups):
+        """
+        Splits lists of FileRecord members by their 'partial' or
+        'full' checksums. Returns list of (checksum, members) for subgroups
+        with two or more members. Groups of files too small for partial
+        checksum stage are passed through as they are.
+        """
+        split = []
+        members = []
+        for group in groups:
+            if kind == 'partial' and not self._usesPartial(group[1][0].st_size):
+                split.append(group)
+            else:
+                members.extend(group[1])
+        digests = self._digests(kind, members)
+        subgroups = {}
+        for member, digest in zip(members, digests):
+            if kind == 'partial':
+                member.partial = digest
+            else:
+                member.checksum = digest
+            if digest is not None:
+                subgroups.setdefault((member.st_size, digest), []).append(member)
+        for (size, digest), subgroup in subgroups.items():
+            if len(subgroup) > 1:
+                split.append((digest, subgroup))
+            elif kind == 'partial':
+                self.bytesSkipped += size - 2 * self.partialBlock
+        return split
+
+    def _compareGroups(self, groups):
+        """
+        Splits groups of FileRecord members by comparing their contents
+        with compareFiles(). Returns list of (None, members) for subgroups
+        of equal files.
+        """
+        order = self.scheduler.schedule([members[0] for _, members in groups])
+        groups = [groups[i] for i in order]
+        job = lambda group: self.compareFiles([record.path for record in group[1]],
+                                              self.reader.blockSize)
+        if self._pool is not None:
+            results = self._pool.imap(job, groups)
+        else:
+            results = (job(group) for group in groups)
+        split = []
+        for (_, members), equal in zip(groups, results):
+            for indexes in equal:
+                split.append((None, [members[i] for i in indexes]))
+        return split
+
+    def findDuplicateGroups(self):
+        """
+        Finds duplicates in two phases. First the whole tree is walked and
+        files are indexed by size. Then only sizes shared by two or more
+        files are checked, by partial checksum first and by full checksum
+        for files whose partial checksums match. With compare set to
+        'bytes' groups of up to compareLimit files are compared byte by
+        byte instead, and their DuplicateGroup has no checksum.
+
+        Returns list of DuplicateGroup with paths in walk order.
+
+        :raises: UnboundLocalError
+
+        >>> liten = Liten(spath='tests', fileSize='45bytes', verbose=False)
+        >>> groups = liten.findDuplicateGroups()
+        >>> [sorted(os.path.basename(path) for path in group.paths) for group in groups]
+        [['testDocOne.txt', 'testDocTwo.txt']]
+        """
+        byteSizeThreshold = self._prepare()
+        self.recordCount = 0
+        self.bytesSkipped = 0
+
+        #phase one, index candidates by size
+        sizes = {}
+        scanned = [] if self.catalogPath else None
+        for index, (path, _, st) in enumerate(self._candidates(byteSizeThreshold)):
+            st.index = index
+            sizes.setdefault(st.st_size, []).append(st)
+            if scanned is not None:
+                scanned.append(st)
+        groups = [(None, members) for members in sizes.values() if len(members) > 1]
+        del sizes
+        self.stats.bytesExpected = sum(members[0].st_size * len(members)
+                                       for _, members in groups)
+        indexed = None
+        if self.indexPath:
+            indexed = sorted((record for _, members in groups for record in members),
+                             key=lambda record: record.index)
+
+        #phase two, hash members of groups only
+        if self.jobs > 1:
+            self._pool = ThreadPool(self.jobs)
+        try:
+            groups = self._splitGroups('partial', groups)
+            self.stats.bytesExpected = self.stats.bytesRead + \
+                sum(members[0].st_size * len(members) for _, members in groups)
+            compared = []
+            if self.compare == 'bytes':
+                compared = self._compareGroups([group for group in groups
+                                                if len(group[1]) <= self.compareLimit])
+                groups = [group for group in groups
+                          if len(group[1]) > self.compareLimit]
+            groups = self._splitGroups('full', groups) + compared
+        finally:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+        if self.cache is not None:
+            self.cache.commit()
+
+        byIndex = lambda record: record.index
+        for checksum, members in groups:
+            members.sort(key=byIndex)
+            for record in members:
+                record.checksum = checksum
+        groups.sort(key=lambda group: group[1][0].index)
+        if indexed is not None:
+            links = [(self._linkStats[key], paths)
+                     for key, paths in self._links.items() if len(paths) > 1]
+            ShardIndex(self.shard or (0, 1), self.hashName).write(self.indexPath,
+                                                                  indexed, links)
+        if scanned is not None:
+            with self.stats.timer('report'):
+                catalog = LitenCatalog(self.catalogPath, self.hashName)
+                try:
+                    catalog.ingest(scanned, [self.spath] if isinstance(self.spath, str)
+                                            else self.spath)
+                finally:
+                    catalog.close()
+        self._finishStats(sum(len(members) - 1 for _, members in groups))
+        return [DuplicateGroup(checksum, members[0].st_size,
+                               [record.path for record in members], members)
+                for checksum, members in groups]
+
+    def _sizeWaste(self, groups):
+        """
+        Returns dict of size -> bytes wasted in its group, for lists of
+        equally sized FileRecords. Like findDuplicateGroups(), only files
+        whose partial checksums match are read in full.
+        """
+        waste = dict((members[0].st_size, 0) for members in groups)
+        split = self._splitGroups('partial', [(None, members) for members in groups])
+        for _, members in self._splitGroups('full', split):
+            waste[members[0].st_size] += members[0].st_size * (len(members) - 1)
+        return waste
+
+    def estimateWaste(self, sampleSize=1000, confidence=0.95, seed=None):
+        """
+        Estimates bytes wasted in duplicates, reading only a sample of
+        files. Whole tree is walked and files are indexed by size, as in
+        findDuplicateGroups(). Potential waste of a size group is its size
+        times members but one. Groups with over 1/sampleSize of total
+        potential are all measured, and sampleSize groups of the rest are
+        drawn at random. Their waste is scaled by ratio of measured to
+        potential waste of the sample. Confidence interval is that of a
+        ratio estimator, it holds for samples of a few hundred groups,
+        smaller samples give too narrow intervals.
+        Groups are measured by partial checksums, then full checksums of
+        files whose partial checksums match. Returns WasteEstimate.
+
+        :raises: UnboundLocalError, ValueError
+
+        >>> liten = Liten(spath='tests', fileSize='45bytes', verbose=False)
+        >>> liten.estimateWaste(seed=0)
+        WasteEstimate(wasted=45, low=45, high=45, confidence=0.95, groups=1, measured=1, potential=45)
+        """
+        if sampleSize < 1:
+            raise ValueError("sample size must be at least 1")
+        byteSizeThreshold = self._prepare()
+        self.recordCount = 0
+        self.bytesSkipped = 0
+
+        sizes = {}
+        for path, _, st in self._candidates(byteSizeThreshold):
+            sizes.setdefault(st.st_size, []).append(st)
+        groups = [members for members in sizes.values() if len(members) > 1]
+        del sizes
+        potential = lambda members: members[0].st_size * (len(members) - 1)
+        total = sum(potential(members) for members in groups)
+        census = [members for members in groups
+                  if potential(members) * sampleSize >= total]
+        rest = [members for members in groups
+                if potential(members) * sampleSize < total]
+        #sort, so one seed always draws the same groups
+        rest.sort(key=lambda members: members[0].st_size)
+        sample = random.Random(seed).sample(rest, min(sampleSize, len(rest)))
+        self.stats.bytesExpected = sum(members[0].st_size * len(members)
+                                       for members in census + sample)
+
+        if self.jobs > 1:
+            self._pool = ThreadPool(self.jobs)
+        try:
+            waste = self._sizeWaste(census + sample)
+            exact = sum(waste[members[0].st_size] for members in census)
+            measured = [(waste[members[0].st_size], potential(members))
+                        for members in sample]
+        finally:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+        if self.cache is not None:
+            self.cache.commit()
+
+        restPotential = total - sum(potential(members) for members in census)
+        wasted = low = high = float(exact)
+        if measured:
+            sampled = sum(p for _, p in measured)
+            ratio = sum(w for w, _ in measured) / float(sampled)
+            wasted = exact + ratio * restPotential
+            low = high = wasted
+            n, count = len(measured), len(rest)
+            if n < count:
+                if n > 1:
+                    residual = sum((w - ratio * p) ** 2 for w, p in measured) / (n - 1)
+                    #weighted by potential of all groups to that of sample
+                    weight = restPotential * n / float(count * sampled)
+                    margin = _tScore(confidence, n - 1) * weight * count * \
+                        math.sqrt((1 - n / float(count)) * residual / n)
+                    low = max(exact, wasted - margin)
+                    high = min(exact + restPotential, wasted + margin)
+                else:
+                    low, high = exact, exact + restPotential
+        self.wastedBytes = int(round(wasted))
+        self._finishStats(0)
+        return WasteEstimate(self.wastedBytes, int(low), int(math.ceil(high)),
+                             confidence, len(groups), len(census) + len(sample),
+                             total)
+
+    def groupWalker(self):
+        """
+        Finds duplicate groups with findDuplicateGroups(), writes them to
+        report, calls remove() action for all members but the first one and
+        prints summary. Returns list of DuplicateGroup.
+        """
+        start = time.time()
+        progress = self._progress()
+        try:
+            groups = self.findDuplicateGroups()
+            with self.stats.timer('report'):
+                self._reportGroups(groups)
+            self.stats.wastedBytes = self.wastedBytes
+            self.stats.finish()
+        finally:
+            if progress is not None:
+                progress.stop()
+
+        if self.verbose:
+            self._printSummary(self.wastedBytes, start)
+        return groups
+
+    def _reportGroups(self, groups):
+        """
+        Writes DuplicateGroups to report and calls remove() action for all
+        members but the first one, sets wastedBytes.
+        """
+        report = None
+        if self.reportPath:
+            report = ReportWriter(self, self.reportPath)
+        wasted = 0
+        for group in groups:
+            if report is not None:
+                report.writeGroup(group)
+            for path, st in zip(group.paths[1:], group.stats[1:]):
+                self.handler.schedule(path, st, group.paths[0], group.stats[0])
+            wasted += sum(self._reclaimable(st) for st in group.stats[1:])
+        if report is not None:
+            report.writeHardlinks()
+            report.close()
+        self.handler.flush()
+        self.wastedBytes = wasted
+
+    def mergeShards(self, indexPaths):
+        """
+        Merges index files written by all shards of a search with
+        mergeShardIndexes(), writes report and calls remove() action like
+        groupWalker() does. No file is read. Hard links found by shards are
+        counted and reported as in a search. Returns list of DuplicateGroup.
+
+        :raises: ValueError
+        """
+        start = time.time()
+        links = {}
+        self.hashName, groups = mergeShardIndexes(indexPaths, links)
+        self._links = dict((key, paths) for key, (_, paths) in links.items())
+        self._linkStats = dict((key, st) for key, (st, _) in links.items())
+        self._reportGroups(groups)
+        self.dupNumber = sum(len(group.paths) - 1 for group in groups)
+        self.recordCount = sum(len(group.paths) for group in groups)
+        if self.verbose:
+            self._printSummary(self.wastedBytes, start)
+        return groups
+
+class Inotify(object):
+    """
+    Minimal inotify(7) binding through ctypes, Linux only. Raises OSError
+    when inotify isn't available, LitenWatcher falls back to polling then.
+    """
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    #: events of files and directories LitenWatcher needs
+    MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+            IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+    _EVENT = struct.Struct('iIII')
 
-        self.spath = spath
-        self.reportPath = reportPath
-        self.config = config
-        self.fileSize = fileSize
-        self.pattern = pattern
-        self.verbose = verbose
-        #: first checksum only dict
-        self.checksum_cache_key = {}
-        self.checksum_cache_value = {}
-        self.confirmed_dup_key = {}
-        self.confirmed_dup_value = {}
-        self.byte_cache = {}
-        self.matches = []
-        if not handler:
-            self.handler = ActionsMixin()
-        else:
-            if not isinstance(handler, ActionsMixin):
-                raise TypeError("specified parameter is not ActionsMixin subclass")
-            self.handler = handler
+    def __init__(self):
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self._addWatch = libc.inotify_add_watch
+            self._rmWatch = libc.inotify_rm_watch
+            fd = libc.inotify_init()
+        except (OSError, AttributeError, TypeError):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        if fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self._addWatch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._ctypes = ctypes
+        self.fd = fd
+        #: watch descriptor -> directory path
+        self.watches = {}
 
-        self.dupNumber = 0
+    def addWatch(self, path):
+        """watches directory path, returns watch descriptor"""
+        wd = self._addWatch(self.fd, path, self.MASK)
+        if wd < 0:
+            error = self._ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.watches[wd] = path
+        return wd
 
-    def _cacheChecksum(self, path, checksum, byteSize, filep):
+    def read(self, timeout=None):
+        """
+        Waits up to timeout seconds for events, returns list of (path,
+        mask) of files or directories events are about. Path None with
+        IN_Q_OVERFLOW mask means events were lost.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & self.IN_IGNORED:
+                del self.watches[wd]
+                continue
+            events.append((os.path.join(directory, name) if name else directory, mask))
+        return events
 
-        checksum_cache_value = {'fullPath': path,
-                                    'checksum': checksum,
-                                    'modDate': self.makeCreateDate(path),
-                                    'dupNumber': self.dupNumber,
-                                    'searchDate': self.createSearchDate(),
-                                    'bytes': byteSize,
-                                    'fileType': None,
-                                    'fileExt': self.createExt(filep)}
+    def close(self):
+        os.close(self.fd)
 
-        self.checksum_cache_key[checksum]=checksum_cache_value
 
-    @staticmethod
-    def convertSize(sizestr, default='MB'):
-        """
-        Convert file size from suffixed string to bytes.
+class LitenWatcher(object):
+    """
+    Keeps a live duplicate index of search paths of liten. One full scan
+    indexes every file by size and hashes files of shared sizes, like
+    Liten does. Then changes reported by inotify, or found by polling
+    where inotify isn't available, update the index: only files created,
+    modified or moved in are read, and a file is hashed only when another
+    indexed file has its size. Every file found to equal an indexed one is
+    passed to callback as DuplicateMatch.
 
-        Uses regex search to determine size multiplier.
+    With inotify, work at steady state follows changes only. Polling has
+    to stat every file each interval, but it reads changed files only.
+    """
 
-        :param sizestr: string like '1Mb', '32kb', '2' etc.
-        :returns: integer
-        :raises: ValueError
+    def __init__(self, liten, callback=None, poll=False, interval=5.0):
+        self.liten = liten
+        self.callback = callback or (lambda match: None)
+        self.interval = interval
+        self.inotify = None
+        if not poll:
+            try:
+                self.inotify = Inotify()
+            except OSError:
+                self.inotify = None
+        #: path -> FileRecord of every indexed file
+        self.files = {}
+        #: size -> {path: FileRecord}
+        self.sizes = {}
+        #: (size, checksum) -> paths of files with it, original first
+        self.checksums = {}
+        #: (st_dev, st_ino) -> path of file indexed for the inode
+        self.inodes = {}
+        self._threshold = 0
 
-        >>> cs = Liten.convertSize
-        >>> cs('1kb')
-        1024
-        >>> cs('233GB')
-        250181844992L
-        >>> cs('9')
-        9437184
-        >>> cs('345.5')
-        Traceback (most recent call last):
-            ...
-        ValueError: invalid literal for int() with base 10: '345.5'
+    @property
+    def polling(self):
+        return self.inotify is None
+
+    def _roots(self):
+        if isinstance(self.liten.spath, str):
+            return [self.liten.spath]
+        return list(self.liten.spath)
+
+    def scan(self):
         """
-        patterns = {'BYTES': 1,
-                    'B':  1,
-                    'KB': 1024,
-                    'MB': 1048576,       # default
-                    'GB': 1073741824,
-                    'TB': 1099511627776}
+        Indexes all files of search paths and watches their directories.
+        Returns list of DuplicateGroup found.
+        """
+        liten = self.liten
+        self._threshold = liten._prepare()
+        self.files.clear()
+        self.sizes.clear()
+        self.checksums.clear()
+        self.inodes.clear()
+        records = []
+        for path, _, record in liten._candidates(self._threshold):
+            self._index(path, record)
+            records.append(record)
+        if self.inotify is not None:
+            for root in self._roots():
+                self._watchTree(root)
+        #in walk order, so originals are the files found first
+        for record in records:
+            if len(self.sizes[record.st_size]) > 1:
+                self._hash(record)
+        del records
+        groups = [DuplicateGroup(checksum, size, paths,
+                                 [self.files[path] for path in paths])
+                  for (size, checksum), paths in self.checksums.items()
+                  if len(paths) > 1]
+        groups.sort(key=lambda group: group.paths[0])
+        return groups
 
-        #Detects File Size Type, Strip off Characters
-        filesize = sizestr.upper()
+    def _watchTree(self, top):
+        """adds inotify watches for top and directories below it"""
+        stack = [top]
+        pathFilter = self.liten.pathFilter
+        while stack:
+            dirpath = stack.pop()
+            try:
+                self.inotify.addWatch(dirpath)
+            except OSError:
+                continue
+            stack.extend(path for path in _scanDir(dirpath, None, pathFilter)[1])
+
+    def _index(self, path, record):
+        """adds FileRecord to size index without hashing it"""
+        self.files[path] = record
+        self.sizes.setdefault(record.st_size, {})[path] = record
+        self.inodes[(record.st_dev, record.st_ino)] = path
+
+    def _hash(self, record):
+        """hashes record if not done yet, returns original it duplicates or None"""
+        if record.checksum is not None:
+            return None
+        checksum = self.liten._checksum(record.path, record)
+        if checksum is None:
+            return None
+        record.checksum = checksum
+        paths = self.checksums.setdefault((record.st_size, checksum), [])
+        paths.append(record.path)
+        if len(paths) > 1:
+            return self.files[paths[0]]
+        return None
+
+    def _unindex(self, path):
+        """drops file at path from all indexes"""
+        record = self.files.pop(path, None)
+        if record is None:
+            return
+        members = self.sizes.get(record.st_size)
+        if members is not None:
+            members.pop(path, None)
+            if not members:
+                del self.sizes[record.st_size]
+        key = (record.st_dev, record.st_ino)
+        if self.inodes.get(key) == path:
+            del self.inodes[key]
+        if record.checksum is not None:
+            paths = self.checksums.get((record.st_size, record.checksum), [])
+            if path in paths:
+                paths.remove(path)
+            if not paths:
+                self.checksums.pop((record.st_size, record.checksum), None)
+
+    def _unindexTree(self, top):
+        """drops every file below directory top, i.e. moved away"""
+        prefix = os.path.join(top, '')
+        for path in [path for path in self.files if path.startswith(prefix)]:
+            self._unindex(path)
+
+    def fileChanged(self, path, st=None):
+        """
+        Updates index for file at path, which was created or modified,
+        st is its stat result if known. Returns DuplicateMatch passed to
+        callback, or None.
+        """
         try:
-            for key in patterns:
-                mult = patterns[key]
+            if st is None:
+                st = os.stat(path)
+        except OSError:
+            self._unindex(path)
+            return None
+        if stat.S_ISDIR(st.st_mode):
+            return self._directoryAdded(path)
+        record = self.files.get(path)
+        if record is not None and record.st_size == st.st_size and \
+                record.st_mtime_ns == _mtimeNs(st) and record.st_ino == st.st_ino:
+            #already indexed, i.e. found in new directory before its event
+            return None
+        self._unindex(path)
+        liten = self.liten
+        name = os.path.basename(path)
+        if not stat.S_ISREG(st.st_mode) or st.st_size < self._threshold or \
+                not liten.pathFilter.matchFile(path, name):
+            return None
+        if (st.st_dev, st.st_ino) in self.inodes:
+            #another link to an indexed file
+            return None
+        record = liten._record(path, name, st)
+        self._index(path, record)
+        members = self.sizes[st.st_size]
+        if len(members) < 2:
+            return None
+        for other in list(members.values()):
+            if other is not record:
+                self._hash(other)
+        original = self._hash(record)
+        if original is None:
+            return None
+        liten.stats.add('duplicates')
+        match = DuplicateMatch(record.checksum, record.st_size, original.path,
+                               original, path, record)
+        self.callback(match)
+        return match
 
-                if re.match(r"\d+%s$" % key, filesize):
-                    if LITEN_DEBUG_MODE:
-                        print(("Sizestr: %s Key: %s Size: %s Multiplier: %s" % \
-                               (sizestr, key, filesize, mult)))
-                    byteValue = int(filesize.rstrip(key)) * mult
+    def fileRemoved(self, path):
+        """updates index for file or directory at path, which is gone"""
+        if path in self.files:
+            self._unindex(path)
+        else:
+            self._unindexTree(path)
+
+    def _directoryAdded(self, dirpath):
+        """indexes files of a new directory, returns last DuplicateMatch"""
+        if not self.liten.pathFilter.matchDir(dirpath):
+            return None
+        if self.inotify is not None:
+            self._watchTree(dirpath)
+        match = None
+        for path, _, _ in walkFiles(dirpath, 1, None, self.liten.pathFilter):
+            match = self.fileChanged(path) or match
+        return match
+
+    def poll(self, timeout=None):
+        """
+        Processes changes found within timeout seconds, once. Returns list
+        of DuplicateMatch found.
+        """
+        found = []
+        if self.inotify is None:
+            if timeout:
+                time.sleep(timeout)
+            self._pollTree(found)
+            return found
+        for path, mask in self.inotify.read(timeout):
+            if path is None:
+                #events were lost, index has to be rebuilt
+                self.scan()
+                continue
+            if mask & (Inotify.IN_DELETE | Inotify.IN_MOVED_FROM |
+                       Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF):
+                if not mask & (Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF) or \
+                        path in self._roots():
+                    self.fileRemoved(path)
+            elif mask & (Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO) or \
+                    mask & Inotify.IN_CREATE and mask & Inotify.IN_ISDIR:
+                match = self.fileChanged(path)
+                if match is not None:
+                    found.append(match)
+        return found
+
+    def _pollTree(self, found):
+        """finds changes by comparing stat of every file with index"""
+        seen = set()
+        pathFilter = self.liten.pathFilter
+        for root in self._roots():
+            for path, name, st in walkFiles(root, 1, None, pathFilter):
+                if st.st_size < self._threshold or not pathFilter.matchFile(path, name):
+                    continue
+                seen.add(path)
+                if path not in self.files and (st.st_dev, st.st_ino) in self.inodes:
+                    continue
+                match = self.fileChanged(path, st)
+                if match is not None:
+                    found.append(match)
+        for path in [path for path in self.files if path not in seen]:
+            self._unindex(path)
+
+    def watch(self, until=None):
+        """
+        Scans, then processes changes until until() returns True, or
+        forever.
+        """
+        self.scan()
+        while until is None or not until():
+            self.poll(self.interval)
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+
+#: random 32 bit value of every byte value for gear rolling hash, the same
+#: in every process and every run
+_GEAR = random.Random(0x6c6974656e).sample(xrange(1 << 32), 256)
+
+
+def _gearMask(bits):
+    """
+    Mask of gear hash bits that have to be zero at a chunk boundary. High
+    bits are taken, they depend on all of the last 32 bytes.
+    """
+    return ((1 << bits) - 1) << (32 - bits)
+
+
+def cdcChunks(data, minSize=2048, avgSize=8192, maxSize=65536):
+    """
+    Splits data into content defined chunks with gear rolling hash and
+    returns list of their lengths. A boundary depends only on the 32 bytes
+    just before it, so after an insertion or deletion the following chunks
+    are found again. Like FastCDC a stricter mask is used before avgSize
+    and a looser one after it, so chunk sizes stay close to avgSize.
+
+    Hash of every byte is computed by numpy in a few vector operations
+    where numpy is installed, otherwise by a loop over the bytes, which
+    is much slower; both find the same chunks.
+
+    >>> rng = random.Random(1)
+    >>> data = ''.join(chr(rng.randrange(256)) for _ in range(200000))
+    >>> lengths = cdcChunks(data)
+    >>> sum(lengths), min(lengths[:-1]) >= 2048, max(lengths) <= 65536
+    (200000, True, True)
+    >>> cdcChunks(data[:2000]), cdcChunks('')
+    ([2000], [])
+    """
+    if numpy is not None and len(data) > minSize:
+        return _cdcChunksVector(data, minSize, avgSize, maxSize)
+    gear = _GEAR
+    bits = avgSize.bit_length() - 1
+    strict = _gearMask(bits + 1)
+    loose = _gearMask(bits - 1)
+    view = bytearray(data)
+    size = len(view)
+    lengths = []
+    start = 0
+    while start < size:
+        end = min(start + maxSize, size)
+        if end - start <= minSize:
+            lengths.append(end - start)
+            break
+        normal = min(start + avgSize, end)
+        cut = end
+        #hash of the 31 bytes before first possible boundary, taken from
+        #the chunk before if minSize is shorter
+        h = 0
+        pos = max(0, start + minSize - 31)
+        while pos < start + minSize:
+            h = ((h << 1) + gear[view[pos]]) & 0xFFFFFFFF
+            pos += 1
+        while pos < normal:
+            h = ((h << 1) + gear[view[pos]]) & 0xFFFFFFFF
+            pos += 1
+            if not h & strict:
+                cut = pos
+                break
+        else:
+            while pos < end:
+                h = ((h << 1) + gear[view[pos]]) & 0xFFFFFFFF
+                pos += 1
+                if not h & loose:
+                    cut = pos
                     break
-            else:
-                byteValue = int(filesize.strip()) * patterns[default]
-        except ValueError as err:
-            if LITEN_DEBUG_MODE:
-                print(("Problem evaluating:", sizestr, Exception, err))
-            raise
-        return byteValue
+        lengths.append(cut - start)
+        start = cut
+    return lengths
 
-    def diskWalker(self):
-        """Walks Directory Tree Looking at Every File, while performing a
-        duplicate match algorithm.
 
-        Algorithm:
-        This divides directory walk into doing either a more informed search
-        if byte in key repository, or appending byte_size to list and moving
-        to next file.  A md5 checksum is made of any file that has a byte size
-        that has been found before.  The checksum is then used as the basis to
-        determine duplicates.
+def _cdcChunksVector(data, minSize, avgSize, maxSize):
+    """
+    cdcChunks() with numpy: gear hash of the 32 bytes ending at every
+    position is summed from shifted copies of the byte gear values, window
+    doubling each time, then positions where masks match are found by
+    searchsorted per chunk.
+    """
+    bits = avgSize.bit_length() - 1
+    hashes = numpy.array(_GEAR, dtype=numpy.uint32)[
+        numpy.frombuffer(data, dtype=numpy.uint8)]
+    shifted = numpy.empty_like(hashes)
+    #hash of 2 * width bytes ending at i is hash of width bytes ending at
+    #i plus hash of width bytes before them shifted by width
+    for width in (1, 2, 4, 8, 16):
+        numpy.left_shift(hashes[:-width], width, out=shifted[width:])
+        numpy.add(hashes[width:], shifted[width:], out=hashes[width:])
+    del shifted
+    #cut after byte i is possible where hash of bytes up to i matches, bits
+    #of loose mask are a part of those of strict one
+    looseCuts = numpy.flatnonzero(hashes & numpy.uint32(_gearMask(bits - 1)) == 0)
+    strictCuts = looseCuts[hashes[looseCuts] & numpy.uint32(_gearMask(bits + 1)) == 0] + 1
+    looseCuts += 1
+    del hashes
+    size = len(data)
+    lengths = []
+    start = 0
+    while start < size:
+        end = min(start + maxSize, size)
+        if end - start <= minSize:
+            lengths.append(end - start)
+            break
+        normal = min(start + avgSize, end)
+        cut = end
+        i = strictCuts.searchsorted(start + minSize + 1)
+        if i < len(strictCuts) and strictCuts[i] <= normal:
+            cut = int(strictCuts[i])
+        else:
+            i = looseCuts.searchsorted(normal + 1)
+            if i < len(looseCuts) and looseCuts[i] <= end:
+                cut = int(looseCuts[i])
+        lengths.append(cut - start)
+        start = cut
+    return lengths
 
-        :raises: UnboundLocalError
 
-        >> from liten import Liten
-        >>> Liten = Liten(spath='tests', verbose=False)
-        >>> Liten.diskWalker()
-        {}
-        >>> Liten.fileSize="45bytes"
-        >>> dupes = Liten.diskWalker()
-        >>> print(len(dupes))
-        2
+#: ChecksumReader of BlockDedupAnalysis worker process
+_chunkReader = None
+
+
+def _chunkWorkerReader(blockSize, mode, rate, pageCache):
+    """
+    Makes ChecksumReader for _chunkSpan(), held to rate bytes per second
+    if rate isn't None. Its TokenBucket has no ScanStats, seconds waited
+    are returned by _chunkSpan() instead.
+    """
+    limiter = None
+    if rate:
+        limiter = TokenBucket(rate)
+    return ChecksumReader(blockSize, mode, limiter, pageCache)
+
+
+def _initChunkWorker(blockSize, mode, rate, pageCache):
+    """sets up _chunkReader of worker process"""
+    global _chunkReader
+    _chunkReader = _chunkWorkerReader(blockSize, mode, rate, pageCache)
 
+
+def _chunkSpan(span, reader=None):
+    """
+    Reads span (path, offset, length, checksum algorithm name, chunk sizes)
+    with reader, _chunkReader by default, and returns (path, offset, list
+    of (digest, length) of its chunks, seconds waited for read rate), or
+    None instead of the list if the file can't be read. Runs in worker
+    processes of BlockDedupAnalysis.
+    """
+    path, offset, length, hashName, sizes = span
+    if reader is None:
+        reader = _chunkReader
+    limiter = reader.limiter
+    throttled = limiter.throttled if limiter is not None else 0.0
+    try:
+        data = reader.read(path, offset, length)
+    except EnvironmentError:
+        return path, offset, None, 0.0
+    if limiter is not None:
+        throttled = limiter.throttled - throttled
+    algorithm = HASH_ALGORITHMS[hashName]
+    view = memoryview(data)
+    chunks = []
+    position = 0
+    for chunkLength in cdcChunks(data, *sizes):
+        chunks.append((algorithm(view[position:position + chunkLength]).digest(),
+                       chunkLength))
+        position += chunkLength
+    return path, offset, chunks, throttled
+
+
+class ChunkIndex(object):
+    """
+    Reference count and size of every chunk seen by BlockDedupAnalysis. It
+    is kept in a SQLite database, a temporary file unless filep is given,
+    so memory stays bounded whatever number of chunks the input has.
+
+    >>> index = ChunkIndex(':memory:')
+    >>> index.add([('a', 10), ('b', 20)]), index.add([('b', 20), ('b', 20)])
+    (0, 40)
+    >>> index.totals()
+    (2, 30, 70)
+    >>> index.close()
+    """
+
+    def __init__(self, filep=None):
+        self._temporary = None
+        if filep is None:
+            fd, filep = tempfile.mkstemp(prefix='liten-chunks-', suffix='.db')
+            os.close(fd)
+            self._temporary = filep
+        self.filep = filep
+        self.conn = sqlite3.connect(filep)
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS chunks (
+                                digest BLOB PRIMARY KEY,
+                                refs INTEGER,
+                                size INTEGER)""")
+        self.conn.commit()
+
+    def add(self, chunks):
         """
-        #optional pdb Debug Mode
-        if __debug__:
-            if LITEN_DEBUG_MODE == 2:
-                pdb.set_trace()
+        Counts (digest, length) chunks, returns bytes of chunks which were
+        seen before and would be stored only once. Chunks are counted in
+        memory first, then digests already in index are looked up and
+        updated, and new ones inserted, in batches.
+        """
+        saved = 0
+        #: digest -> [references, length]
+        counts = {}
+        for digest, length in chunks:
+            if digest in counts:
+                counts[digest][0] += 1
+                saved += length
+            else:
+                counts[digest] = [1, length]
+        digests = list(counts)
+        known = set()
+        for start in range(0, len(digests), 500):
+            batch = [sqlite3.Binary(digest) for digest in digests[start:start + 500]]
+            known.update(str(row[0]) for row in self.conn.execute(
+                "SELECT digest FROM chunks WHERE digest IN (%s)" %
+                ','.join('?' * len(batch)), batch))
+        saved += sum(counts[digest][1] for digest in known)
+        self.conn.executemany("UPDATE chunks SET refs = refs + ? WHERE digest = ?",
+                              [(counts[digest][0], sqlite3.Binary(digest))
+                               for digest in known])
+        self.conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)",
+                              [(sqlite3.Binary(digest), refs, length)
+                               for digest, (refs, length) in counts.items()
+                               if digest not in known])
+        return saved
 
-        #Local Variables
-        report = csv.writer(open(self.reportPath, 'wb'), dialect='excel-tab')
-        #  write header
-        report.writerow("Path Size ModDate".split())
+    def totals(self):
+        """returns (unique chunks, bytes stored once, bytes of all references)"""
+        count, unique, total = self.conn.execute(
+            "SELECT COUNT(*), SUM(size), SUM(size * refs) FROM chunks").fetchone()
+        return count, unique or 0, total or 0
 
-        if isinstance(self.spath, str):
-            main_path = os.walk(self.spath)
-        else:
-            main_path = chain(*list(map(os.walk, self.spath)))
-        try:
-            byteSizeThreshold = self.convertSize(self.fileSize)
-        except ValueError as err:
-            print(err)
-            #Note this gets caught using optparse which is cleaner
-            raise UnboundLocalError
-        if LITEN_DEBUG_MODE == 1:
-            print(("File size threshold (in bytes) %s" % byteSizeThreshold))
-        self.dupNumber=0
-        byte_count=0
-        record_count=0
+    def commit(self):
+        self.conn.commit()
 
-        #times directory walk
-        start = time.time()
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+        if self._temporary is not None:
+            os.remove(self._temporary)
 
-        if self.verbose:
-            print(("Printing dups over %s MB using md5 checksum: \
-            [SIZE] [ORIG] [DUP] " % int(byteSizeThreshold/1048576)))
-
-        for root, _, files in main_path:
-            for filep in files:
-                path = os.path.join(root,filep)      #establishes full path
-                if os.path.isfile(path):            #ignores symbolic links
-                    byte_size = os.path.getsize(path)
-                    #gets number of file examined
-                    record_count += 1
-                    #File Size, Pattern Filter Section
-                    if byte_size >= byteSizeThreshold:
-                        if fnmatch(path, self.pattern):         #default * match
-                            if LITEN_DEBUG_MODE == 1:
-                                print(("Matches: %s" % path))
-
-                            if byte_size not in self.byte_cache:
-                                self.byte_cache[byte_size] = {
-                                    'path':path,
-                                    'checksum':None
-                                }
-
-                            else:
-                                #size matched, process checksums for a given file size
-
-                                if LITEN_DEBUG_MODE == 1:
-                                    print(('Doing checksum on %s' % path))
-
-                                checksum = self.createChecksum(path)
-
-                                if checksum not in self.checksum_cache_key:
-                                    orig_path = self.byte_cache[byte_size]['path']
-                                    orig_checksum = self.byte_cache[byte_size]['checksum']
-
-                                    if orig_checksum is None:
-                                        # save original file checksum in byte cache
-                                        orig_checksum = \
-                                            self.byte_cache[byte_size]['checksum'] = \
-                                                self.createChecksum(orig_path)
-
-                                        # save original file record in a checksum cache
-                                        self._cacheChecksum(orig_path, orig_checksum,
-                                                                byte_size,
-                                                                filep)
-
-                                #now original file checksum is 100% in checksum cache
-                                #recheck the condition
-                                if checksum not in self.checksum_cache_key:
-                                    self._cacheChecksum(path, checksum, byte_size, filep)
-
-                                else: # fill a dupe record
-                                    #accumulates bytes of duplicates found
-                                    byte_count += byte_size
-                                    #accumulates a dupNumber record
-                                    self.dupNumber += 1
-
-                                    #since we have a match, creating record with match partner
-                                    #and printing match original.
-                                    #grab original file path from checksum_cache dict
-
-                                    orig_path = self.checksum_cache_key[checksum]['fullPath']
-                                    orig_mod_date = self.checksum_cache_key[checksum]['modDate']
-                                    if self.verbose:
-                                        print((byte_size/1048576, "MB ", "ORIG: ",\
-                                        orig_path, "DUPE: ", path))
-
-                                    #Write separator and original line
-                                    report.writerow("")
-                                    report.writerow([orig_path,
-                                        "%d MB" % (byte_size/1048576), orig_mod_date])
-
-                                    #Gets Duplicates Modification Date
-                                    dupeModDate = self.makeCreateDate(path)
-
-                                    #Write duplicate line
-                                    report.writerow([path,
-                                        "%d MB" % (byte_size/1048576), dupeModDate])
-
-                                    #Execute remove() action from ActionMixin
-                                    self.handler.remove(path)
-
-                                    #Note this is a good spot for the dup rec count
-                                    self.confirmed_dup_key[orig_path] = self.checksum_cache_value
-
-                                    #setrecord for duplicate match stored
-                                    #duplicate code clean up later.
-                                    confirmed_dup_value = {'fullPath': path,
-                                                            'modDate': dupeModDate,
-                                                            'dupNumber': self.dupNumber,
-                                                            'searchDate': self.createSearchDate(),
-                                                            'checksum': checksum,
-                                                            'bytes': byte_size,
-                                                            'fileType': None,
-                                                            'fileExt': self.createExt(filep)}
-                                    self.confirmed_dup_key[path]=confirmed_dup_value
 
+#: block level savings of files directly in directory
+DirectorySavings = namedtuple('DirectorySavings', 'directory files bytes saved')
 
-        if self.verbose:
-            print ("\n")
-            print ("LITEN REPORT: \n")
-            print(("Search Path:                 ", self.spath))
-            print(("Filtered For Pattern Match:  ", self.pattern))
-            if self.config:
-                print(("Used config file:            ",self.config))
-            print(("Total Files Searched:        ", record_count))
-            print(("Wasted Space in Duplicates:  ", byte_count/1048576, " MB"))
-            print(("Report Generated at:         ", self.reportPath))
-            #get finish time
-            end = time.time()
-            timer = end - start
-            timer = int(timer/60)
-            print(("Search Time:                 ", timer, " minutes\n"))
 
-        return  self.confirmed_dup_key   #Note returns a dictionary of all duplicate records
+class BlockDedupAnalysis(object):
+    """
+    Estimates savings of block level deduplication for capacity planning.
+    Files matched by liten are cut into content defined chunks of about
+    avgSize bytes (see cdcChunks()), every chunk is hashed with checksum
+    algorithm of liten and counted in ChunkIndex. Bytes of every chunk seen
+    before are saveable and credited to directory of the file, so files
+    sharing most of their content, like VM images or dumps, count even if
+    whole file checksums differ.
+
+    Files are read in spans of at most spanSize bytes, chunked in parallel
+    by a pool of processes. A chunk boundary is forced at the end of every
+    span, which costs a chunk or two per span and bounds memory of workers.
+    Results are consumed in walk order, so numbers are the same with any
+    number of processes. Workers read with block size, read rate and page
+    cache mode of liten, every one of them at an equal share of the rate.
+    """
+
+    def __init__(self, liten, processes=None, avgSize=8192,
+                 spanSize=16777216, indexPath=None):
+        self.liten = liten
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        #: minimum, average and maximum chunk size
+        self.sizes = (avgSize // 4, avgSize, avgSize * 8)
+        self.spanSize = spanSize
+        #: ChunkIndex database kept for later inspection, temporary if None
+        self.indexPath = indexPath
+        #: (unique chunks, bytes stored once, bytes of all references)
+        self.totals = (0, 0, 0)
+
+    def _spans(self, byteSizeThreshold):
+        """yields spans of files matched by liten for _chunkSpan()"""
+        for path, _, st in self.liten._candidates(byteSizeThreshold):
+            for offset in range(0, st.st_size, self.spanSize):
+                yield (path, offset, min(self.spanSize, st.st_size - offset),
+                       self.liten.hashName, self.sizes)
+
+    def _readerArgs(self, processes):
+        """arguments of _chunkWorkerReader() for one of processes workers"""
+        liten = self.liten
+        rate = None
+        if liten.readLimiter is not None:
+            rate = liten.readLimiter.rate / processes
+        return (liten.reader.blockSize, liten.reader.mode, rate, liten.reader.pageCache)
+
+    def _chunked(self, pool, spans):
+        """yields results of _chunkSpan() in order, a window ahead in pool"""
+        if pool is None:
+            reader = _chunkWorkerReader(*self._readerArgs(1))
+            for span in spans:
+                yield _chunkSpan(span, reader)
+            return
+        window = deque()
+        for span in spans:
+            window.append(pool.apply_async(_chunkSpan, (span,)))
+            if len(window) > self.processes * 2:
+                yield window.popleft().get()
+        while window:
+            yield window.popleft().get()
+
+    def run(self):
+        """
+        Chunks all files, returns list of DirectorySavings with most
+        saveable bytes first.
+
+        :raises: UnboundLocalError
+        """
+        liten = self.liten
+        byteSizeThreshold = liten._prepare()
+        liten.recordCount = 0
+        stats = liten.stats
+        directories = {}
+        index = ChunkIndex(self.indexPath)
+        pool = None
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes, _initChunkWorker,
+                                        self._readerArgs(self.processes))
+        try:
+            for path, offset, chunks, throttled in self._chunked(
+                    pool, self._spans(byteSizeThreshold)):
+                stats.add('readThrottleSeconds', throttled)
+                if chunks is None:
+                    stats.errors += 1
+                    continue
+                files, total, saved = directories.get(os.path.dirname(path), (0, 0, 0))
+                length = sum(chunkLength for _, chunkLength in chunks)
+                with stats.timer('hash'):
+                    saved += index.add(chunks)
+                    index.commit()
+                stats.bytesRead += length
+                if offset == 0:
+                    files += 1
+                    stats.filesHashed += 1
+                directories[os.path.dirname(path)] = (files, total + length, saved)
+            self.totals = index.totals()
+        finally:
+            if pool is not None:
+                pool.terminate()
+            index.close()
+        liten._finishStats(0)
+        results = [DirectorySavings(directory, *counts)
+                   for directory, counts in directories.items()]
+        results.sort(key=lambda result: (-result.saved, result.directory))
+        return results
+
+    def writeReport(self, reportPath, results):
+        """writes DirectorySavings to tab separated CSV report"""
+        f = open(reportPath, 'wb')
+        try:
+            report = csv.writer(f, dialect='excel-tab')
+            report.writerow("Directory Files Bytes Saveable Percent".split())
+            for result in results:
+                report.writerow([result.directory, result.files, result.bytes,
+                                 result.saved,
+                                 "%.1f" % (100.0 * result.saved / (result.bytes or 1))])
+        finally:
+            f.close()
+
 
 class ProcessConfig(object):
     """
@@ -604,25 +4265,55 @@ class ProcessConfig(object):
                 size = None
         return path, size, pattern
 
+    def readFilters(self):
+        """
+        Reads include, exclude and exclude-dir options of config file, one
+        pattern per line, and returns them as dict of lists with keys
+        include, exclude and excludeDirs, like Liten parameters.
+        """
+        Config = ConfigParser.ConfigParser()
+        Config.read(self.filep)
+        filters = {'include': [], 'exclude': [], 'excludeDirs': []}
+        for section in Config.sections():
+            for option, key in (('include', 'include'), ('exclude', 'exclude'),
+                                ('exclude-dir', 'excludeDirs')):
+                if Config.has_option(section, option):
+                    filters[key].extend(line.strip() for line in
+                                        Config.get(section, option, raw=True).splitlines()
+                                        if line.strip())
+        return filters
+
 class LitenController(object):
     """
     Controller for DiskStat Command Line Tool.
     Handles optionparser parameters and setup.
     """
-    def run(self):
-        """Run method for Class"""
+    def run(self, args=None):
+        """Run method for Class, args are command line arguments"""
 
         #optional pdb Debug Mode
         if __debug__:
             if LITEN_DEBUG_MODE == 2:
                 pdb.set_trace()
 
+        if args is None:
+            args = sys.argv[1:]
+        if args[:1] == ['merge']:
+            return self.merge(args[1:])
+        if args[:1] == ['watch']:
+            return self.watch(args[1:])
+        if args[:1] == ['query']:
+            return self.query(args[1:])
+
         descriptionMessage = "A command line tool for detecting duplicates using md5 checksums."
 
         p = optparse.OptionParser(description=descriptionMessage,
                                     prog='liten',
                                     version='liten %s' % __version__,
-                                    usage= '%prog [options] [starting dir1] [dir2] ...')
+                                    usage= '%prog [options] [starting dir1] [dir2] ...\n'
+                                    '       %prog merge [options] index1 index2 ...\n'
+                                    '       %prog watch [options] dir1 [dir2] ...\n'
+                                    '       %prog query [options] catalog')
         p.add_option('--size', '-s',
                     help='minimum file size, example:  10bytes, 10KB, 10MB, 10GB, 10TB '
                     '(no suffix means MB)',
@@ -630,18 +4321,125 @@ class LitenController(object):
         p.add_option('--pattern', '-p',
                     help='pattern match examples: *.txt, *.iso, music[0-5].mp3',
                     default='*')
+        p.add_option('--include', action='append', metavar='PATTERN',
+                    help='search only files matching glob or re:regex, may be repeated')
+        p.add_option('--exclude', action='append', metavar='PATTERN',
+                    help='skip files matching glob or re:regex, may be repeated')
+        p.add_option('--exclude-dir', action='append', metavar='PATTERN',
+                    help='do not walk into directories matching glob or re:regex, '
+                    'i.e. .git, may be repeated')
         p.add_option('--report', '-r',
                     help='path to store duplicate report (./LitenDuplicateReport.csv by default)',
                     default='LitenDuplicateReport.csv')
         p.add_option('--delete', '-d', action="store_true",
                     help='DELETES all duplicate matches permanently!',default=False)
+        p.add_option('--dry-run', action="store_true",
+                    help='with --delete, only show what would be deleted',
+                    default=False)
+        p.add_option('--action-jobs', type='int', metavar='N',
+                    help='number of threads deleting files after search (1)',
+                    default=1)
         p.add_option('--config', '-c', help='specify path to config file')
         p.add_option('--quiet', '-q', action="store_true",
                     help='suppress all screen output except errors',
                     default=False)
+        p.add_option('--partial-size',
+                    help='size of head and tail blocks compared before full checksum, '
+                    '0 disables (4KB by default)',
+                    default='4KB')
+        p.add_option('--jobs', '-j', type='int',
+                    help='number of threads computing checksums (1 by default)',
+                    default=1)
+        p.add_option('--walk-jobs', type='int',
+                    help='number of threads reading directories (1 by default)',
+                    default=1)
+        p.add_option('--concurrency', type='int', metavar='N',
+                    help='keep N directory reads, stats and checksums in flight, '
+                    'for network filesystems (0, off by default)',
+                    default=0)
+        p.add_option('--engine', choices=['classic', 'grouped'],
+                    help='search engine: classic (default) or grouped',
+                    default='classic')
+        p.add_option('--hash', choices=sorted(HASH_ALGORITHMS),
+                    help='checksum algorithm: %s (md5 by default)'
+                    % ', '.join(sorted(HASH_ALGORITHMS)),
+                    default='md5')
+        p.add_option('--bench-hash', action="store_true",
+                    help='measure speed of checksum algorithms and exit',
+                    default=False)
+        p.add_option('--block-size',
+                    help='read buffer size for checksums (1MB by default)',
+                    default='1MB')
+        p.add_option('--read-mode', choices=list(ChecksumReader.MODES),
+                    help='read files with read (default) or mmap',
+                    default='read')
+        p.add_option('--bench-io', metavar='FILE',
+                    help='measure checksum speed of FILE for read modes and block sizes')
+        p.add_option('--bench-memory', action="store_true",
+                    help='measure memory used per tracked file and exit',
+                    default=False)
+        p.add_option('--estimate', action="store_true",
+                    help='estimate wasted space from a random sample of size groups, '
+                    'without report', default=False)
+        p.add_option('--sample-size', type='int', metavar='N', default=1000,
+                    help='size groups read by --estimate (1000)')
+        p.add_option('--confidence', type='float', default=0.95,
+                    help='confidence level of --estimate interval (0.95)')
+        p.add_option('--seed', type='int', help='random seed of --estimate sample')
+        p.add_option('--block-dedup', action="store_true",
+                    help='instead of searching for duplicates, estimate savings of '
+                    'block level dedup per directory, written to report',
+                    default=False)
+        p.add_option('--chunk-size',
+                    help='average chunk size of --block-dedup (8KB)', default='8KB')
+        p.add_option('--processes', type='int', metavar='N',
+                    help='processes chunking files for --block-dedup (number of cores)')
+        p.add_option('--compare', choices=['hash', 'bytes'],
+                    help='confirm duplicates by hash (default) or by comparing bytes',
+                    default='hash')
+        p.add_option('--compare-limit', type='int',
+                    help='largest group compared by bytes, larger are hashed (8)',
+                    default=8)
+        p.add_option('--cache',
+                    help='path to SQLite database used to keep checksums between runs')
+        p.add_option('--cache-vacuum', action="store_true",
+                    help='evict checksums of changed or missing files from --cache',
+                    default=False)
+        p.add_option('--shard', metavar='i/N',
+                    help='search only files whose size modulo N is i and write '
+                    'index for "liten merge"')
+        p.add_option('--index', metavar='PATH',
+                    help='path of shard index (./LitenShard-i-of-N.idx by default)')
+        p.add_option('--read-order', choices=ReadScheduler.ORDERS, default='inode',
+                    help='order grouped engine reads files in: walk, inode (default) '
+                    'or physical, by first extent from FIEMAP')
+        p.add_option('--max-read-rate', metavar='SIZE',
+                    help='most bytes read from files per second, example: 20MB')
+        p.add_option('--max-iops', type='int', metavar='N',
+                    help='most directory listings and stat calls per second')
+        p.add_option('--page-cache', choices=ChecksumReader.PAGE_CACHE_MODES,
+                    help='keep (default) or drop pages of files read from page '
+                    'cache with posix_fadvise', default='keep')
+        p.add_option('--checkpoint', metavar='PATH',
+                    help='journal progress of search to PATH, removed when search '
+                    'completes (./LitenCheckpoint.journal with --resume)')
+        p.add_option('--checkpoint-interval', type='float', metavar='SECONDS',
+                    help='seconds between syncs of --checkpoint journal (5)',
+                    default=5.0)
+        p.add_option('--resume', action="store_true",
+                    help='continue search killed before from its --checkpoint journal',
+                    default=False)
+        p.add_option('--catalog', metavar='PATH',
+                    help='SQLite catalog of searched files and checksums, '
+                    'queried with "liten query"')
+        p.add_option('--progress-interval', type='float', metavar='SECONDS',
+                    help='seconds between progress lines on stderr, 0 disables them (1)',
+                    default=1.0)
+        p.add_option('--stats-json', metavar='PATH',
+                    help='write counters and stage timers of search to PATH as JSON')
         p.add_option('--test', '-t', action="store_true",help='run doctests')
 
-        options, arguments = p.parse_args()
+        options, arguments = p.parse_args(args)
 
         if options.quiet:
             verbose = False
@@ -653,6 +4451,65 @@ class LitenController(object):
             _test(verbose)
             sys.exit(0)
 
+        if options.bench_hash:
+            print("Algorithm    MB/s")
+            for name, speed in benchHashes():
+                print(("%-12s %.1f" % (name, speed)))
+            sys.exit(0)
+
+        if options.bench_io:
+            print("Cache  Mode  BlockSize  MB/s")
+            for cache, mode, blockSize, speed in benchReads(options.bench_io,
+                                                            hashName=options.hash):
+                print(("%-6s %-5s %-10s %.1f" % (cache, mode, blockSize, speed)))
+            sys.exit(0)
+
+        if options.bench_memory:
+            before, after = benchMemory(100000)
+            print(("Bytes per file with dict records:  %.1f" % before))
+            print(("Bytes per file with FileRecord:    %.1f" % after))
+            sys.exit(0)
+
+        if options.cache_vacuum and not options.cache:
+            p.error("--cache-vacuum requires --cache")
+
+        if options.max_read_rate:
+            try:
+                Liten.convertSize(options.max_read_rate)
+            except ValueError as err:
+                p.error("invalid --max-read-rate: %s" % err)
+        if options.max_iops is not None and options.max_iops < 1:
+            p.error("--max-iops must be at least 1")
+
+        if options.resume and not options.checkpoint:
+            options.checkpoint = 'LitenCheckpoint.journal'
+        if options.checkpoint and options.concurrency:
+            p.error("--checkpoint can't be used with --concurrency")
+
+        shard = None
+        if options.shard:
+            try:
+                shard = ShardIndex.parseShard(options.shard)
+            except ValueError as err:
+                p.error(str(err))
+            if options.compare == 'bytes':
+                p.error("--shard needs checksums, it can't be used with --compare=bytes")
+            if not options.index:
+                options.index = "LitenShard-%d-of-%d.idx" % shard
+            if options.catalog:
+                p.error("--catalog can't be used with --shard")
+        if options.catalog and options.compare == 'bytes':
+            p.error("--catalog needs checksums, it can't be used with --compare=bytes")
+
+        #vacuum only, without search
+        if options.cache_vacuum and not (arguments or options.config):
+            cache = ChecksumCache(options.cache, options.hash)
+            evicted = cache.vacuum()
+            cache.close()
+            if verbose:
+                print(("Evicted %s stale checksums from %s" % (evicted, options.cache)))
+            sys.exit(0)
+
         if options.config:
             if __debug__:
                 if LITEN_DEBUG_MODE == 2:
@@ -666,11 +4523,41 @@ class LitenController(object):
                 pattern = config[2]
                 print(("Using %s, path=%s, size=%s, pattern=%s" % \
                         (options.config, path,size, pattern)))
+                filters = process.readFilters()
                 start = Liten(spath = path,
                             fileSize = size,
                             pattern = pattern,
-                            config = options.config)
-                start.diskWalker()
+                            include = filters['include'] + (options.include or []),
+                            exclude = filters['exclude'] + (options.exclude or []),
+                            excludeDirs = filters['excludeDirs'] +
+                                          (options.exclude_dir or []),
+                            config = options.config,
+                            cachePath = options.cache,
+                            partialSize = options.partial_size,
+                            jobs = options.jobs,
+                            walkJobs = options.walk_jobs,
+                            engine = options.engine,
+                            hashName = options.hash,
+                            blockSize = options.block_size,
+                            readMode = options.read_mode,
+                            compare = options.compare,
+                            compareLimit = options.compare_limit,
+                            progressInterval = options.progress_interval,
+                            shard = shard,
+                            indexPath = options.index,
+                            catalogPath = options.catalog,
+                            checkpointPath = options.checkpoint,
+                            checkpointInterval = options.checkpoint_interval,
+                            resume = options.resume,
+                            maxReadRate = options.max_read_rate,
+                            maxMetadataRate = options.max_iops,
+                            pageCache = options.page_cache,
+                            readOrder = options.read_order,
+                            concurrency = options.concurrency)
+                start.run()
+                if options.stats_json:
+                    start.stats.write(options.stats_json)
+                _vacuumCache(start, options.cache_vacuum, verbose)
                 sys.exit(0)
             except ConfigParser.Error as err:
                 print(("Problem parsing config file: %s" % options.config))
@@ -684,17 +4571,61 @@ class LitenController(object):
                     % arg))
                     sys.exit(1)
             try:
-                if options.delete:
-                    actions_handler = ActionsAutomatic()
+                if options.block_dedup:
+                    self.blockDedup(options, arguments, verbose)
+                    sys.exit(0)
+                if options.estimate:
+                    self.estimate(options, arguments, verbose)
+                    sys.exit(0)
+                if options.delete or options.dry_run:
+                    #deletions wait for the end of search
+                    actions_handler = ActionsQueued(ActionsAutomatic(),
+                                                    jobs=options.action_jobs,
+                                                    dryrun=options.dry_run,
+                                                    verbose=verbose)
                 else:
                     actions_handler = ActionsMixin()
                 start = Liten(spath = arguments,
                             fileSize = options.size,
                             pattern = options.pattern,
+                            include = options.include,
+                            exclude = options.exclude,
+                            excludeDirs = options.exclude_dir,
                             reportPath=options.report,
                             verbose=verbose,
-                            handler = actions_handler)
-                start.diskWalker()
+                            handler = actions_handler,
+                            cachePath = options.cache,
+                            partialSize = options.partial_size,
+                            jobs = options.jobs,
+                            walkJobs = options.walk_jobs,
+                            engine = options.engine,
+                            hashName = options.hash,
+                            blockSize = options.block_size,
+                            readMode = options.read_mode,
+                            compare = options.compare,
+                            compareLimit = options.compare_limit,
+                            progressInterval = options.progress_interval,
+                            shard = shard,
+                            indexPath = options.index,
+                            catalogPath = options.catalog,
+                            checkpointPath = options.checkpoint,
+                            checkpointInterval = options.checkpoint_interval,
+                            resume = options.resume,
+                            maxReadRate = options.max_read_rate,
+                            maxMetadataRate = options.max_iops,
+                            pageCache = options.page_cache,
+                            readOrder = options.read_order,
+                            concurrency = options.concurrency)
+                try:
+                    start.run()
+                except ValueError as err:
+                    if not options.resume:
+                        raise
+                    print(("Can't resume search: %s" % err))
+                    sys.exit(1)
+                if options.stats_json:
+                    start.stats.write(options.stats_json)
+                _vacuumCache(start, options.cache_vacuum, verbose)
             #Here I catch bogus size input exceptions
             except UnboundLocalError as err:
                 print(err)
@@ -707,6 +4638,213 @@ class LitenController(object):
         else:
             p.print_help()
 
+    def estimate(self, options, arguments, verbose=True):
+        """runs Liten.estimateWaste() on search paths and prints estimate"""
+        if options.sample_size < 1:
+            print("--sample-size must be at least 1")
+            sys.exit(1)
+        if not 0 < options.confidence < 1:
+            print("--confidence must be between 0 and 1")
+            sys.exit(1)
+        start = time.time()
+        liten = Liten(spath=arguments, fileSize=options.size, pattern=options.pattern,
+                      include=options.include, exclude=options.exclude,
+                      excludeDirs=options.exclude_dir, hashName=options.hash,
+                      partialSize=options.partial_size, jobs=options.jobs,
+                      walkJobs=options.walk_jobs, cachePath=options.cache,
+                      progressInterval=options.progress_interval,
+                      blockSize=options.block_size, readMode=options.read_mode,
+                      maxReadRate=options.max_read_rate,
+                      maxMetadataRate=options.max_iops, pageCache=options.page_cache,
+                      readOrder=options.read_order, concurrency=options.concurrency,
+                      verbose=verbose, reportPath=None)
+        progress = liten._progress()
+        try:
+            estimate = liten.estimateWaste(options.sample_size, options.confidence,
+                                           options.seed)
+        finally:
+            if progress is not None:
+                progress.stop()
+        if options.stats_json:
+            liten.stats.write(options.stats_json)
+        print(("Estimated Wasted Space:      ", _formatBytes(estimate.wasted)))
+        print(("%2d%% Confidence Interval:     " % round(estimate.confidence * 100),
+               "%s - %s" % (_formatBytes(estimate.low), _formatBytes(estimate.high))))
+        if verbose:
+            print(("Total Files Searched:        ", liten.recordCount))
+            print(("Size Groups Read:            ", "%d of %d" % (estimate.measured,
+                                                               estimate.groups)))
+            print(("Bytes Read:                  ", int(liten.stats.bytesRead)))
+            print(("Search Time:                 ", "%.2f seconds\n" % (time.time() - start)))
+
+    def blockDedup(self, options, arguments, verbose=True):
+        """runs BlockDedupAnalysis of search paths, writes report and summary"""
+        try:
+            avgSize = Liten.convertSize(options.chunk_size)
+        except ValueError as err:
+            print(err)
+            sys.exit(1)
+        if avgSize < 256:
+            print("--chunk-size must be at least 256 bytes")
+            sys.exit(1)
+        start = time.time()
+        liten = Liten(spath=arguments, fileSize=options.size, pattern=options.pattern,
+                      include=options.include, exclude=options.exclude,
+                      excludeDirs=options.exclude_dir, hashName=options.hash,
+                      walkJobs=options.walk_jobs, blockSize=options.block_size,
+                      readMode=options.read_mode, maxReadRate=options.max_read_rate,
+                      maxMetadataRate=options.max_iops, pageCache=options.page_cache,
+                      verbose=verbose, reportPath=None)
+        analysis = BlockDedupAnalysis(liten, options.processes, avgSize)
+        results = analysis.run()
+        if options.report:
+            analysis.writeReport(options.report, results)
+        if options.stats_json:
+            liten.stats.write(options.stats_json)
+        if verbose:
+            chunks, stored, total = analysis.totals
+            print("\n")
+            print("LITEN BLOCK DEDUP REPORT: \n")
+            print(("Search Path:                 ", arguments))
+            print(("Total Files Chunked:         ", liten.stats.filesHashed))
+            print(("Total Size:                  ", _formatBytes(total)))
+            print(("Unique Chunks:               ", chunks))
+            print(("Size After Block Dedup:      ", _formatBytes(stored)))
+            print(("Saveable by Block Dedup:     ", _formatBytes(total - stored)))
+            print(("Report Generated at:         ", options.report))
+            print(("Search Time:                 ", "%.2f seconds\n" % (time.time() - start)))
+
+    def merge(self, args):
+        """liten merge: makes report from index files of all shards"""
+        p = optparse.OptionParser(prog='liten merge',
+                                  description='Merges index files written by '
+                                  'all shards of a --shard i/N search into one '
+                                  'duplicate report, without reading files.',
+                                  usage='%prog [options] index1 index2 ...')
+        p.add_option('--report', '-r',
+                    help='path to store duplicate report (./LitenDuplicateReport.csv by default)',
+                    default='LitenDuplicateReport.csv')
+        p.add_option('--delete', '-d', action="store_true",
+                    help='DELETES all duplicate matches permanently!', default=False)
+        p.add_option('--dry-run', action="store_true",
+                    help='with --delete, only show what would be deleted',
+                    default=False)
+        p.add_option('--quiet', '-q', action="store_true",
+                    help='suppress all screen output except errors', default=False)
+        options, arguments = p.parse_args(args)
+        if not arguments:
+            p.error("no index files given")
+        if options.delete or options.dry_run:
+            actions_handler = ActionsQueued(ActionsAutomatic(), dryrun=options.dry_run,
+                                            verbose=not options.quiet)
+        else:
+            actions_handler = ActionsMixin()
+        start = Liten(spath=arguments, reportPath=options.report,
+                      verbose=not options.quiet, handler=actions_handler)
+        try:
+            start.mergeShards(arguments)
+        except (ValueError, EnvironmentError) as err:
+            print(("Can't merge shard indexes: %s" % err))
+            sys.exit(1)
+
+    def watch(self, args):
+        """liten watch: keeps duplicate index up to date and prints new dups"""
+        p = optparse.OptionParser(prog='liten watch',
+                                  description='Scans directories once, then '
+                                  'prints every new duplicate file as soon as it '
+                                  'is written, until interrupted.',
+                                  usage='%prog [options] dir1 [dir2] ...')
+        p.add_option('--size', '-s', default='1MB',
+                    help='minimum file size (1MB by default)')
+        p.add_option('--pattern', '-p', default='*', help='pattern match')
+        p.add_option('--include', action='append', metavar='PATTERN')
+        p.add_option('--exclude', action='append', metavar='PATTERN')
+        p.add_option('--exclude-dir', action='append', metavar='PATTERN')
+        p.add_option('--hash', choices=sorted(HASH_ALGORITHMS), default='md5')
+        p.add_option('--cache',
+                    help='path to SQLite database used to keep checksums between runs')
+        p.add_option('--poll', action="store_true", default=False,
+                    help='poll for changes even where inotify is available')
+        p.add_option('--interval', type='float', default=5.0,
+                    help='seconds between polls (5)')
+        p.add_option('--quiet', '-q', action="store_true", default=False,
+                    help='print new duplicates only')
+        options, arguments = p.parse_args(args)
+        if not arguments:
+            p.error("no directories given")
+        for arg in arguments:
+            if not os.path.isdir(arg):
+                p.error("Search path does't exist or is not a directory: %s" % arg)
+        liten = Liten(spath=arguments, fileSize=options.size, pattern=options.pattern,
+                      include=options.include, exclude=options.exclude,
+                      excludeDirs=options.exclude_dir, hashName=options.hash,
+                      cachePath=options.cache, reportPath=None, verbose=False)
+
+        def printMatch(match):
+            print(("DUPLICATE\t%s\t%s\t%d\t%s" % (match.path, match.original,
+                   match.size, liten.formatChecksum(match.checksum))))
+            sys.stdout.flush()
+
+        watcher = LitenWatcher(liten, printMatch, options.poll, options.interval)
+        try:
+            groups = watcher.scan()
+            if not options.quiet:
+                print(("Indexed %d files, %d duplicate groups, watching with %s" %
+                       (len(watcher.files), len(groups),
+                        'polling' if watcher.polling else 'inotify')))
+                sys.stdout.flush()
+            while True:
+                watcher.poll(options.interval)
+                if liten.cache is not None:
+                    liten.cache.commit()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            if liten.cache is not None:
+                liten.cache.close()
+
+    def query(self, args):
+        """liten query: prints duplicate groups kept in catalog"""
+        p = optparse.OptionParser(prog='liten query',
+                                  description='Prints duplicate groups of a '
+                                  'catalog written by a --catalog search, most '
+                                  'wasted space first, without reading files.',
+                                  usage='%prog [options] catalog')
+        p.add_option('--under', metavar='PATH',
+                    help='only files in tree PATH, as it was given to search')
+        p.add_option('--top', type='int', metavar='N',
+                    help='print only N biggest groups')
+        p.add_option('--hash', choices=sorted(HASH_ALGORITHMS), default='md5',
+                    help='checksum algorithm of search (md5)')
+        options, arguments = p.parse_args(args)
+        if len(arguments) != 1:
+            p.error("one catalog expected")
+        if not os.path.isfile(arguments[0]):
+            p.error("catalog doesn't exist: %s" % arguments[0])
+        catalog = LitenCatalog(arguments[0], options.hash)
+        try:
+            groups = catalog.duplicateGroups(options.under, options.top)
+        finally:
+            catalog.close()
+        for group in groups:
+            print(("%s wasted by %d copies of %s, %s" % (
+                _formatBytes(group.size * (len(group.paths) - 1)),
+                len(group.paths), _formatBytes(group.size),
+                binascii.hexlify(group.checksum))))
+            for path in group.paths:
+                print(("    %s" % path))
+
+def _vacuumCache(liten, vacuum, verbose=True):
+    """evicts stale records from checksum cache of liten after a search"""
+    if liten.cache is None:
+        return
+    if vacuum:
+        evicted = liten.cache.vacuum()
+        if verbose:
+            print(("Evicted %s stale checksums from %s" % (evicted, liten.cache.filep)))
+    liten.cache.close()
+
 def main():
     """run liten"""
     create = LitenController()
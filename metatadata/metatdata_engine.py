@@ -1,55 +1,40 @@
 #!/usr/bin/env python
-from sqlalchemy import create_engine
-from sqlalchemy import Table, Column, Integer, String, MetaData, ForeignKey
-from sqlalchemy.orm import mapper, sessionmaker
-import os
-
-#path
-path = "/tmp"
-
-#create engine
-engine = create_engine('sqlite:///:memory:', echo=False)
-
-#metadata
-metadata = MetaData()
-
-filesystem_table = Table('filesystem', metadata,
-   Column('id', Integer, primary_key=True),
-     Column('path', String(500)),
-     Column('file', String(255)),
-)
-
-metadata.create_all(engine)
+"""
+Crawls a file system into a liten catalog and prints its biggest
+duplicate groups.
 
-#mapped class
-class Filesystem(object):
+Usage: metatdata_engine.py [path] [catalog]
 
-    def __init__(self, path, file):
-        self.path = path
-        self.file = file
-
-    def __repr__(self):
-        return "<Filesystem('%s','%s')>" % (self.path, self.file)
-
-#mapper function
-mapper(Filesystem,filesystem_table)
-
-#create session
-Session = sessionmaker(bind=engine, autoflush=True, transactional=True)
-session = Session()
-
-#crawl file system and populate database with results
-for dirpath, dirnames, filenames in os.walk(path):
-    for file in filenames:
-        fullpath = os.path.join(dirpath, file)
-        record = Filesystem(fullpath, file)
-        session.save(record)
+path is /tmp and catalog is ./metadata.db by default. The catalog is
+kept, so it can be queried later with "liten query" without a rescan.
+"""
+import os
+import sys
 
-#commit to the database
-session.commit()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from liten import Liten, LitenCatalog
 
-#query
-query = session.query(Filesystem)
-for record in session.query(Filesystem):
-    print "Database Record Number: %s, Path: %s , File: %s " \
-    % (record.id,record.path, record.file)
+#path
+path = "/tmp"
+catalogPath = "metadata.db"
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    spath = args[0] if args else path
+    filep = args[1] if len(args) > 1 else catalogPath
+
+    #crawl file system and populate catalog with results
+    search = Liten(spath=spath, fileSize='1bytes', reportPath=None,
+                   verbose=False, engine='grouped', catalogPath=filep)
+    search.findDuplicateGroups()
+
+    #query
+    catalog = LitenCatalog(filep)
+    for group in catalog.duplicateGroups(limit=20):
+        print "Size: %s, Copies: %s" % (group.size, len(group.paths))
+        for fullpath in group.paths:
+            print "    %s" % fullpath
+    catalog.close()
+
+if __name__ == '__main__':
+    main()
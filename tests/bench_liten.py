@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for liten.
+
+Generates a synthetic tree, reproducible from a seed, with configurable
+number of files, directory depth, size distribution, ratio of duplicates
+and ratio of near misses (files of the same size as another file, which
+differ in one byte in the middle). Then liten searches the tree in a
+separate process and files/s, bytes read/s, read and write syscalls and
+peak RSS are appended to a JSON results file, so releases can be compared.
+
+Example::
+
+    ./bench_liten.py --files=20000 --depth=3 --sizes=lognormal \\
+        --mean-size=64KB --dup-ratio=0.2 --near-miss-ratio=0.1 \\
+        --repeat=3 --results=bench-0.4.json
+
+With --estimate N every run is measured twice, by an exact grouped search
+and by --estimate mode sampling N size groups, and the relative error of
+the estimate, whether the exact value is within its confidence interval
+and the speedup are recorded.
+
+With --compare-orders every run searches the tree once for each read
+order of the grouped engine (walk, inode and physical, see --read-order of
+liten), to show seek bound against sequential throughput. Files are
+generated in random directories, so walk order jumps across the disk. It
+is meant for a spinning disk and cold cache, for example a loopback image
+on one, as root::
+
+    truncate -s 8G /hdd/liten.img && mkfs.ext4 -q /hdd/liten.img
+    mount -o loop /hdd/liten.img /mnt/liten
+    ./bench_liten.py --tree=/mnt/liten --files=5000 --mean-size=1MB \\
+        --compare-orders --drop-caches
+
+Tree is kept in --tree directory if one is given and reused by later runs
+with the same parameters, otherwise a temporary one is removed at the end.
+Numbers are measured with warm page cache unless caches are dropped
+between runs, use --drop-caches as root for cold runs.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import struct
+import optparse
+import platform
+import tempfile
+import subprocess
+try:
+    import resource
+except ImportError:
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import liten
+
+POOL_SIZE = 65536
+SIZE_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+
+def sampleSize(rng, distribution, meanSize, maxSize):
+    """returns size of one file, at least one byte and at most maxSize"""
+    if distribution == 'fixed':
+        size = meanSize
+    elif distribution == 'uniform':
+        size = rng.randint(1, 2 * meanSize)
+    elif distribution == 'lognormal':
+        #median of meanSize and long tail of big files, as on real disks
+        size = int(rng.lognormvariate(0, 1.5) * meanSize)
+    else:
+        raise ValueError("unknown size distribution %s" % distribution)
+    return max(1, min(size, maxSize))
+
+
+def writeContent(path, pool, seed, size):
+    """writes size bytes unique to seed to path"""
+    offset = (seed * 7919) % len(pool)
+    data = struct.pack('>Q', seed) + pool[offset:] + pool[:offset]
+    f = open(path, 'wb')
+    try:
+        written = 0
+        while written < size:
+            chunk = data[:size - written]
+            f.write(chunk)
+            written += len(chunk)
+    finally:
+        f.close()
+
+
+def generateTree(root, files=1000, depth=2, fanout=4, sizes='lognormal',
+                 meanSize=65536, maxSize=67108864, dupRatio=0.2,
+                 nearMissRatio=0.1, seed=0):
+    """
+    Creates files in root, a tree of directories depth levels deep with
+    fanout subdirectories each. Every file is a duplicate of an earlier
+    file with dupRatio probability, a near miss of an earlier file with
+    nearMissRatio probability and unique otherwise. Same arguments always
+    give the same tree. Returns dict with counts of files and bytes written.
+    """
+    rng = random.Random(seed)
+    pool = ''.join(chr(rng.randrange(256)) for _ in range(POOL_SIZE))
+    dirs = [root]
+    level = [root]
+    for _ in range(depth):
+        level = [os.path.join(parent, 'd%02d' % n)
+                 for parent in level for n in range(fanout)]
+        dirs.extend(level)
+    for path in dirs:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    originals = []
+    counts = {'files': 0, 'bytes': 0, 'duplicates': 0, 'nearMisses': 0,
+              'directories': len(dirs)}
+    for n in range(files):
+        path = os.path.join(rng.choice(dirs), 'f%07d.bin' % n)
+        kind = rng.random()
+        if originals and kind < dupRatio:
+            original, size = rng.choice(originals)
+            shutil.copyfile(original, path)
+            counts['duplicates'] += 1
+        elif originals and kind < dupRatio + nearMissRatio:
+            original, size = rng.choice(originals)
+            shutil.copyfile(original, path)
+            #near misses of the same original differ from each other too
+            offset = (size // 2 + n // 255) % size
+            f = open(path, 'r+b')
+            f.seek(offset)
+            byte = f.read(1)
+            f.seek(offset)
+            f.write(chr(ord(byte) ^ (1 + n % 255)))
+            f.close()
+            counts['nearMisses'] += 1
+        else:
+            size = sampleSize(rng, sizes, meanSize, maxSize)
+            writeContent(path, pool, n, size)
+            originals.append((path, size))
+        counts['files'] += 1
+        counts['bytes'] += size
+    return counts
+
+
+def procIO():
+    """returns counters of /proc/self/io, empty dict where not available"""
+    try:
+        f = open('/proc/self/io')
+    except EnvironmentError:
+        return {}
+    try:
+        return dict((key, int(value)) for key, value in
+                    (line.split(':') for line in f if ':' in line))
+    finally:
+        f.close()
+
+
+def measure(root, engine='classic', jobs=1, hashName='md5', compare='hash',
+            estimate=0, readOrder='inode'):
+    """
+    Searches root for duplicates, without report, and returns dict of
+    measurements. With estimate, waste is estimated from that many sampled
+    size groups instead. Meant to run in a fresh process, see runMeasure().
+    """
+    before = procIO()
+    start = time.time()
+    search = liten.Liten(spath=root, fileSize='1bytes', reportPath=os.devnull,
+                         verbose=False, jobs=jobs, engine=engine,
+                         hashName=hashName, compare=compare, readOrder=readOrder)
+    estimated = None
+    if estimate:
+        estimated = search.estimateWaste(estimate, seed=0)
+        duplicates = None
+    elif engine == 'grouped' or compare == 'bytes':
+        duplicates = sum(len(group.paths) - 1 for group in search.groupWalker())
+    else:
+        search.diskWalker()
+        duplicates = search.dupNumber
+    elapsed = time.time() - start
+    after = procIO()
+
+    results = {'seconds': elapsed,
+               'filesScanned': search.recordCount,
+               'filesPerSecond': search.recordCount / elapsed,
+               'duplicates': duplicates,
+               'wastedBytes': search.wastedBytes,
+               'bytesSkipped': search.bytesSkipped}
+    if estimated is not None:
+        results.update(wastedLow=estimated.low, wastedHigh=estimated.high,
+                       groups=estimated.groups, groupsRead=estimated.measured)
+    if before:
+        results['bytesRead'] = after['rchar'] - before['rchar']
+        results['bytesReadPerSecond'] = results['bytesRead'] / elapsed
+        results['readSyscalls'] = after['syscr'] - before['syscr']
+        results['writeSyscalls'] = after['syscw'] - before['syscw']
+    if resource is not None:
+        #kilobytes on Linux, bytes on OS X
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            maxrss //= 1024
+        results['peakRssKB'] = maxrss
+    return results
+
+
+def runMeasure(root, options, estimate=0):
+    """runs measure() in a child process, so peak RSS is of search only"""
+    cmd = [sys.executable, os.path.abspath(__file__), '--measure', root,
+           '--engine', options.engine, '--jobs', str(options.jobs),
+           '--hash', options.hash, '--compare', options.compare,
+           '--estimate', str(estimate), '--read-order', options.read_order]
+    output = subprocess.check_output(cmd)
+    return json.loads(output)
+
+
+def compareEstimate(root, options):
+    """
+    Measures exact grouped search and estimate of options.estimate groups
+    of root, returns dict of both with error and speedup of estimate.
+    """
+    exactOptions = optparse.Values(vars(options))
+    exactOptions.engine = 'grouped'
+    exact = runMeasure(root, exactOptions)
+    if options.drop_caches:
+        dropCaches()
+    estimate = runMeasure(root, options, options.estimate)
+    wasted = exact['wastedBytes']
+    return {'exact': exact, 'estimate': estimate,
+            'relativeError': (estimate['wastedBytes'] - wasted) / float(wasted or 1),
+            'inInterval': estimate['wastedLow'] <= wasted <= estimate['wastedHigh'],
+            'speedup': exact['seconds'] / estimate['seconds']}
+
+
+def compareOrders(root, options):
+    """
+    Measures grouped search of root with every read order, returns dict
+    of order -> measurements. Caches are dropped before each one with
+    --drop-caches.
+    """
+    results = {}
+    for n, order in enumerate(liten.ReadScheduler.ORDERS):
+        orderOptions = optparse.Values(vars(options))
+        orderOptions.engine = 'grouped'
+        orderOptions.read_order = order
+        if options.drop_caches and n:
+            dropCaches()
+        results[order] = runMeasure(root, orderOptions)
+    return results
+
+
+def dropCaches():
+    """drops Linux page cache, needs root"""
+    subprocess.check_call(['sync'])
+    f = open('/proc/sys/vm/drop_caches', 'w')
+    f.write('3\n')
+    f.close()
+
+
+def main(argv=None):
+    p = optparse.OptionParser(description=__doc__.split('\n\n')[1].strip(),
+                              usage='%prog [options]')
+    p.add_option('--files', type='int', default=1000,
+                 help='number of files to generate (1000)')
+    p.add_option('--depth', type='int', default=2,
+                 help='levels of directories (2)')
+    p.add_option('--fanout', type='int', default=4,
+                 help='subdirectories of each directory (4)')
+    p.add_option('--sizes', choices=SIZE_DISTRIBUTIONS, default='lognormal',
+                 help='size distribution, one of %s' % ', '.join(SIZE_DISTRIBUTIONS))
+    p.add_option('--mean-size', default='64KB',
+                 help='mean file size, median for lognormal (64KB)')
+    p.add_option('--max-size', default='64MB',
+                 help='largest file generated (64MB)')
+    p.add_option('--dup-ratio', type='float', default=0.2,
+                 help='share of files which are duplicates (0.2)')
+    p.add_option('--near-miss-ratio', type='float', default=0.1,
+                 help='share of files of a duplicate size, but different (0.1)')
+    p.add_option('--seed', type='int', default=0,
+                 help='random seed of generated tree (0)')
+    p.add_option('--tree', help='directory for generated tree, kept for reuse')
+    p.add_option('--repeat', type='int', default=1,
+                 help='number of measured runs (1)')
+    p.add_option('--drop-caches', action='store_true',
+                 help='drop page cache before each run, needs root')
+    p.add_option('--engine', choices=['classic', 'grouped'], default='classic')
+    p.add_option('--jobs', type='int', default=1)
+    p.add_option('--hash', default='md5')
+    p.add_option('--compare', choices=['hash', 'bytes'], default='hash')
+    p.add_option('--read-order', choices=liten.ReadScheduler.ORDERS, default='inode')
+    p.add_option('--compare-orders', action='store_true',
+                 help='measure grouped engine with every read order')
+    p.add_option('--estimate', type='int', default=0, metavar='N',
+                 help='compare exact search with --estimate of N sampled groups')
+    p.add_option('--results', default='bench-results.json',
+                 help='JSON file results are appended to (bench-results.json)')
+    p.add_option('--measure', metavar='PATH', help=optparse.SUPPRESS_HELP)
+    options, arguments = p.parse_args(argv)
+
+    if options.measure:
+        results = measure(options.measure, options.engine, options.jobs,
+                          options.hash, options.compare, options.estimate,
+                          options.read_order)
+        sys.stdout.write(json.dumps(results))
+        return
+
+    params = {'files': options.files, 'depth': options.depth,
+              'fanout': options.fanout, 'sizes': options.sizes,
+              'meanSize': liten.Liten.convertSize(options.mean_size),
+              'maxSize': liten.Liten.convertSize(options.max_size),
+              'dupRatio': options.dup_ratio,
+              'nearMissRatio': options.near_miss_ratio,
+              'seed': options.seed}
+    root = options.tree or tempfile.mkdtemp(prefix='liten-bench-')
+    marker = os.path.join(root, 'params.json')
+    try:
+        if os.path.exists(marker) and json.load(open(marker)) == params:
+            tree = json.load(open(os.path.join(root, 'tree.json')))
+            print("Reusing tree in %s" % root)
+        else:
+            print("Generating %s files in %s" % (options.files, root))
+            tree = generateTree(os.path.join(root, 'tree'), **params)
+            json.dump(tree, open(os.path.join(root, 'tree.json'), 'w'))
+            json.dump(params, open(marker, 'w'))
+
+        runs = []
+        for n in range(options.repeat):
+            if options.drop_caches:
+                dropCaches()
+            if options.compare_orders:
+                run = compareOrders(os.path.join(root, 'tree'), options)
+                print("Run %d: %s" % (n + 1, ", ".join(
+                    "%s %.1f MB/s" % (order, run[order].get('bytesReadPerSecond', 0)
+                                      / 1048576.0)
+                    for order in liten.ReadScheduler.ORDERS)))
+            elif options.estimate:
+                run = compareEstimate(os.path.join(root, 'tree'), options)
+                print("Run %d: estimate %.1f%% off, exact value %s interval, "
+                      "%.1fx faster" % (n + 1, run['relativeError'] * 100,
+                                        'in' if run['inInterval'] else 'outside',
+                                        run['speedup']))
+            else:
+                run = runMeasure(os.path.join(root, 'tree'), options)
+                print("Run %d: %.1f files/s, %.1f MB/s read, peak RSS %s KB" % (
+                    n + 1, run['filesPerSecond'],
+                    run.get('bytesReadPerSecond', 0) / 1048576.0,
+                    run.get('peakRssKB')))
+            runs.append(run)
+    finally:
+        if not options.tree:
+            shutil.rmtree(root)
+
+    record = {'version': liten.__version__,
+              'python': platform.python_version(),
+              'implementation': platform.python_implementation(),
+              'platform': platform.platform(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'params': params,
+              'tree': tree,
+              'options': {'engine': options.engine, 'jobs': options.jobs,
+                          'hash': options.hash, 'compare': options.compare,
+                          'estimate': options.estimate,
+                          'readOrder': options.read_order,
+                          'compareOrders': bool(options.compare_orders),
+                          'coldCache': bool(options.drop_caches)},
+              'runs': runs}
+    history = []
+    if os.path.exists(options.results):
+        history = json.load(open(options.results))
+    history.append(record)
+    f = open(options.results, 'w')
+    json.dump(history, f, indent=2, sort_keys=True)
+    f.close()
+    print("Results appended to %s" % options.results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,29 @@
 #!/usr/bin/env python
 #unittests for liten
+import os
+import sys
+import errno
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+import subprocess
+import struct
+from StringIO import StringIO
 import unittest
 import doctest
 from doctest import DocTestSuite
 
 from os.path import abspath,dirname,join
-from liten import Liten
+import liten as litenModule
+import bench_liten
+from liten import Liten, ChecksumCache, ChecksumReader, FileRecord, walkFiles, \
+    benchHashes, benchReads, benchMemory, HASH_ALGORITHMS, ScanStats, ProgressReporter, \
+    LitenController, mergeShardIndexes, FileSystemOps, pipelinedWalk, PathFilter, \
+    ProcessConfig, ActionsMixin, ActionsQueued, LitenWatcher, LitenCatalog, \
+    BlockDedupAnalysis, ReadScheduler, ScanJournal
 
 class TestLitenBaseClass(unittest.TestCase):
     """Tests for LitenBaseClass Class."""
@@ -104,6 +122,1443 @@ class TestLitenBaseClass(unittest.TestCase):
         self.assertRaises(ValueError, liten.convertSize, liten.fileSize)
 
 
+class TempDirTestCase(unittest.TestCase):
+    """Base of tests working in temporary directory self.tmp."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._spied = []
+
+    def tearDown(self):
+        for liten in self._spied:
+            del liten.createChecksum
+        shutil.rmtree(self.tmp)
+
+    def spyChecksums(self, liten):
+        """
+        Makes liten append every path it fully hashes to liten.hashed
+        until tearDown. Returns that list.
+        """
+        liten.hashed = []
+        createChecksum = liten.createChecksum
+        liten.createChecksum = lambda path: liten.hashed.append(path) or createChecksum(path)
+        self._spied.append(liten)
+        return liten.hashed
+
+
+class TreeTestCase(TempDirTestCase):
+    """Base of tests searching self.tree of equal and near equal files."""
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.tree = join(self.tmp, 'tree')
+        for n in range(4):
+            sub = join(self.tree, 'dir%s' % n)
+            os.makedirs(sub)
+            for size in (100, 20000, 30000):
+                for name, fill in (('same', 'x'), ('head', str(n)), ('mid', 'x')):
+                    data = ['x'] * size
+                    if name == 'head':
+                        data[0] = fill
+                    if name == 'mid':
+                        data[size // 2] = str(n)
+                    f = open(join(sub, '%s%s.bin' % (name, size)), 'wb')
+                    f.write(''.join(data))
+                    f.close()
+
+
+class TestChecksumCache(TempDirTestCase):
+    """Tests for persistent ChecksumCache."""
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.tree = join(self.tmp, 'tree')
+        os.mkdir(self.tree)
+        for name in ('one.bin', 'two.bin'):
+            f = open(join(self.tree, name), 'wb')
+            f.write('x' * 100)
+            f.close()
+        self.cachePath = join(self.tmp, 'cache.db')
+        self.reportPath = join(self.tmp, 'report.csv')
+
+    def _liten(self):
+        return Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                     reportPath=self.reportPath, cachePath=self.cachePath)
+
+    def testRescanSkipsHashing(self):
+        """Unchanged files are not hashed again on the next run."""
+        first = self._liten()
+        self.assertEqual(len(first.diskWalker()), 2)
+        first.cache.close()
+
+        second = self._liten()
+        hashed = self.spyChecksums(second)
+        self.assertEqual(len(second.diskWalker()), 2)
+        self.assertEqual(hashed, [])
+        self.assertEqual(second.cache.hits, 2)
+
+    def testModifiedFileIsRehashed(self):
+        """Cache record is ignored once file size or mtime changes."""
+        path = join(self.tree, 'one.bin')
+        cache = ChecksumCache(self.cachePath)
+        cache.store(path, os.stat(path), 'digest')
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime - 10))
+        self.assertEqual(cache.lookup(os.stat(path)), None)
+
+    def testVacuumEvictsMissingFiles(self):
+        """Vacuum removes records of deleted files."""
+        liten = self._liten()
+        liten.diskWalker()
+        os.remove(join(self.tree, 'two.bin'))
+        self.assertEqual(liten.cache.vacuum(), 1)
+        self.assertEqual(liten.cache.vacuum(), 0)
+        liten.cache.close()
+
+
+class TestPartialChecksum(TempDirTestCase):
+    """Tests for partial checksum stage of diskWalker."""
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.reportPath = join(self.tmp, 'report.csv')
+
+    def _write(self, name, data):
+        f = open(join(self.tmp, name), 'wb')
+        f.write(data)
+        f.close()
+
+    def _walk(self, partialSize='4KB'):
+        liten = Liten(spath=self.tmp, fileSize='10KB', verbose=False,
+                      reportPath=self.reportPath, partialSize=partialSize)
+        hashed = self.spyChecksums(liten)
+        return liten, liten.diskWalker(), hashed
+
+    def testHeadMismatchSkipsFullChecksum(self):
+        """Files differing in first block are never fully read."""
+        self._write('a.bin', 'a' + 'x' * 20479)
+        self._write('b.bin', 'b' + 'x' * 20479)
+        liten, dupes, hashed = self._walk()
+        self.assertEqual(dupes, {})
+        self.assertEqual(hashed, [])
+        self.assertEqual(liten.bytesSkipped, 2 * (20480 - 8192))
+
+    def testMiddleMismatchNeedsFullChecksum(self):
+        """Files with equal head and tail are told apart by full checksum."""
+        self._write('a.bin', 'x' * 10000 + 'a' + 'x' * 10479)
+        self._write('b.bin', 'x' * 10000 + 'b' + 'x' * 10479)
+        liten, dupes, hashed = self._walk()
+        self.assertEqual(dupes, {})
+        self.assertEqual(len(hashed), 2)
+        self.assertEqual(liten.bytesSkipped, 0)
+
+    def testDuplicatesFoundWithAndWithoutStage(self):
+        """Partial checksum stage doesn't change found duplicates."""
+        self._write('a.bin', 'x' * 20480)
+        self._write('b.bin', 'x' * 20480)
+        self._write('c.bin', 'y' * 20480)
+        self._write('d.bin', 'x' * 20480)
+        withStage = self._walk()[1]
+        withoutStage = self._walk(partialSize='0')[1]
+        self.assertEqual(sorted(withStage), sorted(withoutStage))
+        self.assertEqual(len(withStage), 3)
+
+
+class TestParallelHashing(TreeTestCase):
+    """Tests for diskWalker with a pool of hashing threads."""
+
+    def _walk(self, jobs, **kwargs):
+        reportPath = join(self.tmp, 'report%s.csv' % jobs)
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=reportPath, jobs=jobs, **kwargs)
+        dupes = liten.diskWalker()
+        report = open(reportPath).read()
+        return sorted(dupes), liten.dupNumber, report
+
+    def testSameResultsAsSerial(self):
+        """Thread pool finds exactly what serial walk finds."""
+        self.assertEqual(self._walk(4), self._walk(1))
+
+    def testSameResultsWithoutPartialStage(self):
+        """Thread pool computing full checksums only."""
+        self.assertEqual(self._walk(3, partialSize='0'),
+                         self._walk(1, partialSize='0'))
+
+    def testSameResultsWithCache(self):
+        """Thread pool takes checksums from persistent cache."""
+        cachePath = join(self.tmp, 'cache.db')
+        serial = self._walk(1, cachePath=cachePath)
+        self.assertEqual(self._walk(4, cachePath=cachePath), serial)
+
+    def testEachFileHashedOnce(self):
+        """Full checksum computed inline is not submitted to pool again."""
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=os.devnull, jobs=4)
+        hashed = self.spyChecksums(liten)
+        createPartialChecksum = liten.createPartialChecksum
+        def slowPartial(*args):
+            time.sleep(0.01)
+            return createPartialChecksum(*args)
+        liten.createPartialChecksum = slowPartial
+        liten.diskWalker()
+        self.assertTrue(hashed)
+        self.assertEqual(sorted(hashed), sorted(set(hashed)))
+
+
+class TestWalkFiles(TempDirTestCase):
+    """Tests for walkFiles traversal."""
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.files = []
+        for sub in ('a', 'a/b', 'a/b/c', 'd'):
+            os.makedirs(join(self.tmp, sub))
+            for n in range(3):
+                path = join(self.tmp, sub, 'f%s.bin' % n)
+                f = open(path, 'wb')
+                f.write('x' * (n + 1))
+                f.close()
+                self.files.append(path)
+        os.symlink(join(self.tmp, 'a'), join(self.tmp, 'link'))
+
+    def testSameOrderAsOsWalk(self):
+        """Serial walk visits files in os.walk() order, skips dir links."""
+        expected = [join(root, name)
+                    for root, _, names in os.walk(self.tmp)
+                    for name in names if os.path.isfile(join(root, name))]
+        self.assertEqual([path for path, _, _ in walkFiles(self.tmp)], expected)
+
+    def testParallelWalkFindsSameFiles(self):
+        """Directories read by a thread pool yield the same files."""
+        self.assertEqual(sorted(path for path, _, _ in walkFiles(self.tmp, 4)),
+                         sorted(self.files))
+
+    def testEachFileStatedOnce(self):
+        """diskWalker stats every file exactly once."""
+        calls = []
+        osStat = os.stat
+        def countingStat(path, *args, **kwargs):
+            calls.append(path)
+            return osStat(path, *args, **kwargs)
+        litenModule.os.stat = countingStat
+        try:
+            liten = Liten(spath=self.tmp, fileSize='1bytes', verbose=False,
+                          reportPath=os.devnull)
+            liten.diskWalker()
+        finally:
+            litenModule.os.stat = osStat
+        for path in self.files:
+            self.assertEqual(calls.count(path), 1)
+
+
+class TestGroupedEngine(TestParallelHashing):
+    """Tests for two phase findDuplicateGroups engine."""
+
+    def _groups(self, **kwargs):
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=join(self.tmp, 'grouped.csv'), **kwargs)
+        return liten, liten.findDuplicateGroups()
+
+    def testSameDuplicatesAsClassic(self):
+        """Grouped engine finds the same duplicate files as diskWalker."""
+        _, groups = self._groups()
+        paths = sorted(path for group in groups for path in group.paths)
+        self.assertEqual(paths, self._walk(1)[0])
+
+    def testGroupsHoldAllMembers(self):
+        """Every group has all equal files, in walk order."""
+        _, groups = self._groups()
+        self.assertEqual(len(groups), 3)
+        for group in groups:
+            self.assertEqual(len(group.paths), 4)
+            self.assertEqual(group.size, os.path.getsize(group.paths[0]))
+            self.assertEqual(group.paths, [path for path, _, _ in walkFiles(self.tree)
+                                           if path in group.paths])
+            self.assertEqual(len(set(Liten().createChecksum(path)
+                                     for path in group.paths)), 1)
+
+    def testSameGroupsWithPool(self):
+        """Worker pool doesn't change groups."""
+        self.assertEqual([group[:3] for group in self._groups(jobs=4)[1]],
+                         [group[:3] for group in self._groups()[1]])
+
+    def testFilesReadInInodeOrder(self):
+        """Full checksums are made in inode order."""
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      partialSize='0')
+        hashed = self.spyChecksums(liten)
+        liten.findDuplicateGroups()
+        inodes = [os.stat(path).st_ino for path in hashed]
+        self.assertEqual(inodes, sorted(inodes))
+
+
+class TestHardlinks(TempDirTestCase):
+    """Tests for hard link handling."""
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.tree = join(self.tmp, 'tree')
+        os.mkdir(self.tree)
+        for name in ('orig', 'copy', 'shared'):
+            f = open(join(self.tree, name), 'wb')
+            f.write('x' * 100)
+            f.close()
+        os.link(join(self.tree, 'orig'), join(self.tree, 'orig.link'))
+        os.link(join(self.tree, 'shared'), join(self.tmp, 'outside.link'))
+        self.reportPath = join(self.tmp, 'report.csv')
+
+    def _liten(self, engine):
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=self.reportPath, engine=engine)
+        self.spyChecksums(liten)
+        return liten
+
+    def _expectedWaste(self, paths):
+        """files after first one, but the one with a link outside the tree"""
+        return 100 * len([path for path in paths[1:] if not path.endswith('shared')])
+
+    def testClassicEngine(self):
+        """Each inode is hashed once, links are not duplicates."""
+        liten = self._liten('classic')
+        dupes = liten.run()
+        self.assertEqual(len(liten.hashed), 3)
+        self.assertEqual(len(set(os.stat(path).st_ino for path in dupes)), 3)
+        self.assertEqual(sorted(map(sorted, liten.hardlinkGroups())),
+                         [[join(self.tree, 'orig'), join(self.tree, 'orig.link')]])
+        self.assertTrue('Hardlinks:' in open(self.reportPath).read())
+
+    def testGroupedEngine(self):
+        """Wasted space counts only files whose removal frees space."""
+        liten = self._liten('grouped')
+        groups = liten.run()
+        self.assertEqual(len(liten.hashed), 3)
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(len(groups[0].paths), 3)
+        self.assertEqual(liten.wastedBytes, self._expectedWaste(groups[0].paths))
+
+
+class TestHashAlgorithms(unittest.TestCase):
+    """Tests for pluggable checksum algorithms."""
+
+    def setUp(self):
+        self.dupeFileOne = join(dirname(abspath(__file__)), "data", 'testDocOne.txt')
+
+    def testDefaultIsMd5(self):
+        """md5 stays default for compatibility."""
+        import hashlib
+        checksum = Liten().createChecksum(self.dupeFileOne)
+        self.assertEqual(checksum, hashlib.md5(open(self.dupeFileOne, 'rb').read()).digest())
+
+    def testSelectedAlgorithm(self):
+        """Checksum is made with selected algorithm."""
+        import hashlib
+        liten = Liten(hashName='sha1')
+        self.assertEqual(liten.createChecksum(self.dupeFileOne),
+                         hashlib.sha1(open(self.dupeFileOne, 'rb').read()).digest())
+        self.assertTrue(liten.formatChecksum('\x01').startswith('sha1:'))
+
+    def testUnknownAlgorithm(self):
+        """Unknown algorithm names are rejected."""
+        self.assertRaises(ValueError, Liten, hashName='nohash')
+
+    def testCacheKeepsAlgorithmsApart(self):
+        """Checksum cached for one algorithm isn't returned for another."""
+        st = os.stat(self.dupeFileOne)
+        md5 = ChecksumCache(':memory:', 'md5')
+        md5.store(self.dupeFileOne, st, 'digest')
+        md5.algorithm = 'sha1'
+        self.assertEqual(md5.lookup(st), None)
+
+    def testBenchmarkCoversRegistry(self):
+        """Benchmark measures every registered algorithm."""
+        results = benchHashes(1)
+        self.assertEqual(sorted(name for name, _ in results), sorted(HASH_ALGORITHMS))
+        self.assertTrue(all(speed > 0 for _, speed in results))
+
+
+class TestChecksumReader(TempDirTestCase):
+    """Tests for ChecksumReader I/O layer."""
+
+    def setUp(self):
+        import hashlib
+        TempDirTestCase.setUp(self)
+        self.path = join(self.tmp, 'random.bin')
+        self.data = os.urandom(100000)
+        f = open(self.path, 'wb')
+        f.write(self.data)
+        f.close()
+        self.expected = hashlib.md5(self.data).digest()
+        self.md5 = hashlib.md5
+
+    def testModesAndBlockSizes(self):
+        """Every mode and block size gives the same checksum."""
+        for mode in ChecksumReader.MODES:
+            for blockSize in (7, 4096, 65536, 1048576):
+                checksum = self.md5()
+                reader = ChecksumReader(blockSize, mode)
+                self.assertEqual(reader.update(checksum, self.path), len(self.data))
+                self.assertEqual(checksum.digest(), self.expected)
+
+    def testBufferIsReused(self):
+        """Read mode fills the same buffer for every file."""
+        reader = ChecksumReader(4096)
+        reader.update(self.md5(), self.path)
+        view = reader._view()
+        reader.update(self.md5(), self.path)
+        self.assertTrue(reader._view() is view)
+
+    def testEmptyFileMmap(self):
+        """Empty files can't be mapped, but still have a checksum."""
+        open(self.path, 'wb').close()
+        checksum = self.md5()
+        self.assertEqual(ChecksumReader(4096, 'mmap').update(checksum, self.path), 0)
+        self.assertEqual(checksum.digest(), self.md5().digest())
+
+    def testLitenSettings(self):
+        """Liten applies block size and read mode when it searches."""
+        liten = Liten(spath=self.tmp, fileSize='1TB', verbose=False,
+                      reportPath=os.devnull, blockSize='64KB', readMode='mmap')
+        liten.findDuplicateGroups()
+        self.assertEqual((liten.reader.blockSize, liten.reader.mode), (65536, 'mmap'))
+        self.assertEqual(liten.createChecksum(self.path), self.expected)
+
+    def testBenchmark(self):
+        """Benchmark reports every mode and block size."""
+        results = benchReads(self.path, blockSizes=(4096,))
+        self.assertTrue(set(('warm', mode, 4096) for mode in ChecksumReader.MODES) <=
+                        set(result[:3] for result in results))
+
+
+class TestIterDuplicates(TempDirTestCase):
+    """Tests for streaming iterDuplicates API."""
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        for n in range(20):
+            sub = join(self.tmp, 'dir%02d' % n)
+            os.mkdir(sub)
+            for name in ('a.bin', 'b.bin'):
+                f = open(join(sub, name), 'wb')
+                f.write(str(n) * 100)
+                f.close()
+
+    def testMatchesArriveDuringWalk(self):
+        """First duplicate is yielded before the tree is fully walked."""
+        for jobs in (1, 4):
+            liten = Liten(spath=self.tmp, fileSize='1bytes', verbose=False,
+                          reportPath=None, jobs=jobs)
+            stream = liten.iterDuplicates()
+            match = next(stream)
+            self.assertTrue(liten.recordCount < 40)
+            self.assertEqual(os.path.dirname(match.path), os.path.dirname(match.original))
+            self.assertEqual(len(list(stream)), 19)
+            self.assertEqual(liten.dupNumber, 20)
+            self.assertEqual(liten.confirmed_dup_key, {})
+
+    def testClosedStreamStopsPool(self):
+        """Abandoned stream shuts its worker pool down."""
+        liten = Liten(spath=self.tmp, fileSize='1bytes', verbose=False, jobs=4,
+                      reportPath=os.devnull)
+        stream = liten.iterDuplicates()
+        next(stream)
+        stream.close()
+        self.assertEqual(liten._pool, None)
+
+    def testReportIsOptional(self):
+        """diskWalker without report path writes no report."""
+        cwd = os.getcwd()
+        os.chdir(self.tmp)
+        try:
+            liten = Liten(spath=self.tmp, fileSize='1bytes', verbose=False,
+                          reportPath=None)
+            self.assertEqual(len(liten.diskWalker()), 40)
+        finally:
+            os.chdir(cwd)
+        self.assertFalse(os.path.exists(join(self.tmp, 'LitenDuplicateReport.csv')))
+
+
+class TestFileRecord(unittest.TestCase):
+    """Tests for compact FileRecord."""
+
+    def setUp(self):
+        self.testData = join(dirname(abspath(__file__)), "data")
+
+    def testStandsInForStat(self):
+        """Record has stat fields Liten uses."""
+        path = join(self.testData, 'testDocOne.txt')
+        st = os.stat(path)
+        record = FileRecord(self.testData, 'testDocOne.txt', st)
+        self.assertEqual(record.path, path)
+        for field in ('st_size', 'st_dev', 'st_ino', 'st_nlink', 'st_ctime'):
+            self.assertEqual(getattr(record, field), getattr(st, field))
+        self.assertEqual(Liten().makeModDate(path, record), Liten().makeModDate(path))
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def testDiskWalkerRecords(self):
+        """diskWalker results still read like dict records."""
+        liten = Liten(spath=self.testData, fileSize='1bytes', verbose=False,
+                      reportPath=None)
+        dupes = liten.diskWalker()
+        self.assertEqual(sorted(dupes), sorted(record['fullPath']
+                                               for record in dupes.values()))
+        for record in dupes.values():
+            self.assertEqual(record['bytes'], 45)
+            self.assertEqual(record['checksum'], liten.createChecksum(record['fullPath']))
+            self.assertEqual(record['fileExt'], '.txt')
+            self.assertRaises(KeyError, record.__getitem__, 'nokey')
+
+    def testDirectoryStringIsShared(self):
+        """Files of one directory share directory string."""
+        liten = Liten(spath=self.testData, fileSize='1bytes', verbose=False)
+        records = [record for _, _, record in liten._candidates(1)]
+        self.assertEqual(len(records), 3)
+        self.assertTrue(records[0].dirname is records[1].dirname is records[2].dirname)
+
+    def testUsesLessMemory(self):
+        """Benchmark shows FileRecord needs less memory than dicts."""
+        before, after = benchMemory(1000)
+        self.assertTrue(after * 2 < before)
+
+
+class TestByteComparison(TreeTestCase):
+    """Tests for --compare=bytes engine."""
+
+    def _compared(self, **kwargs):
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      compare='bytes', **kwargs)
+        self.spyChecksums(liten)
+        return liten, liten.findDuplicateGroups()
+
+    def testSameGroupsAsHashing(self):
+        """Comparing bytes finds the same groups as checksums."""
+        liten, groups = self._compared(compareLimit=12)
+        hashed = Liten(spath=self.tree, fileSize='1bytes', verbose=False).findDuplicateGroups()
+        self.assertEqual([group.paths for group in groups],
+                         [group.paths for group in hashed])
+        self.assertEqual(liten.hashed, [])
+        self.assertEqual(set(group.checksum for group in groups), set([None]))
+
+    def testLargeGroupsAreHashed(self):
+        """Groups over the limit fall back to checksums."""
+        liten, groups = self._compared(partialSize='0', jobs=2)
+        self.assertEqual(len(groups), 3)
+        self.assertEqual(len(liten.hashed), 36)
+
+    def testSplitsOnDivergence(self):
+        """Files differing in the middle are split, equal ones kept."""
+        paths = [join(self.tree, 'dir%s' % n, 'mid20000.bin') for n in range(4)]
+        paths.append(join(self.tree, 'dir0', 'same20000.bin'))
+        paths.append(join(self.tree, 'dir1', 'same20000.bin'))
+        self.assertEqual(Liten().compareFiles(paths, 4096), [[4, 5]])
+
+class TestScanStats(TreeTestCase):
+    """Tests for counters and timers of ScanStats."""
+
+    def _search(self, **kwargs):
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=join(self.tmp, 'report.csv'), **kwargs)
+        liten.run()
+        return liten.stats
+
+    def testCounters(self):
+        """Walk, hash and duplicate counts of the search."""
+        for engine in ('classic', 'grouped'):
+            stats = self._search(engine=engine, partialSize='0')
+            self.assertEqual(stats.dirsScanned, 5)
+            self.assertEqual(stats.filesScanned, 36)
+            self.assertEqual(stats.filesMatched, 36)
+            self.assertEqual(stats.duplicates, 9)
+            self.assertEqual(stats.errors, 0)
+            self.assertTrue(stats.filesHashed > 0)
+            self.assertTrue(stats.bytesRead >= stats.wastedBytes > 0)
+            self.assertTrue(stats.finished is not None)
+
+    def testCacheHits(self):
+        """Second search takes checksums from cache, reads nothing."""
+        cachePath = join(self.tmp, 'cache.db')
+        self._search(cachePath=cachePath, partialSize='0')
+        stats = self._search(cachePath=cachePath, partialSize='0')
+        self.assertEqual(stats.filesHashed, 0)
+        self.assertEqual(stats.bytesRead, 0)
+        self.assertTrue(stats.cacheHits > 0)
+
+    def testErrors(self):
+        """Unreadable files are counted as errors."""
+        liten = Liten(verbose=False)
+        liten.stats = ScanStats()
+        liten.createChecksum(join(self.tmp, 'missing'))
+        self.assertEqual(liten.stats.errors, 1)
+
+    def testJson(self):
+        """Stats written as JSON have every counter and stage."""
+        stats = self._search(jobs=2)
+        path = join(self.tmp, 'stats.json')
+        stats.write(path)
+        data = json.load(open(path))
+        self.assertEqual(sorted(data['stages']), sorted(ScanStats.STAGES))
+        for name in ScanStats.COUNTERS:
+            self.assertEqual(data[name], getattr(stats, name))
+        self.assertTrue(data['elapsed'] > 0)
+
+    def testVerboseSearchPreparesOnce(self):
+        """Banner of verbose search doesn't reset stats of the search."""
+        liten = Liten(spath=self.tree, fileSize='1bytes', reportPath=None)
+        prepared = []
+        prepare = liten._prepare
+        liten._prepare = lambda: prepared.append(1) or prepare()
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            liten.diskWalker()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(len(prepared), 1)
+        self.assertTrue('Searching for dups over 0 MB' in output)
+        self.assertEqual(liten.stats.filesScanned, 36)
+
+
+class TestProgressReporter(TreeTestCase):
+    """Tests for progress lines of ProgressReporter."""
+
+    def testLines(self):
+        """Reporter thread writes lines while search runs and a final one."""
+        stream = StringIO()
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=None, engine='grouped')
+        progress = ProgressReporter(liten, 0.001, stream)
+        progress.start()
+        liten.run()
+        progress.stop()
+        lines = stream.getvalue().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(lines[-1].startswith('36 files scanned, '))
+        self.assertTrue('ETA 0:00' in lines[-1])
+
+    def testNoEtaWhileTotalUnknown(self):
+        """Classic engine never knows bytes left to read."""
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=None)
+        liten.run()
+        line = ProgressReporter(liten).line()
+        self.assertTrue(line.startswith('36 files scanned, 28 hashed, '))
+        self.assertFalse('ETA' in line)
+
+
+class TestShards(TreeTestCase):
+    """Tests for --shard i/N searches and liten merge."""
+
+    def _shards(self, count):
+        """runs every shard in a process of its own, returns index paths"""
+        script = join(dirname(dirname(abspath(__file__))), 'liten.py')
+        processes = []
+        paths = []
+        for i in range(count):
+            path = join(self.tmp, 'shard%d.idx' % i)
+            processes.append(subprocess.Popen(
+                [sys.executable, script, '-q', '--size=1bytes',
+                 '--shard=%d/%d' % (i, count), '--index', path,
+                 '--report', join(self.tmp, 'report%d.csv' % i), self.tree]))
+            paths.append(path)
+        for process in processes:
+            self.assertEqual(process.wait(), 0)
+        return paths
+
+    def testShardsPartitionFiles(self):
+        """Every file is searched by exactly one shard."""
+        matched = []
+        for i in range(3):
+            liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                          reportPath=None, shard=(i, 3))
+            matched.extend(path for path, _, _ in liten._candidates(1))
+        self.assertEqual(sorted(matched),
+                         sorted(path for path, _, _ in walkFiles(self.tree)))
+
+    def testMergeSameAsSingleSearch(self):
+        """Merged shard indexes give the groups of one search, files unread."""
+        single = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                       reportPath=None, engine='grouped').run()
+        paths = self._shards(3)
+        shutil.rmtree(self.tree)
+        reportPath = join(self.tmp, 'merged.csv')
+        LitenController().run(['merge', '-q', '--report', reportPath] + paths)
+        hashName, merged = mergeShardIndexes(paths)
+        self.assertEqual(hashName, 'md5')
+        self.assertEqual(sorted((group.checksum, sorted(group.paths)) for group in merged),
+                         sorted((group.checksum, sorted(group.paths)) for group in single))
+        self.assertEqual(open(reportPath).read().count('.bin'), 12)
+
+    def testMergeCountsHardLinks(self):
+        """Merge counts hard links found by shards as one search does."""
+        os.link(join(self.tree, 'dir3', 'same100.bin'), join(self.tree, 'dir3', 'link.bin'))
+        os.link(join(self.tree, 'dir3', 'same20000.bin'), join(self.tmp, 'outside.bin'))
+        single = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                       reportPath=None, engine='grouped')
+        single.run()
+        merged = Liten(verbose=False, reportPath=None)
+        merged.mergeShards(self._shards(3))
+        self.assertEqual(merged.wastedBytes, single.wastedBytes)
+        self.assertEqual(sorted(sorted(paths) for paths in merged.hardlinkGroups()),
+                         sorted(sorted(paths) for paths in single.hardlinkGroups()))
+        self.assertEqual(len(merged.hardlinkGroups()), 1)
+
+    def testMissingShard(self):
+        """Merge refuses incomplete or repeated sets of shards."""
+        paths = self._shards(2)
+        self.assertRaises(ValueError, mergeShardIndexes, paths[:1])
+        self.assertRaises(ValueError, mergeShardIndexes, paths + paths[:1])
+
+
+class TestLitenCatalog(TreeTestCase):
+    """Tests for --catalog searches and LitenCatalog queries."""
+
+    def _search(self):
+        self.catalogPath = join(self.tmp, 'catalog.db')
+        return Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                     reportPath=None, catalogPath=self.catalogPath).run()
+
+    def _rows(self, catalog):
+        return catalog.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def testSameGroupsAsSearch(self):
+        """Catalog knows every file and the groups of the search."""
+        groups = self._search()
+        catalog = LitenCatalog(self.catalogPath)
+        self.assertEqual(self._rows(catalog), 36)
+        catalogued = catalog.duplicateGroups()
+        self.assertEqual(sorted((group.checksum, group.paths) for group in catalogued),
+                         sorted((group.checksum, group.paths) for group in groups))
+        #most wasted space first
+        self.assertEqual([group.size for group in catalogued], [30000, 20000, 100])
+        self.assertEqual([group.size for group in catalog.duplicateGroups(limit=1)],
+                         [30000])
+        catalog.close()
+
+    def testRescanAndSubtree(self):
+        """Search replaces rows of its tree, queries are limited to subtree."""
+        self._search()
+        dir0 = join(self.tree, 'dir0')
+        catalog = LitenCatalog(self.catalogPath)
+        self.assertEqual(catalog.duplicateGroups(under=dir0), [])
+        catalog.close()
+        shutil.copyfile(join(dir0, 'same100.bin'), join(dir0, 'copy.bin'))
+        shutil.rmtree(join(self.tree, 'dir3'))
+        self._search()
+        catalog = LitenCatalog(self.catalogPath)
+        self.assertEqual(self._rows(catalog), 28)
+        self.assertEqual([sorted(group.paths)
+                          for group in catalog.duplicateGroups(under=dir0)],
+                         [[join(dir0, 'copy.bin'), join(dir0, 'same100.bin')]])
+        catalog.close()
+
+    def testQueryCommand(self):
+        """liten query prints groups without reading the tree."""
+        self._search()
+        shutil.rmtree(self.tree)
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            LitenController().run(['query', '--top=2', self.catalogPath])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output.count('copies of'), 2)
+        self.assertEqual(output.count('same30000.bin'), 4)
+
+    def testByteComparisonRejected(self):
+        """--catalog needs checksums, --compare=bytes doesn't make them."""
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, LitenController().run,
+                              ['-q', '--compare=bytes', '--catalog', join(self.tmp, 'catalog.db'),
+                               self.tree])
+            self.assertTrue('--compare=bytes' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+
+class TestRateLimits(TreeTestCase):
+    """Tests for --max-read-rate, --max-iops and --page-cache=drop."""
+
+    def _search(self, **kwargs):
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=None, engine='grouped', **kwargs)
+        groups = liten.run()
+        return sorted(sorted(group.paths) for group in groups), liten.stats
+
+    def testReadRate(self):
+        """Reads beyond burst wait for the bucket, and the wait is counted."""
+        expected, _ = self._search()
+        groups, stats = self._search(maxReadRate='500KB')
+        self.assertEqual(groups, expected)
+        limit = (stats.bytesRead - 500 * 1024) / (500 * 1024.0)
+        self.assertTrue(stats.readThrottleSeconds >= limit * 0.9,
+                        (stats.readThrottleSeconds, limit))
+        self.assertTrue(stats.elapsed >= limit * 0.9)
+        self.assertEqual(stats.metadataThrottleSeconds, 0)
+
+    def testMetadataRate(self):
+        """Listings and stats are limited too, with either walk."""
+        for concurrency in (0, 4):
+            groups, stats = self._search(maxMetadataRate=30, concurrency=concurrency)
+            self.assertEqual(len(groups), 3)
+            self.assertTrue(stats.metadataThrottleSeconds > 0.2, stats.asDict())
+
+    def testDropPageCache(self):
+        """Every file read is advised sequential and dropped from cache."""
+        calls = []
+        fadvise = litenModule.posix_fadvise
+        litenModule.posix_fadvise = lambda fd, offset, length, advice: \
+            calls.append(advice)
+        try:
+            expected, _ = self._search(partialSize='0')
+            self.assertEqual(calls, [])
+            groups, stats = self._search(pageCache='drop', partialSize='0')
+        finally:
+            litenModule.posix_fadvise = fadvise
+        self.assertEqual(groups, expected)
+        self.assertEqual(calls.count(litenModule.POSIX_FADV_SEQUENTIAL),
+                         stats.filesHashed)
+        self.assertTrue(calls.count(litenModule.POSIX_FADV_DONTNEED) > stats.filesHashed)
+
+
+    def testThrottledEstimate(self):
+        """--estimate reads and walks within --max-read-rate and --max-iops."""
+        statsPath = join(self.tmp, 'stats.json')
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertRaises(SystemExit, LitenController().run,
+                              ['-q', '--estimate', '--size=1bytes', '--partial-size=0',
+                               '--max-read-rate=400KB', '--max-iops=20',
+                               '--stats-json', statsPath, self.tree])
+        finally:
+            sys.stdout = stdout
+        stats = json.load(open(statsPath))
+        limit = (stats['bytesRead'] - 400 * 1024) / (400 * 1024.0)
+        self.assertTrue(stats['readThrottleSeconds'] >= limit * 0.9, stats)
+        self.assertTrue(stats['metadataThrottleSeconds'] > 0, stats)
+
+
+class TestReadScheduler(TreeTestCase):
+    """Tests for --read-order of grouped engine."""
+
+    def _records(self):
+        records = []
+        for index, (path, name, st) in enumerate(walkFiles(self.tree)):
+            record = FileRecord(dirname(path), name, st)
+            record.index = index
+            records.append(record)
+        return records
+
+    def testOrders(self):
+        """Every order is a permutation sorted by its key."""
+        records = self._records()
+        self.assertEqual(ReadScheduler('walk').schedule(records), range(len(records)))
+        inodes = [records[i].st_ino for i in ReadScheduler('inode').schedule(records)]
+        self.assertEqual(inodes, sorted(inodes))
+        scheduler = ReadScheduler('physical')
+        order = scheduler.schedule(records)
+        self.assertEqual(sorted(order), range(len(records)))
+        offsets = [scheduler.physicalOffset(records[i].path) for i in order]
+        known = [offset for offset in offsets if offset is not None]
+        self.assertEqual(known, sorted(known))
+        self.assertEqual(offsets[:len(known)], known)
+        self.assertRaises(ValueError, ReadScheduler, 'random')
+
+    def testUnknownOffsetLast(self):
+        """Files with extents not allocated yet come after placed ones."""
+        records = self._records()
+        delalloc = records[0].st_ino
+        offsets = dict((record.st_ino, 4096 * (len(records) - i))
+                       for i, record in enumerate(records))
+
+        class FakeFcntl(object):
+            @staticmethod
+            def ioctl(fd, request, arg):
+                inode = os.fstat(fd).st_ino
+                flags = litenModule.FIEMAP_EXTENT_UNKNOWN | \
+                    litenModule.FIEMAP_EXTENT_DELALLOC if inode == delalloc else 0
+                return arg[:20] + struct.pack('=I', 1) + arg[24:40] + \
+                    struct.pack('=QQ', 0 if inode == delalloc else offsets[inode], 0) + \
+                    arg[56:72] + struct.pack('=I', flags) + arg[76:]
+
+        fcntl = litenModule.fcntl
+        litenModule.fcntl = FakeFcntl
+        try:
+            scheduler = ReadScheduler('physical')
+            self.assertEqual(scheduler.physicalOffset(records[0].path), None)
+            order = scheduler.schedule(records)
+        finally:
+            litenModule.fcntl = fcntl
+        self.assertEqual(order, range(len(records))[:0:-1] + [0])
+
+    def testSameGroups(self):
+        """Read order changes nothing but the order of reads."""
+        results = []
+        for order in ReadScheduler.ORDERS:
+            liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                          reportPath=None, readOrder=order, compare='bytes')
+            results.append([(group.checksum, group.paths) for group in liten.run()])
+        self.assertEqual(results[1:], results[:1] * 2)
+
+    def testEstimateOrder(self):
+        """--estimate reads its sample in --read-order."""
+        orders = []
+        schedule = ReadScheduler.schedule
+        ReadScheduler.schedule = lambda scheduler, records: \
+            orders.append(scheduler.order) or schedule(scheduler, records)
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            for order in ('walk', 'physical'):
+                self.assertRaises(SystemExit, LitenController().run,
+                                  ['-q', '--estimate', '--size=1bytes',
+                                   '--read-order=%s' % order, self.tree])
+                self.assertEqual(set(orders), set([order]))
+                del orders[:]
+        finally:
+            sys.stdout = stdout
+            ReadScheduler.schedule = schedule
+
+
+class TestCheckpoint(TreeTestCase):
+    """Tests for --checkpoint journal and --resume."""
+
+    def _liten(self, **kwargs):
+        self.journal = join(self.tmp, 'search.journal')
+        return Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                     reportPath=None, checkpointPath=self.journal,
+                     checkpointInterval=0, **kwargs)
+
+    def _matches(self, liten):
+        return sorted((match.original, match.path) for match in liten.iterDuplicates())
+
+    def testResume(self):
+        """Resumed search finds the same, reading only what was left."""
+        fresh = self._liten()
+        expected = self._matches(fresh)
+        self.assertFalse(os.path.exists(self.journal))
+
+        killed = self._liten()
+        matches = killed.iterDuplicates()
+        for _ in range(4):
+            next(matches)
+        matches.close()
+        #record torn by the kill
+        open(self.journal, 'ab').write('C\t%s' % join(self.tree, 'dir3'))
+        resumed = self._liten(resume=True)
+        self.assertEqual(self._matches(resumed), expected)
+        self.assertFalse(os.path.exists(self.journal))
+        self.assertEqual(killed.stats.bytesRead + resumed.stats.bytesRead,
+                         fresh.stats.bytesRead)
+        self.assertEqual(killed.stats.dirsScanned + resumed.stats.dirsScanned, 5)
+
+    def testListingCutShort(self):
+        """Listing killed before its end is dropped, across two resumes."""
+        expected = self._matches(self._liten())
+        #first run is killed while it lists dir0, before its directory record
+        liten = self._liten()
+        journal = ScanJournal(self.journal, liten._searchParams())
+        journal.scanDir(join(self.tree, 'dir0'))
+        journal.close()
+        data = open(self.journal, 'rb').read()
+        open(self.journal, 'wb').write(data[:data.rindex('D\t')])
+        #second run is killed after it listed dir1
+        journal = ScanJournal(self.journal, liten._searchParams(), resume=True)
+        journal.scanDir(join(self.tree, 'dir1'))
+        journal.close()
+        matches = self._matches(self._liten(resume=True))
+        self.assertEqual(matches, expected)
+        self.assertFalse([match for match in matches if match[0] == match[1]])
+
+    def testOtherSearchRefused(self):
+        """Journal of a search with other options is not resumed."""
+        matches = self._liten().iterDuplicates()
+        next(matches)
+        matches.close()
+        liten = self._liten(resume=True)
+        liten.fileSize = '20KB'
+        self.assertRaises(ValueError, liten.findDuplicateGroups)
+
+
+class TestBlockDedup(TempDirTestCase):
+    """Tests for --block-dedup analysis with content defined chunks."""
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        rng = random.Random(3)
+        data = ''.join(chr(rng.randrange(256)) for _ in range(300000))
+        other = ''.join(chr(rng.randrange(256)) for _ in range(100000))
+        self.size = len(data)
+        for name, content in (('original', data),
+                              ('edited', data[:100000] + 'inserted' + data[100000:]),
+                              ('other', other)):
+            os.makedirs(join(self.tmp, name))
+            f = open(join(self.tmp, name, 'disk.img'), 'wb')
+            f.write(content)
+            f.close()
+
+    def _analyse(self, processes, spanSize=16777216, **kwargs):
+        liten = Liten(spath=self.tmp, fileSize='1bytes', verbose=False,
+                      reportPath=None, **kwargs)
+        analysis = BlockDedupAnalysis(liten, processes, spanSize=spanSize)
+        results = analysis.run()
+        self.stats = liten.stats
+        return dict((os.path.basename(result.directory), result)
+                    for result in results), analysis.totals
+
+    def testInsertionKeepsChunks(self):
+        """Chunks after an insertion are found again, unlike whole file hash."""
+        results, (chunks, stored, total) = self._analyse(1)
+        #edited is walked after original, or the other way round
+        shared = results['original'].saved + results['edited'].saved
+        self.assertTrue(shared > self.size * 0.9, shared)
+        self.assertEqual(results['other'].saved, 0)
+        self.assertEqual(total, self.size * 2 + 8 + 100000)
+        self.assertEqual(total - stored, shared)
+
+    def testSameWithProcesses(self):
+        """Pool of processes gives the numbers of one process."""
+        self.assertEqual(self._analyse(3, spanSize=65536),
+                         self._analyse(1, spanSize=65536))
+
+    def testReadLimits(self):
+        """Workers share read rate and drop pages they read from cache."""
+        expected = self._analyse(1, spanSize=65536)
+        calls = []
+        fadvise = litenModule.posix_fadvise
+        litenModule.posix_fadvise = lambda fd, offset, length, advice: \
+            calls.append(advice)
+        try:
+            for processes in (1, 2):
+                start = time.time()
+                self.assertEqual(self._analyse(processes, spanSize=65536,
+                                               maxReadRate='500KB', pageCache='drop')[1],
+                                 expected[1])
+                limit = (self.stats.bytesRead - 500 * 1024) / (500 * 1024.0)
+                self.assertTrue(time.time() - start >= limit * 0.9)
+                self.assertTrue(self.stats.readThrottleSeconds > 0)
+        finally:
+            litenModule.posix_fadvise = fadvise
+        #pages of the single process run, those of workers are not seen here
+        self.assertTrue(calls.count(litenModule.POSIX_FADV_DONTNEED) >= 3)
+
+    @unittest.skipUnless(litenModule.numpy, "numpy is not installed")
+    def testVectorChunksSameAsLoop(self):
+        """Chunks found with numpy are those of the loop over bytes."""
+        data = open(join(self.tmp, 'edited', 'disk.img'), 'rb').read()
+        for sizes in ((2048, 8192, 65536), (64, 256, 2048)):
+            vector = litenModule.cdcChunks(data, *sizes)
+            self.assertEqual(litenModule._cdcChunksVector(data, *sizes), vector)
+            numpy = litenModule.numpy
+            litenModule.numpy = None
+            try:
+                self.assertEqual(litenModule.cdcChunks(data, *sizes), vector)
+            finally:
+                litenModule.numpy = numpy
+
+    @unittest.skipUnless(litenModule.numpy, "numpy is not installed")
+    def testVectorChunksSameBelowWindow(self):
+        """Chunks are the same where minSize is shorter than hash window."""
+        rng = random.Random(5)
+        numpy = litenModule.numpy
+        for _ in range(50):
+            data = ''.join(chr(rng.randrange(256)) for _ in range(400))
+            vector = litenModule._cdcChunksVector(data, 16, 64, 512)
+            litenModule.numpy = None
+            try:
+                self.assertEqual(litenModule.cdcChunks(data, 16, 64, 512), vector)
+            finally:
+                litenModule.numpy = numpy
+
+    def testChunkIndexBatch(self):
+        """Repeated chunks within one batch and across batches are saved."""
+        index = litenModule.ChunkIndex(join(self.tmp, 'chunks.db'))
+        chunks = [(str(n % 700), 10) for n in range(1000)]
+        self.assertEqual(index.add(chunks), 300 * 10)
+        self.assertEqual(index.add(chunks[:600]), 600 * 10)
+        self.assertEqual(index.totals(), (700, 7000, 16000))
+        index.close()
+
+
+class SlowOps(FileSystemOps):
+    """FileSystemOps with latency of a network filesystem."""
+
+    lock = threading.Lock()
+    inFlight = 0
+    maxInFlight = 0
+
+    @classmethod
+    def _slow(cls, call, path):
+        with cls.lock:
+            cls.inFlight += 1
+            cls.maxInFlight = max(cls.maxInFlight, cls.inFlight)
+        try:
+            time.sleep(0.002)
+            return call(path)
+        finally:
+            with cls.lock:
+                cls.inFlight -= 1
+
+    listdir = classmethod(lambda cls, path: cls._slow(os.listdir, path))
+    lstat = classmethod(lambda cls, path: cls._slow(os.lstat, path))
+    stat = classmethod(lambda cls, path: cls._slow(os.stat, path))
+
+
+class TestPipelinedWalk(TestParallelHashing):
+    """Tests for pipelinedWalk() and --concurrency."""
+
+    def setUp(self):
+        TreeTestCase.setUp(self)
+        nested = join(self.tree, 'dir1', 'a', 'b')
+        os.makedirs(nested)
+        shutil.copy(join(self.tree, 'dir0', 'same100.bin'), nested)
+        os.symlink(join(self.tree, 'dir2', 'head100.bin'), join(nested, 'link.bin'))
+        os.symlink(join(self.tree, 'dir3'), join(self.tree, 'dir1', 'a', 'dirlink'))
+        SlowOps.maxInFlight = 0
+
+    def _walk(self, jobs, **kwargs):
+        return TestParallelHashing._walk(self, jobs, concurrency=16,
+                                         fsOps=SlowOps, **kwargs)
+
+    def testSameOrderAsSerial(self):
+        """Files and stat results come in order of walkFiles()."""
+        serial = [(path, st.st_size) for path, _, st in walkFiles(self.tree)]
+        pipelined = [(path, st.st_size) for path, _, st in
+                     pipelinedWalk(self.tree, 16, ops=SlowOps)]
+        self.assertEqual(pipelined, serial)
+        self.assertTrue(SlowOps.maxInFlight > 4)
+
+    def testScansAheadAreBounded(self):
+        """Workers list only a few directories ahead of the consumer."""
+        wide = join(self.tmp, 'wide')
+        for n in range(100):
+            os.makedirs(join(wide, 'dir%03d' % n))
+            open(join(wide, 'dir%03d' % n, 'file'), 'wb').close()
+        listed = []
+        class CountingOps(FileSystemOps):
+            listdir = staticmethod(lambda path: listed.append(path) or os.listdir(path))
+        walk = pipelinedWalk(wide, 2, ops=CountingOps, ahead=4)
+        next(walk)
+        time.sleep(0.1)
+        self.assertTrue(len(listed) <= 6, len(listed))
+        self.assertEqual(len(list(walk)), 99)
+        self.assertEqual(len(listed), 101)
+
+    def testSameResultsAsSerial(self):
+        """Slow metadata and reads in flight find what serial walk finds."""
+        serial = TestParallelHashing._walk(self, 1)
+        self.assertEqual(self._walk(1), serial)
+
+    def testStatsCounted(self):
+        """Directories scanned by pipeline threads are counted."""
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=None, concurrency=8)
+        liten.run()
+        self.assertEqual(liten.jobs, 8)
+        self.assertEqual(liten.stats.dirsScanned, 7)
+        self.assertEqual(liten.recordCount, 38)
+
+
+class TestPathFilter(TreeTestCase):
+    """Tests for include and exclude patterns of PathFilter."""
+
+    def testPatterns(self):
+        """Globs match names or paths, regexes are searched in paths."""
+        pathFilter = PathFilter(include=['same*', '*/dir1/*.bin', 're:head[0-9]+00'],
+                                exclude=['*30000*'])
+        self.assertTrue(pathFilter.matchFile('/x/dir0/same100.bin'))
+        self.assertTrue(pathFilter.matchFile('/x/dir1/mid100.bin'))
+        self.assertTrue(pathFilter.matchFile('/x/dir2/head200.bin'))
+        self.assertFalse(pathFilter.matchFile('/x/dir2/mid100.bin'))
+        self.assertFalse(pathFilter.matchFile('/x/dir0/same30000.bin'))
+        self.assertTrue(PathFilter().matchFile('/x/anything'))
+        self.assertTrue(PathFilter().matchDir('/x/.git'))
+
+    def testPrunedDirectoriesNotRead(self):
+        """Excluded directories are not walked into by any walker."""
+        os.makedirs(join(self.tree, 'dir0', '.git', 'objects'))
+        pathFilter = PathFilter(excludeDirs=['dir1', 're:/\\.git$'])
+        expected = sorted(path for path, _, _ in walkFiles(self.tree)
+                          if '/dir1/' not in path)
+        for walk in (lambda stats: walkFiles(self.tree, 1, stats, pathFilter),
+                     lambda stats: walkFiles(self.tree, 3, stats, pathFilter),
+                     lambda stats: pipelinedWalk(self.tree, 4, stats,
+                                                 pathFilter=pathFilter)):
+            stats = ScanStats()
+            self.assertEqual(sorted(path for path, _, _ in walk(stats)), expected)
+            self.assertEqual(stats.dirsScanned, 4)
+
+    def testSearch(self):
+        """Liten searches only files included and not excluded."""
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=None, pattern='*.bin', include=['*.txt'],
+                      exclude=['head*'], excludeDirs=['dir3'])
+        dupes = liten.diskWalker()
+        self.assertEqual(liten.recordCount, 27)
+        self.assertEqual(sorted(set(os.path.basename(path) for path in dupes)),
+                         ['same100.bin', 'same20000.bin', 'same30000.bin'])
+        self.assertEqual(liten.stats.filesMatched, 18)
+
+    def testConfig(self):
+        """Config file has the same filter options."""
+        path = join(self.tmp, 'config.ini')
+        f = open(path, 'w')
+        f.write("[Options]\npath=/tmp\nsize=1MB\npattern=*\n"
+                "exclude-dir=.git\n    node_modules\nexclude=re:\\.tmp$\n")
+        f.close()
+        self.assertEqual(ProcessConfig(path).readFilters(),
+                         {'include': [], 'exclude': ['re:\\.tmp$'],
+                          'excludeDirs': ['.git', 'node_modules']})
+
+
+class RecordingActions(ActionsMixin):
+    """Records paths it is asked to remove."""
+
+    def __init__(self):
+        self.removed = []
+
+    def remove(self, filep, interactive=False, dryrun=False):
+        self.removed.append(filep)
+
+
+class TestActionsQueued(TreeTestCase):
+    """Tests for deferred actions of ActionsQueued."""
+
+    def _search(self, handler, engine='classic'):
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                      reportPath=None, handler=handler, engine=engine)
+        liten.run()
+        return liten
+
+    def testDeferredUntilFlush(self):
+        """Nothing is removed while search runs, all of it on flush()."""
+        recorder = RecordingActions()
+        queued = ActionsQueued(recorder, verbose=False)
+        queued.flush = lambda: None
+        self._search(queued)
+        self.assertEqual(recorder.removed, [])
+        self.assertEqual(queued.summary['queued'], 9)
+        ActionsQueued.flush(queued)
+        self.assertEqual(len(recorder.removed), 9)
+        self.assertEqual(queued.summary['done'], 9)
+
+    def testSameAsImmediate(self):
+        """Queued actions remove what immediate ones do."""
+        for engine in ('classic', 'grouped'):
+            immediate = RecordingActions()
+            self._search(immediate, engine)
+            recorder = RecordingActions()
+            self._search(ActionsQueued(recorder, batchSize=2, jobs=3,
+                                       background=True, verbose=False), engine)
+            self.assertEqual(sorted(recorder.removed), sorted(immediate.removed))
+
+    def testChangedFilesSkipped(self):
+        """Files changed or gone since search are left alone."""
+        recorder = RecordingActions()
+        queued = ActionsQueued(recorder, verbose=False)
+        paths = [join(self.tree, 'dir%d' % n, 'same100.bin') for n in range(3)]
+        for path in paths:
+            queued.schedule(path, os.stat(path))
+        f = open(paths[0], 'ab')
+        f.write('more')
+        f.close()
+        os.remove(paths[1])
+        summary = queued.flush()
+        self.assertEqual(recorder.removed, paths[2:])
+        self.assertEqual((summary['done'], summary['changed'], summary['missing']),
+                         (1, 1, 1))
+
+    def testChangedOriginalsSkipped(self):
+        """Duplicates are kept when original changed or is gone."""
+        recorder = RecordingActions()
+        queued = ActionsQueued(recorder, jobs=2, verbose=False)
+        queued.flush = lambda: None
+        originals = sorted(group.paths[0] for group in
+                           self._search(queued, 'grouped').findDuplicateGroups())
+        os.remove(originals[0])
+        os.remove(originals[1])
+        f = open(originals[2], 'ab')
+        f.write('more')
+        f.close()
+        summary = ActionsQueued.flush(queued)
+        self.assertEqual(recorder.removed, [])
+        self.assertEqual((summary['done'], summary['original']), (0, 9))
+
+    def testDryRun(self):
+        """Dry run removes nothing and sums what it would remove."""
+        recorder = RecordingActions()
+        queued = ActionsQueued(recorder, dryrun=True, verbose=False)
+        queued.printSummary = lambda: None
+        self._search(queued)
+        self.assertEqual(recorder.removed, [])
+        self.assertEqual(queued.summary['done'], 9)
+        self.assertEqual(queued.summary['bytes'], 3 * (100 + 20000 + 30000))
+
+    def testDeleteOption(self):
+        """--delete removes duplicates after search."""
+        LitenController().run(['-q', '--delete', '--size=1bytes', '--action-jobs=2',
+                               '--report', join(self.tmp, 'report.csv'), self.tree])
+        self.assertEqual(len(list(walkFiles(self.tree))), 27)
+
+
+def _inotifyAvailable():
+    """tells if LitenWatcher can use inotify here"""
+    try:
+        litenModule.Inotify().close()
+    except OSError:
+        return False
+    return True
+
+
+class TestLitenWatcher(TreeTestCase):
+    """Tests for live duplicate index of LitenWatcher."""
+
+    def _watcher(self, poll=True):
+        liten = Liten(spath=self.tree, fileSize='1bytes', verbose=False, reportPath=None)
+        self.matches = []
+        watcher = LitenWatcher(liten, self.matches.append, poll=poll)
+        groups = watcher.scan()
+        self.spyChecksums(liten)
+        return liten, watcher, groups
+
+    def _copy(self, source, target):
+        shutil.copy(join(self.tree, source), join(self.tree, target))
+        return join(self.tree, target)
+
+    def testScan(self):
+        """Full scan finds the groups of a search."""
+        liten, watcher, groups = self._watcher()
+        single = Liten(spath=self.tree, fileSize='1bytes', verbose=False,
+                       reportPath=None, engine='grouped').run()
+        self.assertEqual(sorted(sorted(group.paths) for group in groups),
+                         sorted(sorted(group.paths) for group in single))
+        self.assertEqual(len(watcher.files), 36)
+
+    def testPolling(self):
+        """Polling hashes changed files only and reports new duplicates."""
+        liten, watcher, _ = self._watcher()
+        self.assertTrue(watcher.polling)
+        path = self._copy('dir0/same20000.bin', 'dir1/upload.bin')
+        unique = join(self.tree, 'dir1', 'unique.bin')
+        open(unique, 'wb').write('u' * 12345)
+        matches = watcher.poll(0)
+        self.assertEqual([(match.path, match.original) for match in matches],
+                         [(path, join(self.tree, 'dir0', 'same20000.bin'))])
+        self.assertEqual(self.matches, matches)
+        self.assertEqual(liten.hashed, [path])
+
+        os.remove(path)
+        f = open(unique, 'ab')
+        f.write('u')
+        f.close()
+        self.assertEqual(watcher.poll(0), [])
+        self.assertFalse(path in watcher.files)
+        self.assertEqual(watcher.files[unique].st_size, 12346)
+        self.assertEqual(liten.hashed, [path])
+
+    def testFallbackToPolling(self):
+        """Watcher polls where inotify isn't available."""
+        def unavailable():
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        Inotify = litenModule.Inotify
+        litenModule.Inotify = unavailable
+        try:
+            liten, watcher, _ = self._watcher(poll=False)
+        finally:
+            litenModule.Inotify = Inotify
+        self.assertTrue(watcher.polling)
+        path = self._copy('dir3/mid100.bin', 'dir0/upload.bin')
+        self.assertEqual([match.path for match in watcher.poll(0)], [path])
+        self.assertEqual(liten.hashed, [path])
+
+    @unittest.skipUnless(_inotifyAvailable(), "inotify is not available")
+    def testInotify(self):
+        """Inotify reports uploads and new directories within seconds."""
+        liten, watcher, _ = self._watcher(poll=False)
+        self.assertFalse(watcher.polling)
+        try:
+            os.makedirs(join(self.tree, 'new', 'deeper'))
+            time.sleep(0.1)
+            path = self._copy('dir2/same30000.bin', 'new/deeper/upload.bin')
+            matches = []
+            deadline = time.time() + 5
+            while not matches and time.time() < deadline:
+                matches = watcher.poll(0.2)
+            self.assertEqual([match.path for match in matches], [path])
+            self.assertEqual(liten.hashed, [path])
+            shutil.rmtree(join(self.tree, 'new'))
+            for _ in range(5):
+                watcher.poll(0.2)
+            self.assertFalse(path in watcher.files)
+        finally:
+            watcher.close()
+
+
+class TestBenchTree(TempDirTestCase):
+    """Tests for synthetic tree of bench_liten.py."""
+
+    def _tree(self, name, **kwargs):
+        root = join(self.tmp, name)
+        counts = bench_liten.generateTree(root, files=60, meanSize=5000, **kwargs)
+        contents = {}
+        for path, _, _ in walkFiles(root):
+            contents[os.path.relpath(path, root)] = open(path, 'rb').read()
+        return counts, contents
+
+    def testReproducible(self):
+        """Same seed gives the same tree, other seed does not."""
+        self.assertEqual(self._tree('one'), self._tree('two'))
+        self.assertNotEqual(self._tree('three', seed=1)[1], self._tree('one')[1])
+
+    def testDuplicatesFound(self):
+        """Liten finds every generated duplicate and no near miss."""
+        counts, contents = self._tree('tree', dupRatio=0.3, nearMissRatio=0.3)
+        self.assertTrue(counts['duplicates'] and counts['nearMisses'])
+        self.assertEqual(counts['files'], 60)
+        unique = len(set(contents.values()))
+        self.assertEqual(unique, 60 - counts['duplicates'])
+        liten = Liten(spath=join(self.tmp, 'tree'), fileSize='1bytes', verbose=False,
+                      reportPath=os.devnull)
+        self.assertEqual(len(list(liten.iterDuplicates())), counts['duplicates'])
+
+
+class TestEstimate(TempDirTestCase):
+    """Tests for --estimate sampling of size groups."""
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.counts = bench_liten.generateTree(self.tmp, files=400, meanSize=8000,
+                                               dupRatio=0.3, nearMissRatio=0.2)
+
+    def _liten(self):
+        return Liten(spath=self.tmp, fileSize='1bytes', verbose=False, reportPath=None)
+
+    def testWholeSampleIsExact(self):
+        """Sample of all groups measures exactly what search finds."""
+        search = self._liten()
+        search.groupWalker()
+        estimate = self._liten().estimateWaste(sampleSize=10000)
+        self.assertEqual(estimate.measured, estimate.groups)
+        self.assertEqual((estimate.wasted, estimate.low, estimate.high),
+                         (search.wastedBytes,) * 3)
+
+    def testSample(self):
+        """Small sample reads less and its interval holds the exact value."""
+        search = self._liten()
+        search.groupWalker()
+        liten = self._liten()
+        estimate = liten.estimateWaste(sampleSize=40, seed=1)
+        self.assertTrue(estimate.measured < estimate.groups)
+        self.assertTrue(estimate.low <= search.wastedBytes <= estimate.high,
+                        (estimate, search.wastedBytes))
+        self.assertTrue(estimate.high <= estimate.potential)
+        self.assertTrue(liten.stats.bytesRead < search.stats.bytesRead)
+        self.assertEqual(liten.estimateWaste(sampleSize=40, seed=1), estimate)
+
+
 if __name__ == '__main__':
     # add liten package path to PYTHONPATH
     import sys